@@ -1,13 +1,20 @@
 # check_spot.py
-import os, json, yaml, requests, numpy as np, cv2
+import os, json, argparse, numpy as np, cv2
 from datetime import datetime
-from shapely.geometry import box as shp_box
-from ultralytics import YOLO
 
-CONFIG = "config.yaml"
+import settings
+from archive import Archive
+from capture import read_snapshot
+from detector import load_detector
+from frames import decode as decode_jpeg, reduction, rotate
+from gating import ChangeGate
+from homography import MappedSpaces
+from occupancy import SpotSet
+from pipeline import Pipeline, Stage
+from smoothing import SpotTracker
+from tiling import Tiler
 
-with open(CONFIG, "r", encoding="utf-8") as f:
-    cfg = yaml.safe_load(f)
+cfg = settings.load()
 
 URL  = cfg.get("camera", {}).get("snapshot_url")
 FILE = cfg.get("camera", {}).get("snapshot_file")
@@ -16,71 +23,261 @@ ROT  = cfg.get("output", {}).get("rotate")
 DRAW = bool(cfg.get("output", {}).get("draw_overlay", True))
 
 spot = cfg.get("spot", {}).get("box")
-if not spot:
-    raise SystemExit("No spot.box in config.yaml. Run define_spot.py first.")
+if not spot and not cfg.get("spots") and not cfg.get("calibration"):
+    raise SystemExit("No spot.box, spots or calibration in config.yaml. Run define_spot.py first.")
 
-model = YOLO(cfg.get("model", {}).get("weights", "yolov8n.pt"))
-conf  = float(cfg.get("model", {}).get("conf", 0.35))
+# map spaces projected into the image (calibration:); their verdicts go
+# straight into the lot pack the map serves
+MAPPED = MappedSpaces.from_config(cfg)
 
-os.makedirs(OUT, exist_ok=True)
+GATE_STATE = os.path.join(OUT, "gate_state.npz")
+TRACKER_STATE = os.path.join(OUT, "tracker.json")
 
-def rotate(img):
-    if ROT == "cw90":  return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-    if ROT == "ccw90": return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-    if ROT == "180":  return cv2.rotate(img, cv2.ROTATE_180)
-    return img
+def use_spots(spots):
+    """Score `spots` from now on, with a gate, tracker and tiles built for them."""
+    global SPOTS, GATE, TRACKER, TILER, REDUCED
+    # all configured spots, rasterized once; scored together in evaluate_spots()
+    SPOTS = spots
+    # skip inference when no spot crop changed since the last run (spot.ssim_threshold)
+    GATE = ChangeGate.from_config(cfg, SPOTS) if "ssim_threshold" in cfg.get("spot", {}) else None
+    # per-spot hysteresis across runs, if a smoothing: section is configured
+    TRACKER = SpotTracker.from_config(cfg, SPOTS) if "smoothing" in cfg else None
+    # detect on tiles over the spot regions only (model.tiling)
+    TILER = Tiler.from_config(cfg, SPOTS)
+    # decode at 1/2..1/8 size when the model would downscale anyway; tiles
+    # need native pixels, so not with tiling
+    REDUCED = bool(cfg.get("camera", {}).get("reduced_decode", False)) and TILER is None
 
-def grab():
+use_spots(MAPPED.spots if MAPPED else SpotSet.from_config(cfg))
+
+# results and overlays go to hourly segments instead of loose files (archive:)
+ARCHIVE = Archive.from_config(cfg)
+CAMERA_ID = str(cfg.get("camera", {}).get("id", "default"))
+
+# torch, onnx or openvino, per model.backend; loaded on first use, so a run
+# the change gate answers never imports the model at all
+detector = None
+IMGSZ = int(cfg.get("model", {}).get("imgsz", 640))
+
+def model():
+    global detector
+    if detector is None:
+        detector = load_detector(cfg)
+    return detector
+
+os.makedirs(OUT, exist_ok=True)
+
+def fetch(_tick=None):
+    """Raw snapshot bytes from the configured file or URL."""
     if FILE and os.path.exists(FILE):
-        img = cv2.imread(FILE)
-    elif URL:
-        r = requests.get(URL, timeout=8)
-        img = cv2.imdecode(np.frombuffer(r.content, np.uint8), cv2.IMREAD_COLOR)
-    else:
-        raise SystemExit("Set camera.snapshot_file or camera.snapshot_url in config.yaml.")
+        return read_snapshot(file=FILE)
+    if URL:
+        return read_snapshot(URL)
+    raise SystemExit("Set camera.snapshot_file or camera.snapshot_url in config.yaml.")
+
+def decode(content):
+    """(image, scale): scale is full-frame pixels per decoded pixel, > 1 with
+    camera.reduced_decode when the detector would downscale anyway."""
+    scale = reduction(content, IMGSZ) if REDUCED else 1
+    img = decode_jpeg(content, scale)
     if img is None:
-        raise SystemExit("Snapshot decode failed.")
-    return rotate(img)
+        raise RuntimeError("Snapshot decode failed.")
+    return rotate(img, ROT), scale
 
-def evaluate(frame):
+def grab():
+    try:
+        return decode(fetch())
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+
+def evaluate(frame, scale=1):
     # vehicle classes: car(2), motorcycle(3), bus(5), truck(7)
-    res = model.predict(frame, conf=conf, classes=[2,3,5,7], verbose=False)[0]
-    dets = []
-    if res.boxes is not None:
-        for x1,y1,x2,y2 in res.boxes.xyxy.cpu().numpy()[:, :4]:
-            dets.append(shp_box(float(x1), float(y1), float(x2), float(y2)))
+    from shapely.geometry import box as shp_box
+    xyxy, _ = model().predict([frame])[0]
+    xyxy = xyxy * scale
+    dets = [shp_box(float(x1), float(y1), float(x2), float(y2)) for x1,y1,x2,y2 in xyxy]
 
     sx, sy, sw, sh = spot["x"], spot["y"], spot["w"], spot["h"]
     sbox = shp_box(sx, sy, sx+sw, sy+sh)
 
     thr = float(cfg["spot"].get("overlap_threshold", 0.12))
-    occupied = any(sbox.intersection(d).area / sbox.area > thr for d in dets)
-    return occupied, dets, sbox
+    score = max((sbox.intersection(d).area / sbox.area for d in dets), default=0.0)
+    return score > thr, score, dets, sbox
+
+def detect(frame, scale=1):
+    """Run the detector on the frame; return (xyxy, conf) arrays for vehicles,
+    in full-frame pixels."""
+    if TILER:
+        # all tiles in one batch, each at native resolution
+        return TILER.merge(model().predict(TILER.crops(frame), imgsz=TILER.tile))
+    xyxy, scores = model().predict([frame])[0]
+    return xyxy * scale, scores
 
-def draw_overlay(frame, occupied, dets, sbox):
+def evaluate_spots(frame, scale=1):
+    # one inference for the whole frame, then every spot vs every box in one pass
+    xyxy, scores = detect(frame, scale)
+    occupied, score, confidence = SPOTS.occupancy(xyxy, scores)
+    return SPOTS.results(occupied, score, confidence), xyxy
+
+def draw_overlay(frame, occupied, dets, sbox, scale=1):
     # draw detections
     for d in dets:
-        x1,y1,x2,y2 = map(int, d.bounds)
+        x1,y1,x2,y2 = (int(v / scale) for v in d.bounds)
         cv2.rectangle(frame, (x1,y1), (x2,y2), (200,200,0), 1)
     # draw spot
-    sx, sy, sw, sh = spot["x"], spot["y"], spot["w"], spot["h"]
+    sx, sy, sw, sh = (int(spot[k] / scale) for k in ("x", "y", "w", "h"))
     color = (0,0,255) if occupied else (0,200,0)
     cv2.rectangle(frame, (sx,sy), (sx+sw, sy+sh), color, 2)
     cv2.putText(frame, "occupied" if occupied else "free", (sx, sy-6),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2, cv2.LINE_AA)
     return frame
 
-if __name__ == "__main__":
-    img = grab()
-    occ, dets, sbox = evaluate(img)
+def draw_spots(frame, results, xyxy, scale=1):
+    for x1,y1,x2,y2 in (xyxy / scale).astype(int):
+        cv2.rectangle(frame, (x1,y1), (x2,y2), (200,200,0), 1)
+    for poly, r in zip(SPOTS.polygons, results):
+        color = (0,0,255) if r["occupied"] else (0,200,0)
+        pts = (poly / scale).round().astype(np.int32)
+        cv2.polylines(frame, [pts], True, color, 2)
+        x, y = pts.min(0)
+        cv2.putText(frame, str(r["id"]), (int(x), int(y)-6),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return frame
+
+def gated_results(crops):
+    """Last run's per-spot results if inference can be skipped, else None.
+
+    Spots that changed but now look like spot.empty_image are set free
+    without running the model.
+    """
+    prev = GATE.load(GATE_STATE)
+    if prev is None or len(prev) != len(SPOTS):
+        return None
+    changed = GATE.changed(crops)
+    if (changed & ~GATE.matches_empty(crops)).any():
+        return None
+    for i in np.flatnonzero(changed):
+        prev[i] = {**prev[i], "occupied": False}
+    GATE.accept(crops, mask=changed)
+    return prev
+
+def run_spots(img, scale=1):
+    if MAPPED and MAPPED.refresh():
+        # the lot was redrawn: new stalls, so the saved gate and tracker
+        # state describe stalls that are gone
+        use_spots(MAPPED.spots)
+        for path in (GATE_STATE, TRACKER_STATE):
+            if os.path.exists(path):
+                os.remove(path)
+    crops = GATE.crops(img, scale) if GATE else None
+    results = gated_results(crops) if GATE else None
+    reused = results is not None
+    events = []
+    if not reused:
+        results, xyxy = evaluate_spots(img, scale)
+        if GATE:
+            GATE.accept(crops)
+        if TRACKER:
+            TRACKER.load(TRACKER_STATE)
+            flips = TRACKER.update([r["score"] for r in results])
+            TRACKER.apply(results)
+            TRACKER.save(TRACKER_STATE)
+            events = [{"id": results[i]["id"], "occupied": results[i]["occupied"]} for i in flips]
+    if GATE:
+        GATE.save(GATE_STATE, results)
+    if MAPPED and not reused:
+        MAPPED.write([r["occupied"] for r in results])
+    n_occ = sum(r["occupied"] for r in results)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    overlay = None
+    if DRAW and not reused:
+        # the frame is not needed after this; draw on it rather than a copy
+        overlay = (os.path.join(OUT, f"spots_{ts}.jpg"), draw_spots(img, results, xyxy, scale))
+
+    save_result(f"spots_{ts}.json", {"timestamp": ts, "occupied": n_occ, "free": len(results) - n_occ,
+                                     "spots": results, "events": events})
+
+    print(f"{ts} → {n_occ}/{len(results)} OCCUPIED" + (" (unchanged)" if reused else ""))
+    for e in events:
+        print(f"  spot {e['id']} → {'OCCUPIED' if e['occupied'] else 'FREE'}")
+    return overlay
+
+def run_single(img, scale=1):
+    crops = GATE.crops(img, scale) if GATE else None
+    prev = gated_results(crops) if GATE else None
+    reused = prev is not None
+    flipped = False
+    if reused:
+        occ = prev[0]["occupied"]
+    else:
+        occ, score, dets, sbox = evaluate(img, scale)
+        if GATE:
+            GATE.accept(crops)
+        if TRACKER:
+            # same hysteresis as run_spots(), over the one spot
+            TRACKER.load(TRACKER_STATE)
+            flipped = len(TRACKER.update([score])) > 0
+            occ = TRACKER.apply([{"occupied": occ}])[0]["occupied"]
+            TRACKER.save(TRACKER_STATE)
+    if GATE:
+        GATE.save(GATE_STATE, [{"id": SPOTS.ids[0], "occupied": bool(occ)}])
     status = "occupied" if occ else "free"
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    if DRAW:
-        vis = draw_overlay(img.copy(), occ, dets, sbox)
-        cv2.imwrite(os.path.join(OUT, f"spot_{status}_{ts}.jpg"), vis)
+    overlay = None
+    if DRAW and not reused:
+        overlay = (os.path.join(OUT, f"spot_{status}_{ts}.jpg"), draw_overlay(img, occ, dets, sbox, scale))
+
+    save_result(f"spot_{ts}.json", {"timestamp": ts, "status": status})
+
+    print(f"{ts} → {status.upper()}" + (" (unchanged)" if reused else "")
+          + (" (changed)" if flipped else ""))
+    return overlay
+
+def save_result(name, doc):
+    if ARCHIVE:
+        ARCHIVE.add_result(CAMERA_ID, doc)
+        return
+    with open(os.path.join(OUT, name), "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
 
-    with open(os.path.join(OUT, f"spot_{ts}.json"), "w", encoding="utf-8") as f:
-        json.dump({"timestamp": ts, "status": status}, f, indent=2)
+def write_overlay(overlay):
+    path, vis = overlay
+    if ARCHIVE:
+        ok, buf = cv2.imencode(".jpg", vis)
+        if ok:
+            ARCHIVE.add_frame(CAMERA_ID, buf, meta={"overlay": os.path.basename(path)})
+        return
+    cv2.imwrite(path, vis)
 
-    print(f"{ts} → {status.upper()}")
+def run_every(interval):
+    """fetch -> decode -> detect -> overlay write, each on its own thread(s),
+    with captures on a fixed schedule that slow inference cannot push back."""
+    if not (FILE or URL):
+        raise SystemExit("Set camera.snapshot_file or camera.snapshot_url in config.yaml.")
+    run = run_spots if cfg.get("spots") or MAPPED else run_single
+    pipe = Pipeline(Stage("fetch", fetch, queue_size=2),
+                    Stage("decode", decode, workers=2, queue_size=2),
+                    Stage("detect", lambda frame: run(*frame), queue_size=1),  # only the freshest frame
+                    Stage("write", write_overlay, workers=2, queue_size=4)).start()
+    pipe.log_every(60)
+    print(f"Checking every {interval}s (Ctrl+C to stop)")
+    try:
+        pipe.every(interval)
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        pipe.close()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--every", type=float, help="keep running, checking every N seconds")
+    args = ap.parse_args()
+    if args.every:
+        run_every(args.every)
+    else:
+        img, scale = grab()
+        overlay = run_spots(img, scale) if cfg.get("spots") or MAPPED else run_single(img, scale)
+        if overlay:
+            write_overlay(overlay)
@@ -1,11 +1,14 @@
 # define_spot.py
 import os
+import sys
 import cv2
 import yaml
-import requests
 import numpy as np
 
-CONFIG = "config.yaml"
+import settings
+from capture import read_snapshot
+
+CONFIG = settings.CONFIG
 
 cfg = yaml.safe_load(open(CONFIG, "r", encoding="utf-8"))
 
@@ -40,11 +43,10 @@ def grab():
     # otherwise use URL
     if URL:
         try:
-            r = requests.get(URL, timeout=8)
-            r.raise_for_status()
+            content = read_snapshot(URL)
         except Exception as e:
             raise SystemExit(f"HTTP error for {URL}: {e}")
-        img = cv2.imdecode(np.frombuffer(r.content, np.uint8), cv2.IMREAD_COLOR)
+        img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
         if img is None:
             raise SystemExit("Downloaded content did not decode as an image.")
         return rotate_if_needed(img)
@@ -52,6 +54,31 @@ def grab():
     raise SystemExit("Set camera.snapshot_file or camera.snapshot_url in config.yaml")
 
 img = grab()
+
+if "--multi" in sys.argv:
+    # Draw one rectangle per stall; each becomes an entry under `spots:`.
+    # Edit the saved points by hand afterwards for angled stalls.
+    rois = cv2.selectROIs(
+        "Draw each parking spot (ENTER/SPACE after each, ESC when done)",
+        img, showCrosshair=True, fromCenter=False
+    )
+    cv2.destroyAllWindows()
+
+    if len(rois) == 0:
+        raise SystemExit("No ROIs selected. Run again and draw rectangles.")
+
+    cfg["spots"] = [
+        {"id": i, "points": [[int(x), int(y)], [int(x + w), int(y)],
+                             [int(x + w), int(y + h)], [int(x), int(y + h)]]}
+        for i, (x, y, w, h) in enumerate(rois)
+    ]
+
+    with open(CONFIG, "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, sort_keys=False)
+
+    print(f"Saved {len(cfg['spots'])} spots to config.yaml")
+    sys.exit(0)
+
 # Let the user draw the ROI (x,y,w,h). If cancelled, w/h will be 0.
 x, y, w, h = cv2.selectROI(
     "Draw your parking spot (press ENTER to save, ESC to cancel)",
@@ -0,0 +1,304 @@
+# spot_daemon.py
+# Long-running detector: loads the model once, pulls frames from every configured
+# camera and runs them through the model in batches.
+import os, json, time, queue, threading
+import numpy as np
+from datetime import datetime
+
+import settings
+from archive import Archive
+from capture import CameraFetcher, NEW, UNCHANGED
+from detector import load_detector
+from frames import decode as decode_jpeg, reduction, rotate
+from gating import ChangeGate
+from homography import MappedSpaces
+from occupancy import SpotSet
+from smoothing import SpotTracker
+from stats import StageStats
+from tiling import Tiler
+import metrics  # backend/metrics.py, on sys.path via settings
+
+cfg = settings.load()
+
+# every published result is also kept in hourly segments (archive:)
+ARCHIVE = Archive.from_config(cfg)
+
+OUT  = cfg.get("output", {}).get("dir", "spot_out")
+ROT  = cfg.get("output", {}).get("rotate")
+
+daemon_cfg  = cfg.get("daemon", {})
+MAX_BATCH   = int(daemon_cfg.get("max_batch", 8))
+MAX_WAIT    = float(daemon_cfg.get("max_wait_ms", 50)) / 1000
+INTERVAL    = float(daemon_cfg.get("interval_sec", 5))
+QUEUE_SIZE  = int(daemon_cfg.get("queue_size", 2 * MAX_BATCH))
+WARMUP      = int(daemon_cfg.get("warmup", 2))
+METRICS_PORT = daemon_cfg.get("metrics_port")  # /metrics and /trace over HTTP
+# tiles are fed at their native size; full frames at the model's default
+_tiling     = cfg.get("model", {}).get("tiling")
+IMGSZ       = int(_tiling.get("tile", 640)) if isinstance(_tiling, dict) else int(cfg.get("model", {}).get("imgsz", 640))
+
+
+os.makedirs(OUT, exist_ok=True)
+
+FETCH_SECONDS   = metrics.histogram("capture_fetch_seconds", "Snapshot fetch time per camera", ["camera"])
+NOT_MODIFIED    = metrics.counter("capture_not_modified_total", "Fetches answered 304 / file unchanged", ["camera"])
+CAPTURE_ERRORS  = metrics.counter("capture_errors_total", "Failed snapshot fetches", ["camera"])
+DECODE_FAILURES = metrics.counter("decode_failures_total", "Snapshots that did not decode", ["camera"])
+DROPPED         = metrics.counter("frames_dropped_total", "Items dropped from a full queue", ["stage"])
+TRANSITIONS     = metrics.counter("spot_transitions_total", "Published spot occupancy changes", ["camera"])
+STALENESS       = metrics.gauge("camera_staleness_seconds", "Seconds since the camera last answered", ["camera"])
+QUEUE_DEPTH     = metrics.gauge("queue_depth", "Items waiting in a stage's queue", ["stage"])
+
+
+def load_cameras(cfg):
+    """Return one dict per camera with its source, rotation, SpotSet and gate.
+
+    Cameras come from the `cameras:` list, each with its own `spots:` or
+    `calibration:` (and optionally its own `empty_image`). Without it, the
+    top-level `camera:` and `spots:`/`spot.box`/`calibration:` form a single
+    camera.
+    """
+    cams = []
+    for i, c in enumerate(cfg.get("cameras") or []):
+        spot_cfg = {k: v for k, v in cfg.get("spot", {}).items() if k != "box"}
+        if "empty_image" in c:
+            spot_cfg["empty_image"] = c["empty_image"]
+        sub = {"spots": c.get("spots"), "spot": spot_cfg, "calibration": c.get("calibration")}
+        if "smoothing" in cfg:
+            sub["smoothing"] = cfg["smoothing"]
+        cams.append(_camera(str(c.get("id", i)), c, sub))
+    if not cams:
+        cams.append(_camera("default", cfg.get("camera", {}), cfg))
+    return cams
+
+def _camera(cam_id, c, spot_cfg):
+    # map spaces projected into this camera's image (calibration:)
+    mapped = MappedSpaces.from_config(spot_cfg)
+    return {
+        "id": cam_id,
+        "snapshot_url": c.get("snapshot_url"),
+        "snapshot_file": c.get("snapshot_file"),
+        "rotate": c.get("rotate", ROT),
+        "timeout": c.get("timeout", 8),
+        "auth": c.get("auth"),
+        "mapped": mapped,
+        "config": (c, spot_cfg),
+        "seen": None,  # monotonic time of the last successful fetch
+        **_spot_state(mapped.spots if mapped else SpotSet.from_config(spot_cfg), c, spot_cfg),
+    }
+
+def _spot_state(spots, c, spot_cfg):
+    """The per-spot parts of a camera, rebuilt when its spots change."""
+    gate = "ssim_threshold" in spot_cfg.get("spot", {})
+    tiler = Tiler.from_config(cfg, spots)
+    return {
+        "spots": spots,
+        # skips inference while no spot crop changed (spot.ssim_threshold)
+        "gate": ChangeGate.from_config(spot_cfg, spots) if gate else None,
+        # publishes only confirmed transitions (smoothing: section)
+        "tracker": SpotTracker.from_config(spot_cfg, spots) if "smoothing" in spot_cfg else None,
+        # detects on tiles over the spot regions only (model.tiling)
+        "tiler": tiler,
+        # decode at 1/2..1/8 size when the model would downscale anyway;
+        # tiles need native pixels, so not with tiling
+        "reduced": bool(c.get("reduced_decode", False)) and tiler is None,
+        "last": None,  # last published results, reused while the gate is closed
+    }
+
+def decode(cam, content):
+    """(image, scale): scale is full-frame pixels per decoded pixel."""
+    scale = reduction(content, IMGSZ) if cam["reduced"] else 1
+    img = decode_jpeg(content, scale)
+    if img is None:
+        raise RuntimeError(f"camera {cam['id']}: snapshot decode failed")
+    return rotate(img, cam["rotate"]), scale
+
+
+def put_latest(q, item):
+    """Enqueue without blocking; when full, drop the oldest frame instead."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+                DROPPED.labels("frames").inc()
+            except queue.Empty:
+                pass
+
+def capture_loop(cams, frames, stats, stop):
+    """Poll every camera concurrently once per INTERVAL.
+
+    Unchanged snapshots (304 / same file) and frames where the gate sees no
+    spot change are not queued: the camera's last published verdict stands.
+    """
+    fetcher = CameraFetcher(max_workers=min(32, max(4, len(cams))))
+    for cam in cams:
+        STALENESS.labels(cam["id"]).set_function(
+            lambda cam=cam: time.monotonic() - cam["seen"] if cam["seen"] else float("nan"))
+
+    def on_result(cam, snap):
+        stats.add("grab", snap.elapsed)
+        FETCH_SECONDS.labels(cam["id"]).observe(snap.elapsed)
+        if snap.status in (NEW, UNCHANGED):
+            cam["seen"] = time.monotonic()
+        if snap.status == UNCHANGED:
+            NOT_MODIFIED.labels(cam["id"]).inc()
+        if snap.status == NEW:
+            try:
+                with stats.timer("decode"):
+                    img, scale = decode(cam, snap.content)
+                crops = None
+                if cam["gate"] is not None:
+                    with stats.timer("gate"):
+                        crops = cam["gate"].crops(img, scale)
+                        changed = cam["gate"].changed(crops)
+                    if cam["last"] is not None and not changed.any():
+                        stats.incr("gated")
+                        return
+                put_latest(frames, (cam, img, time.monotonic(), crops, scale))
+            except Exception as e:
+                DECODE_FAILURES.labels(cam["id"]).inc()
+                print(f"[{cam['id']}] decode error:", e)
+        elif snap.error is not None:
+            CAPTURE_ERRORS.labels(cam["id"]).inc()
+            print(f"[{cam['id']}] capture error:", snap.error)
+
+    while not stop.is_set():
+        t0 = time.monotonic()
+        fetcher.fetch_all(cams, on_result, timeout=INTERVAL)
+        stop.wait(max(0.0, INTERVAL - (time.monotonic() - t0)))
+    fetcher.close()
+
+def next_batch(frames, stop):
+    """Block for the first frame, then gather up to MAX_BATCH within MAX_WAIT."""
+    batch = []
+    while not batch and not stop.is_set():
+        try:
+            batch.append(frames.get(timeout=0.5))
+        except queue.Empty:
+            pass
+    deadline = time.monotonic() + MAX_WAIT
+    while batch and len(batch) < MAX_BATCH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(frames.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def publish(cam, results, ts, send=None):
+    """Write the camera's latest results; mapped cameras also update the lot
+    pack, or hand their verdicts to send(cam, results, ts) when another
+    process owns the pack (Spot_Supervisor.py)."""
+    n_occ = sum(r["occupied"] for r in results)
+    doc = {"timestamp": ts, "camera": cam["id"], "occupied": n_occ,
+           "free": len(results) - n_occ, "spots": results}
+    path = os.path.join(OUT, f"latest_{cam['id']}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f)
+    os.replace(tmp, path)  # readers never see a half-written file
+    if cam["mapped"] is not None:
+        if send is not None:
+            send(cam, results, ts)
+        else:
+            cam["mapped"].write([r["occupied"] for r in results])
+    if ARCHIVE:
+        ARCHIVE.add_result(cam["id"], doc)
+
+def infer_loop(detector, frames, stats, stop, send=None):
+    while not stop.is_set():
+        batch = next_batch(frames, stop)
+        if not batch:
+            continue
+        started = time.monotonic()
+        for _, _, captured, _, _ in batch:
+            stats.add("queue", started - captured)
+
+        # tiled cameras add one input per tile; spans map them back to frames,
+        # through the tiler that cut them even if a redraw replaces it below
+        inputs, spans = [], []
+        for cam, img, _, _, _ in batch:
+            tiler = cam["tiler"]
+            parts = tiler.crops(img) if tiler else [img]
+            spans.append((len(inputs), len(inputs) + len(parts), tiler))
+            inputs.extend(parts)
+        stats.incr("tiles", len(inputs))
+
+        with stats.timer("infer"):
+            dets = detector.predict(inputs, imgsz=IMGSZ)
+
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        for (cam, _, captured, crops, scale), (a, b, tiler) in zip(batch, spans):
+            if cam["mapped"] is not None and cam["mapped"].refresh():
+                # the lot was redrawn: new stalls, so new gate, tracker and tiles
+                cam.update(_spot_state(cam["mapped"].spots, *cam["config"]))
+                crops = None
+            with stats.timer("score"):
+                xyxy, sc = tiler.merge(dets[a:b]) if tiler else dets[a]
+                xyxy = xyxy * scale  # back to full-frame pixels
+                occupied, score, confidence = cam["spots"].occupancy(xyxy, sc)
+                results = cam["spots"].results(occupied, score, confidence)
+                if cam["tracker"] is not None:
+                    flips = cam["tracker"].update(score)
+                    cam["tracker"].apply(results)
+            if cam["tracker"] is not None and cam["last"] is not None and not len(flips):
+                stats.incr("steady")  # nothing confirmed: no write, no downstream push
+            else:
+                if cam["tracker"] is not None:
+                    changed = len(flips)
+                elif cam["last"] is not None and len(cam["last"]) == len(results):
+                    changed = sum(r["occupied"] != p["occupied"] for r, p in zip(results, cam["last"]))
+                else:
+                    changed = 0
+                TRANSITIONS.labels(cam["id"]).inc(changed)
+                with stats.timer("publish"):
+                    publish(cam, results, ts, send)
+                cam["last"] = results
+            if crops is not None:
+                cam["gate"].accept(crops)
+            stats.add("end_to_end", time.monotonic() - captured)
+
+        stats.count(len(batch))
+        print(f"batch={len(batch)} {stats.report()}", flush=True)
+
+
+def load_model():
+    detector = load_detector(cfg)
+    # first calls allocate buffers and pick kernels; keep them out of the stats
+    dummy = np.zeros((IMGSZ, IMGSZ, 3), np.uint8)
+    for _ in range(WARMUP):
+        detector.predict([dummy] * MAX_BATCH, imgsz=IMGSZ)
+    return detector
+
+def serve(cams, stats=None, stop=None, send=None, metrics_port=METRICS_PORT):
+    """Load the model and run capture and inference for cams until stopped."""
+    if metrics_port:
+        metrics.serve(int(metrics_port))
+    detector = load_model()
+
+    frames = queue.Queue(maxsize=QUEUE_SIZE)
+    QUEUE_DEPTH.labels("frames").set_function(frames.qsize)
+    stats = stats or StageStats()
+    stop = stop or threading.Event()
+    threading.Thread(target=capture_loop, args=(cams, frames, stats, stop),
+                     name="capture", daemon=True).start()
+
+    print(f"Serving {len(cams)} camera(s), batch<={MAX_BATCH}, wait<={MAX_WAIT*1000:.0f}ms (Ctrl+C to stop)")
+    try:
+        infer_loop(detector, frames, stats, stop, send)
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        stop.set()
+
+def main():
+    serve(load_cameras(cfg))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+# spot_supervisor.py
+# Runs Spot_Daemon over many cameras on one box: cameras are sharded across
+# worker processes (one per core by default), each with its own model and a
+# capped number of threads, so N cores give close to N times the frames/sec
+# of one daemon. Workers send mapped-space verdicts back over a local socket
+# (a Unix socket, a named pipe on Windows); the supervisor is the only
+# writer of the lot pack and folds every worker's updates into one write.
+#
+#   supervisor:
+#     workers: 8                # default: CPU count
+#     threads_per_worker: 1     # torch / OpenCV / BLAS threads per worker
+#     flush_ms: 500             # at most one pack write per flush
+#     max_restarts: 5           # crashes within restart_window_sec before a
+#     restart_window_sec: 60    # worker's slot is taken out of the ring
+#     cooldown_sec: 300         # ... for this long
+#
+# Cameras are assigned by consistent hashing of their ids, so adding or
+# removing a camera restarts only the worker that owns it, and losing a
+# worker slot moves only that slot's cameras. config.yaml is re-read when
+# it changes. With daemon: metrics_port set, worker N serves its /metrics on
+# metrics_port + 1 + N.
+#
+# Only the standard library is imported at the top: worker processes are
+# spawned fresh and must set their thread caps before numpy, OpenCV or
+# torch load.
+import os, time, bisect, hashlib, threading, argparse
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+import settings
+
+# read once by OpenMP / BLAS when their library loads
+THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+               "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing with `vnodes` points per node on a 64-bit ring."""
+
+    def __init__(self, nodes, vnodes=64):
+        points = sorted((_hash(f"{node}#{v}"), node) for node in nodes for v in range(vnodes))
+        self.keys = [k for k, _ in points]
+        self.nodes = [n for _, n in points]
+
+    def node(self, key):
+        if not self.keys:
+            return None
+        i = bisect.bisect(self.keys, _hash(str(key))) % len(self.keys)
+        return self.nodes[i]
+
+
+def camera_entries(cfg):
+    """The `cameras:` entries of cfg, each with an explicit id."""
+    return [dict(c, id=str(c.get("id", i))) for i, c in enumerate(cfg.get("cameras") or [])]
+
+
+# -- worker side --------------------------------------------------------------
+
+def worker_main(slot, cameras, address, authkey, threads, config):
+    """One shard: Spot_Daemon's capture and inference for `cameras`."""
+    for var in THREAD_VARS:
+        os.environ[var] = str(threads)
+    settings.CONFIG = config  # read by Spot_Daemon on import
+    import cv2
+    cv2.setNumThreads(threads)
+    import Spot_Daemon as daemon
+    from stats import StageStats
+
+    daemon.cfg["cameras"] = cameras
+    daemon.cfg.setdefault("model", {}).setdefault("threads", threads)  # onnx / openvino
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+    conn = Client(address, authkey=authkey)
+    lock = threading.Lock()
+    stats = StageStats()
+    stop = threading.Event()
+
+    def send(cam, results, ts):
+        m = cam["mapped"]
+        with lock:
+            conn.send(("result", cam["id"], m.geometry_id, m.index,
+                       [r["occupied"] for r in results]))
+
+    def report():
+        while not stop.wait(5):
+            try:
+                with lock:
+                    conn.send(("stats", slot, stats.frames, stats.fps()))
+            except OSError:
+                stop.set()  # the supervisor is gone; so are we
+
+    threading.Thread(target=report, name="report", daemon=True).start()
+    with lock:
+        conn.send(("hello", slot, os.getpid(), [c["id"] for c in cameras]))
+    port = daemon.METRICS_PORT and int(daemon.METRICS_PORT) + 1 + slot
+    daemon.serve(daemon.load_cameras(daemon.cfg), stats=stats, stop=stop, send=send, metrics_port=port)
+
+
+# -- supervisor side ------------------------------------------------------------
+
+class PackWriter:
+    """Folds mapped-space verdicts from every worker into the lot pack,
+    writing at most once per flush()."""
+
+    def __init__(self, lots_file):
+        import lotpack  # numpy; keep it out of the spawned workers' imports
+        self.lotpack = lotpack
+        self.lots_file = lots_file
+        self.pack = lotpack.LotPack(lots_file)
+        self.pending = {}  # camera id -> (geometry id, pack indices, occupied)
+        self.lock = threading.Lock()
+        self.writes = 0
+
+    def update(self, camera, geometry_id, index, occupied):
+        with self.lock:
+            self.pending[camera] = (geometry_id, index, occupied)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return None
+        import numpy as np
+        self.pack.refresh()
+        occ = self.pack.occupied.copy()
+        for geometry_id, index, occupied in pending.values():
+            if geometry_id == self.pack.geometry_id:  # else the worker re-projects first
+                occ[index] = occupied
+        if np.array_equal(occ, self.pack.occupied):
+            return None
+        self.writes += 1
+        return self.lotpack.write(self.lots_file, self.pack.spaces, occ, self.pack.index)
+
+
+class Supervisor:
+    def __init__(self, config=None):
+        self.config = config or settings.CONFIG
+        self.ctx = mp.get_context("spawn")  # fresh interpreters, same on every OS
+        self.authkey = os.urandom(16)
+        self.listener = Listener(authkey=self.authkey)
+        self.workers = {}   # slot -> {"proc", "cameras", "started"}
+        self.crashes = {}   # slot -> deque of crash times
+        self.down = {}      # slot -> back in the ring at this time
+        self.fps = {}       # slot -> (frames, fps) last reported
+        self.stop = threading.Event()
+        self.cfg_mtime = None
+        self.cameras = []
+        self.load()
+
+    def load(self):
+        """(Re)read config.yaml: cameras and supervisor settings."""
+        cfg = settings.load(self.config)
+        self.cfg_mtime = os.path.getmtime(self.config)
+        s = cfg.get("supervisor", {})
+        self.n_workers = int(s.get("workers") or os.cpu_count() or 1)
+        self.threads = int(s.get("threads_per_worker") or max(1, (os.cpu_count() or 1) // self.n_workers))
+        self.vnodes = int(s.get("vnodes", 64))
+        self.flush_sec = float(s.get("flush_ms", 500)) / 1000
+        self.max_restarts = int(s.get("max_restarts", 5))
+        self.window = float(s.get("restart_window_sec", 60))
+        self.cooldown = float(s.get("cooldown_sec", 300))
+        self.cameras = camera_entries(cfg)
+        if not self.cameras:
+            raise SystemExit("Spot_Supervisor needs a cameras: list in config.yaml.")
+        cal = next((c["calibration"] for c in self.cameras if c.get("calibration")), None)
+        lots_file = s.get("lots_file") or (cal or {}).get("lots_file", "../backend/lots.bin")
+        if not hasattr(self, "writer") or self.writer.lots_file != lots_file:
+            self.writer = PackWriter(lots_file)
+
+    def assignment(self):
+        """slot -> [camera entries], over the slots currently in the ring."""
+        now = time.time()
+        live = [s for s in range(self.n_workers) if self.down.get(s, 0) <= now]
+        if not live:
+            return {}
+        ring = HashRing(live, self.vnodes)
+        out = {}
+        for c in self.cameras:
+            out.setdefault(ring.node(c["id"]), []).append(c)
+        return out
+
+    def rebalance(self):
+        """Start, stop or restart workers whose camera set differs from the assignment."""
+        want = self.assignment()
+        for slot in set(self.workers) | set(want):
+            cams = want.get(slot, [])
+            w = self.workers.get(slot)
+            if w is not None and w["cameras"] == cams and w["proc"].is_alive():
+                continue
+            if w is not None:
+                self.stop_worker(slot)
+            if cams:
+                self.start_worker(slot, cams)
+
+    def start_worker(self, slot, cams):
+        proc = self.ctx.Process(target=worker_main, name=f"spot-worker-{slot}",
+                                args=(slot, cams, self.listener.address, self.authkey, self.threads,
+                                      self.config),
+                                daemon=True)
+        proc.start()
+        self.workers[slot] = {"proc": proc, "cameras": cams, "started": time.time()}
+        print(f"worker {slot} (pid {proc.pid}): {', '.join(c['id'] for c in cams)}", flush=True)
+
+    def stop_worker(self, slot):
+        w = self.workers.pop(slot)
+        w["proc"].terminate()
+        w["proc"].join(10)
+        self.fps.pop(slot, None)
+
+    def check(self):
+        """Restart crashed workers; a slot that keeps crashing leaves the ring
+        for cooldown_sec and its cameras move to the others."""
+        now = time.time()
+        changed = False
+        for slot, w in list(self.workers.items()):
+            if w["proc"].is_alive():
+                continue
+            print(f"worker {slot} exited with {w['proc'].exitcode}", flush=True)
+            crashes = self.crashes.setdefault(slot, deque())
+            crashes.append(now)
+            while crashes and crashes[0] < now - self.window:
+                crashes.popleft()
+            self.workers.pop(slot)
+            self.fps.pop(slot, None)
+            if len(crashes) >= self.max_restarts:
+                print(f"worker {slot} crashed {len(crashes)} times in {self.window:.0f}s; "
+                      f"moving its cameras for {self.cooldown:.0f}s", flush=True)
+                self.down[slot] = now + self.cooldown
+                crashes.clear()
+            changed = True
+        for slot, until in list(self.down.items()):
+            if until <= now:
+                del self.down[slot]
+                changed = True
+        if changed:
+            self.rebalance()
+
+    def accept_loop(self):
+        while not self.stop.is_set():
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.reader, args=(conn,), name="worker-conn", daemon=True).start()
+
+    def reader(self, conn):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            kind = msg[0]
+            if kind == "result":
+                _, camera, geometry_id, index, occupied = msg
+                self.writer.update(camera, geometry_id, index, occupied)
+            elif kind == "stats":
+                _, slot, frames, fps = msg
+                self.fps[slot] = (frames, fps)
+
+    def report(self):
+        total = sum(f for _, f in self.fps.values())
+        parts = [f"{len(self.workers)} workers x {self.threads} threads", f"{total:.2f} fps total"]
+        for slot in sorted(self.workers):
+            frames, fps = self.fps.get(slot, (0, 0.0))
+            parts.append(f"w{slot}[{len(self.workers[slot]['cameras'])} cams] {fps:.2f} fps")
+        parts.append(f"pack writes={self.writer.writes}")
+        return " | ".join(parts)
+
+    def run(self, report_every=30):
+        threading.Thread(target=self.accept_loop, name="accept", daemon=True).start()
+        self.rebalance()
+        last_report = time.monotonic()
+        try:
+            while not self.stop.wait(self.flush_sec):
+                try:
+                    self.writer.flush()
+                except (OSError, ValueError) as e:
+                    print(f"pack write failed: {e}", flush=True)
+                self.check()
+                if os.path.getmtime(self.config) != self.cfg_mtime:
+                    print("config changed; rebalancing", flush=True)
+                    try:
+                        self.load()
+                    except (Exception, settings.ConfigError) as e:  # keep the running shards on a bad edit
+                        print(f"config reload failed: {e}", flush=True)
+                        self.cfg_mtime = os.path.getmtime(self.config)
+                        continue
+                    self.rebalance()
+                if time.monotonic() - last_report >= report_every:
+                    print(self.report(), flush=True)
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            print("\nStopped by user.")
+        finally:
+            self.stop.set()
+            for slot in list(self.workers):
+                self.stop_worker(slot)
+            self.writer.flush()
+            self.listener.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Shard cameras across Spot_Daemon worker processes.")
+    ap.add_argument("--report-every", type=float, default=30, help="seconds between fps reports")
+    args = ap.parse_args()
+    Supervisor().run(args.report_every)
@@ -1,7 +1,11 @@
-import os, time, traceback
-import requests, numpy as np, cv2
+import os
+import requests, cv2
 from datetime import datetime
 
+from frames import Rotator, decode, is_jpeg, link_latest, write_file
+from pipeline import Pipeline, Stage
+from metrics import counter, serve as serve_metrics  # backend/metrics.py (on sys.path via settings)
+
 # ===== EDIT THESE TO MATCH THE ONE-SHOT TEST =====
 BASE = "http://atharva-2.local:8081/video"   # same as one-shot
 PATH = "/snapshot.jpg"               # whichever worked
@@ -12,55 +16,67 @@ OUT_DIR = "snaps"
 ROTATE = None                        # "cw90" | "ccw90" | "180" | None
 JPEG_QUALITY = 90
 TIMEOUT_SEC = 8
+METRICS_PORT = None                  # e.g. 9101: /metrics and /trace over HTTP
 # ================================================
 
 URL = BASE + PATH
 AUTH = (USER, PASS) if USER else None
 os.makedirs(OUT_DIR, exist_ok=True)
 session = requests.Session()
+SAVED = counter("snapshots_saved_total", "Snapshots written to disk or the archive")
+SAVED_BYTES = counter("snapshots_saved_bytes_total", "Bytes of snapshots written")
 
-def rotate(img):
-    if ROTATE == "cw90":   return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-    if ROTATE == "ccw90":  return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-    if ROTATE == "180":    return cv2.rotate(img, cv2.ROTATE_180)
-    return img
+ROTATOR = Rotator(ROTATE)  # reuses one buffer per thread
 
-def save_once():
-    # fetch
+def fetch(_tick=None):
     r = session.get(URL, timeout=TIMEOUT_SEC, auth=AUTH)
     r.raise_for_status()
     if not r.headers.get("content-type","").lower().startswith("image"):
         raise RuntimeError(f"Not an image: {r.headers.get('content-type')} status={r.status_code}")
-    img = cv2.imdecode(np.frombuffer(r.content, np.uint8), cv2.IMREAD_COLOR)
+    return r.content
+
+def encode(content):
+    # the camera's JPEG as is unless it has to be rotated
+    if ROTATE is None and is_jpeg(content):
+        return content
+    img = decode(content)
     if img is None:
         raise RuntimeError("decode failed")
+    ok, buf = cv2.imencode(".jpg", ROTATOR(img), [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+    if not ok:
+        raise RuntimeError("jpeg encode failed")
+    return buf
 
-    img = rotate(img)
-
+def save(data):
     # timestamped filename + latest
     ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
     path = os.path.join(OUT_DIR, f"snap_{ts}.jpg")
     latest = os.path.join(OUT_DIR, "latest.jpg")
 
-    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-    if not ok:
-        raise RuntimeError("jpeg encode failed")
-
-    with open(path, "wb") as f: f.write(buf.tobytes())
-    with open(latest, "wb") as f: f.write(buf.tobytes())
+    write_file(path, data)
+    link_latest(path, latest)  # same bytes, no second write
+    SAVED.inc()
+    SAVED_BYTES.inc(len(data))
 
     print("Saved:", path, flush=True)
     return path
 
+def save_once():
+    return save(encode(fetch()))
+
 if __name__ == "__main__":
     print(f"CWD: {os.getcwd()}")
     print(f"Saving every {INTERVAL_SEC}s to '{OUT_DIR}'. URL={URL} (Ctrl+C to stop)")
-    while True:
-        try:
-            save_once()
-        except KeyboardInterrupt:
-            print("\nStopped by user."); break
-        except Exception as e:
-            print("Capture error:", e)
-            traceback.print_exc(limit=1)
-        time.sleep(INTERVAL_SEC)
+    # fetch -> decode/rotate/encode -> write on separate threads; ticks do not drift
+    pipe = Pipeline(Stage("fetch", fetch, queue_size=2),
+                    Stage("encode", encode, workers=2, queue_size=2),
+                    Stage("save", save, workers=2, queue_size=2)).start()
+    pipe.log_every(60)
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    try:
+        pipe.every(INTERVAL_SEC)
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        pipe.close()
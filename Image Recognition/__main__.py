@@ -0,0 +1,57 @@
+# __main__.py
+# One entry point for the scripts in this directory:
+#
+#   python "Image Recognition" check                 # Check_Spot.py
+#   python "Image Recognition" check --every 60
+#   python "Image Recognition" --config lot2.yaml daemon
+#
+# Only the script asked for is imported, so `--help` and the list below
+# cost no numpy, OpenCV or model. Scripts run in the directory of the
+# config file (default: config.yaml here), as they expect, and read it
+# through settings.py.
+import os, sys, runpy, argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    "check":      ("Check_Spot",      "check the spots on one snapshot, or --every N seconds"),
+    "daemon":     ("Spot_Daemon",     "keep the model loaded and check every camera"),
+    "supervisor": ("Spot_Supervisor", "shard cameras across daemon worker processes"),
+    "define":     ("Define_Spot",     "draw spots on a snapshot into the config"),
+    "calibrate":  ("homography",      "check a camera calibration against an image"),
+    "parity":     ("detector",        "compare an exported backend against PyTorch"),
+    "snap":       ("Snaps_Image",     "find the camera's snapshot URL and save one frame"),
+    "capture":    ("real",            "save snapshots from the camera continuously"),
+    "trial":      ("Trial",           "save snapshots with an authenticated URL and latest.jpg"),
+    "fetch":      ("capture",         "time snapshot fetches from URLs"),
+    "archive":    ("archive",         "query or export the result archive"),
+    "fake-camera": ("fake_camera",    "serve one JPEG as many fake IP cameras"),
+}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        prog='python "Image Recognition"',
+        description="Parking spot detection scripts.",
+        epilog="\n".join(f"  {name:12} {help}" for name, (_, help) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--config", default=os.path.join(HERE, "config.yaml"),
+                    help="config file; the script runs in its directory")
+    ap.add_argument("command", choices=COMMANDS, metavar="command")
+    ap.add_argument("args", nargs=argparse.REMAINDER, help="passed on to the script")
+    args = ap.parse_args(argv)
+
+    config = os.path.abspath(args.config)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    os.chdir(os.path.dirname(config))
+    import settings
+    settings.CONFIG = os.path.basename(config)
+
+    module = COMMANDS[args.command][0]
+    sys.argv = [os.path.join(HERE, module + ".py")] + args.args
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# archive.py
+# Time-partitioned store for snapshots and spot results, replacing one file
+# per frame. Each UTC hour is one SQLite segment, written append-only and
+# indexed by (camera, ts), so "camera X between t1 and t2" opens only the
+# hours in range and reads them in index order. Retention drops whole
+# segments, oldest first: by age when each hour's segment opens, and by
+# total size as entries are added (the cap is kept to within 1%, except
+# that the hour being written is never dropped).
+#
+#   archive:
+#     dir: archive
+#     max_gb: 20
+#     max_days: 30
+import os, sys, glob, json, time, sqlite3, threading, argparse
+from datetime import datetime, timezone
+
+SEGMENT_SEC = 3600
+NAME = "%Y%m%d-%H"  # UTC hour, also the sort order of the files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ts     REAL NOT NULL,     -- unix seconds
+    camera TEXT NOT NULL,
+    kind   TEXT NOT NULL,     -- 'frame' (JPEG bytes) or 'result' (JSON)
+    data   BLOB NOT NULL,
+    meta   TEXT               -- optional JSON
+);
+CREATE INDEX IF NOT EXISTS entries_camera_ts ON entries (camera, ts);
+"""
+
+
+def _segment_start(ts):
+    return int(ts // SEGMENT_SEC * SEGMENT_SEC)
+
+
+class Archive:
+    """Appends entries to the current hour's segment and serves range queries."""
+
+    def __init__(self, root, max_bytes=None, max_age=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # seconds
+        self.lock = threading.Lock()
+        self._db = None
+        self._start = None
+        self._size = 0   # bytes on disk at the last retention check
+        self._added = 0  # bytes added since
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Archive from the `archive:` section, or None if there is none."""
+        a = cfg.get("archive")
+        if not a:
+            return None
+        gb, days = a.get("max_gb"), a.get("max_days")
+        return cls(a.get("dir", "archive"),
+                   max_bytes=int(gb * 1e9) if gb else None,
+                   max_age=days * 86400 if days else None)
+
+    def path(self, start):
+        name = datetime.fromtimestamp(start, timezone.utc).strftime(NAME)
+        return os.path.join(self.root, f"{name}.sqlite")
+
+    def segments(self):
+        """[(start, path)] of every segment on disk, oldest first."""
+        out = []
+        for p in glob.glob(os.path.join(self.root, "*.sqlite")):
+            try:
+                dt = datetime.strptime(os.path.basename(p)[:-7], NAME)
+            except ValueError:
+                continue
+            out.append((int(dt.replace(tzinfo=timezone.utc).timestamp()), p))
+        return sorted(out)
+
+    def _writer(self, ts):
+        start = _segment_start(ts)
+        if start != self._start:
+            if self._db is not None:
+                self._db.close()
+            self._db = sqlite3.connect(self.path(start), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._start = start
+            self.enforce_retention(now=ts)
+        return self._db
+
+    def add(self, camera, kind, data, ts=None, meta=None):
+        ts = time.time() if ts is None else ts
+        with self.lock:
+            db = self._writer(ts)
+            db.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                       (ts, str(camera), kind, sqlite3.Binary(memoryview(data)),
+                        json.dumps(meta) if meta is not None else None))
+            db.commit()
+            self._added += len(data)
+            # re-measure after every 1% of the cap rather than per insert
+            if (self.max_bytes is not None and self._size + self._added > self.max_bytes
+                    and self._added > self.max_bytes // 100):
+                self.enforce_retention(now=ts)
+
+    def add_frame(self, camera, jpeg, ts=None, meta=None):
+        self.add(camera, "frame", jpeg, ts, meta)
+
+    def add_result(self, camera, result, ts=None):
+        self.add(camera, "result", json.dumps(result, separators=(",", ":")).encode(), ts)
+
+    def query(self, camera, t1, t2, kind=None):
+        """Yield (ts, kind, data, meta) for camera with t1 <= ts < t2, in time order.
+        Results come back decoded from JSON, frames as bytes."""
+        sql = "SELECT ts, kind, data, meta FROM entries WHERE camera = ? AND ts >= ? AND ts < ?"
+        args = [str(camera), t1, t2]
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        sql += " ORDER BY ts"
+        for start, path in self.segments():
+            if start + SEGMENT_SEC <= t1 or start >= t2:
+                continue
+            db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                for ts, k, data, meta in db.execute(sql, args):
+                    yield (ts, k, json.loads(data) if k == "result" else bytes(data),
+                           json.loads(meta) if meta else None)
+            finally:
+                db.close()
+
+    def size(self):
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(self.root, "*.sqlite*")))
+
+    def enforce_retention(self, now=None):
+        """Drop whole segments past max_age, then oldest until under max_bytes.
+        The segment being written is never dropped. Returns paths removed."""
+        now = time.time() if now is None else now
+        removed = []
+        segs = [(s, p) for s, p in self.segments() if s != self._start]
+        sizes = {p: sum(os.path.getsize(f) for f in glob.glob(p + "*")) for _, p in segs}
+        total = self.size()
+        for start, p in segs:
+            too_old = self.max_age is not None and start + SEGMENT_SEC < now - self.max_age
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_big):
+                break
+            for f in glob.glob(p + "*"):  # the db and any -wal / -shm files
+                os.remove(f)
+            total -= sizes[p]
+            removed.append(p)
+        self._size, self._added = total, 0
+        return removed
+
+    def close(self):
+        with self.lock:
+            if self._db is not None:
+                self._db.close()
+                self._db, self._start = None, None
+
+
+def _parse_time(s):
+    """Unix seconds, or an ISO date/time in local time."""
+    try:
+        return float(s)
+    except ValueError:
+        return datetime.fromisoformat(s).timestamp()
+
+
+if __name__ == "__main__":
+    # python archive.py archive --camera default --from 2025-10-10T08:00 --to 2025-10-10T09:00
+    ap = argparse.ArgumentParser(description="Query or export an archive.")
+    ap.add_argument("root")
+    ap.add_argument("--camera", required=True)
+    ap.add_argument("--from", dest="t1", default="0")
+    ap.add_argument("--to", dest="t2", default=str(time.time() + 1))
+    ap.add_argument("--kind", choices=["frame", "result"])
+    ap.add_argument("--export", help="write frames as JPEG files into this folder")
+    args = ap.parse_args()
+
+    arc = Archive(args.root)
+    n = 0
+    for ts, kind, data, meta in arc.query(args.camera, _parse_time(args.t1), _parse_time(args.t2), args.kind):
+        n += 1
+        stamp = datetime.fromtimestamp(ts).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        if kind == "frame" and args.export:
+            os.makedirs(args.export, exist_ok=True)
+            with open(os.path.join(args.export, f"{args.camera}_{stamp}.jpg"), "wb") as f:
+                f.write(data)
+        elif kind == "result":
+            print(stamp, json.dumps(data))
+    print(f"{n} entries", file=sys.stderr)
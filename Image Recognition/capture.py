@@ -0,0 +1,184 @@
+# capture.py
+# Shared snapshot fetcher: many cameras at once, pooled keep-alive
+# connections per host, conditional GETs and per-camera backoff.
+import os, sys, time, random, threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+NEW, UNCHANGED, ERROR, BACKOFF, BUSY = "new", "unchanged", "error", "backoff", "busy"
+
+
+class Snapshot:
+    """Outcome of one fetch. `content` is the latest JPEG bytes we hold for
+    the camera (also on UNCHANGED, where it is the cached copy)."""
+
+    __slots__ = ("camera", "status", "content", "elapsed", "error")
+
+    def __init__(self, camera, status, content=None, elapsed=0.0, error=None):
+        self.camera, self.status, self.content = camera, status, content
+        self.elapsed, self.error = elapsed, error
+
+    def __repr__(self):
+        size = len(self.content) if self.content else 0
+        return f"Snapshot({self.camera!r}, {self.status}, {size}B, {self.elapsed*1000:.0f}ms)"
+
+
+class _CamState:
+    __slots__ = ("etag", "last_modified", "mtime", "content", "failures", "retry_at")
+
+    def __init__(self):
+        self.etag = self.last_modified = self.mtime = self.content = None
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class CameraFetcher:
+    """Fetch snapshots from many cameras concurrently.
+
+    Cameras are dicts with `id` and either `snapshot_url` or `snapshot_file`,
+    optionally `timeout` (seconds) and `auth` ([user, pass]). A camera that
+    fails is skipped for an exponentially growing, jittered interval so one
+    dead camera never holds up the rest.
+    """
+
+    def __init__(self, max_workers=16, pool_per_host=4, timeout=8.0,
+                 backoff_base=1.0, backoff_max=60.0):
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="capture")
+        self.pool_per_host = pool_per_host
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sessions = {}
+        self.state = {}
+        self.inflight = set()
+        self.lock = threading.Lock()
+
+    def session(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            s = self.sessions.get(host)
+            if s is None:
+                import requests  # not needed for snapshot_file cameras
+                from requests.adapters import HTTPAdapter
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_per_host)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                self.sessions[host] = s
+            return s
+
+    def _state(self, cam_id):
+        with self.lock:
+            return self.state.setdefault(cam_id, _CamState())
+
+    def fetch(self, cam):
+        """Fetch one camera, honouring its backoff window."""
+        cam_id = cam["id"]
+        st = self._state(cam_id)
+        t0 = time.monotonic()
+        if t0 < st.retry_at:
+            return Snapshot(cam_id, BACKOFF, st.content)
+        try:
+            if cam.get("snapshot_file"):
+                status = self._read_file(cam["snapshot_file"], st)
+            elif cam.get("snapshot_url"):
+                status = self._get(cam, st)
+            else:
+                raise RuntimeError("no snapshot_file or snapshot_url")
+        except Exception as e:
+            st.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (st.failures - 1))
+            st.retry_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+            return Snapshot(cam_id, ERROR, st.content, time.monotonic() - t0, e)
+        st.failures = 0
+        st.retry_at = 0.0
+        return Snapshot(cam_id, status, st.content, time.monotonic() - t0)
+
+    def _get(self, cam, st):
+        headers = {}
+        if st.etag:
+            headers["If-None-Match"] = st.etag
+        if st.last_modified:
+            headers["If-Modified-Since"] = st.last_modified
+        auth = tuple(cam["auth"]) if cam.get("auth") else None
+        url = cam["snapshot_url"]
+        r = self.session(url).get(url, headers=headers, auth=auth,
+                                  timeout=cam.get("timeout", self.timeout))
+        if r.status_code == 304 and st.content is not None:
+            return UNCHANGED
+        r.raise_for_status()
+        if not r.headers.get("content-type", "image").lower().startswith("image"):
+            raise RuntimeError(f"not an image: {r.headers.get('content-type')}")
+        st.etag = r.headers.get("ETag")
+        st.last_modified = r.headers.get("Last-Modified")
+        st.content = r.content
+        return NEW
+
+    def _read_file(self, path, st):
+        mtime = os.stat(path).st_mtime_ns
+        if mtime == st.mtime and st.content is not None:
+            return UNCHANGED
+        with open(path, "rb") as f:
+            st.content = f.read()
+        st.mtime = mtime
+        return NEW
+
+    def fetch_all(self, cams, on_result=None, timeout=None):
+        """Fetch every camera in parallel and return {camera id: Snapshot}.
+
+        `on_result(cam, snapshot)` runs on the worker thread as soon as that
+        camera finishes, so decoding can start before the slowest camera
+        answers. With `timeout`, stragglers are left running in the background
+        and reported as BUSY; they are not requested again until they finish.
+        """
+        def job(cam):
+            try:
+                snap = self.fetch(cam)
+                if on_result is not None:
+                    on_result(cam, snap)
+                return snap
+            finally:
+                with self.lock:
+                    self.inflight.discard(cam["id"])
+
+        futures = {}
+        for cam in cams:
+            with self.lock:
+                if cam["id"] in self.inflight:
+                    continue
+                self.inflight.add(cam["id"])
+            futures[cam["id"]] = self.pool.submit(job, cam)
+        wait(futures.values(), timeout=timeout)
+
+        out = {}
+        for cam in cams:
+            f = futures.get(cam["id"])
+            out[cam["id"]] = f.result() if f is not None and f.done() else Snapshot(cam["id"], BUSY)
+        return out
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        for s in self.sessions.values():
+            s.close()
+
+
+def read_snapshot(url=None, file=None, timeout=8.0):
+    """One-shot fetch for the single-camera scripts; returns JPEG bytes."""
+    snap = CameraFetcher(max_workers=1, timeout=timeout).fetch(
+        {"id": "once", "snapshot_url": url, "snapshot_file": file})
+    if snap.status == ERROR:
+        raise snap.error
+    return snap.content
+
+
+if __name__ == "__main__":
+    # python capture.py URL [URL ...]  -> fetch all twice and print timings
+    cams = [{"id": str(i), "snapshot_url": u} for i, u in enumerate(sys.argv[1:])]
+    fetcher = CameraFetcher()
+    for attempt in range(2):
+        t0 = time.monotonic()
+        snaps = fetcher.fetch_all(cams)
+        print(f"round {attempt + 1}: {len(cams)} cameras in {(time.monotonic() - t0)*1000:.0f}ms")
+        for s in snaps.values():
+            print("  ", s, s.error or "")
+    fetcher.close()
@@ -0,0 +1,312 @@
+# detector.py
+# Vehicle detector behind one interface, so the CPU-only edge nodes can run
+# an exported model under ONNX Runtime or OpenVINO instead of PyTorch.
+#
+#   model:
+#     backend: onnx        # torch (default) | onnx | openvino
+#     weights: yolov8n.pt  # .pt, .onnx, or an *_openvino_model directory
+#     int8: false          # quantized weights for onnx / openvino
+#     threads: 4           # CPU threads for onnx / openvino
+#     cache_dir: model_cache  # exported and fused models; null: next to the weights
+#
+# Built models are named after a hash of the .pt they came from, so new
+# weights under the same file name are exported again, and a run after the
+# first loads the built model as is.
+#
+# Every backend takes a list of BGR images and returns one (xyxy, conf)
+# pair per image, in that image's pixel coordinates, vehicles only.
+import os, sys, json, time, hashlib, argparse
+import numpy as np
+import cv2
+
+from occupancy import nms
+
+import settings  # puts backend/ on sys.path
+from metrics import span
+
+VEHICLES = [2, 3, 5, 7]  # COCO car, motorcycle, bus, truck
+CACHE_DIR = "model_cache"
+
+
+def letterbox(images, size):
+    """Resize each image into a size x size canvas, keeping aspect ratio.
+
+    Returns (NCHW float32 RGB batch in 0..1, per-image (scale, pad_x, pad_y)).
+    Same geometry as ultralytics' LetterBox with a fixed square shape.
+    """
+    batch = np.full((len(images), size, size, 3), 114, np.uint8)
+    meta = []
+    for i, img in enumerate(images):
+        h, w = img.shape[:2]
+        r = min(size / h, size / w)
+        nw, nh = int(round(w * r)), int(round(h * r))
+        px, py = (size - nw) / 2, (size - nh) / 2
+        left, top = int(round(px - 0.1)), int(round(py - 0.1))
+        if (nw, nh) != (w, h):
+            img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        batch[i, top:top + nh, left:left + nw] = img
+        meta.append((r, left, top))
+    x = batch[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+    return np.ascontiguousarray(x), meta
+
+
+def postprocess(out, meta, shapes, conf, classes, iou=0.7, max_det=300):
+    """Decode raw YOLOv8 output (B, 4 + classes, anchors) into boxes.
+
+    Boxes are filtered to `classes`, suppressed per class, and mapped back
+    through the letterbox onto the original image.
+    """
+    results = []
+    for pred, (r, left, top), shape in zip(out, meta, shapes):
+        pred = pred.T                            # (anchors, 4 + nc)
+        # like ultralytics: each anchor's best class, then the class filter
+        scores = pred[:, 4:]
+        cls = scores.argmax(1)
+        best = scores[np.arange(len(scores)), cls]
+        keep = (best > conf) & np.isin(cls, classes)
+        pred, best, cls = pred[keep], best[keep], cls[keep]
+        if not len(pred):
+            results.append((np.zeros((0, 4)), np.zeros(0)))
+            continue
+        cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+        xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], 1).astype(np.float64)
+        # per-class NMS in one pass: shift each class far away from the others
+        k = nms(xyxy + (cls * 7680.0)[:, None], best, iou)[:max_det]
+        xyxy, best = xyxy[k], best[k].astype(np.float64)
+        xyxy -= [left, top, left, top]
+        xyxy /= r
+        xyxy[:, 0::2] = xyxy[:, 0::2].clip(0, shape[1])
+        xyxy[:, 1::2] = xyxy[:, 1::2].clip(0, shape[0])
+        results.append((xyxy, best))
+    return results
+
+
+class TorchDetector:
+    """ultralytics YOLO in PyTorch, the reference the other backends match."""
+
+    def __init__(self, weights, conf=0.35, classes=VEHICLES, imgsz=640):
+        from ultralytics import YOLO
+        self.model = YOLO(weights)
+        self.conf, self.classes, self.imgsz = conf, list(classes), imgsz
+
+    def predict(self, images, imgsz=None):
+        with span("detector.torch"):
+            res = self.model.predict(list(images), conf=self.conf, classes=self.classes,
+                                     imgsz=imgsz or self.imgsz, verbose=False)
+        out = []
+        for r in res:
+            if r.boxes is None or len(r.boxes) == 0:
+                out.append((np.zeros((0, 4)), np.zeros(0)))
+            else:
+                out.append((r.boxes.xyxy.cpu().numpy()[:, :4].astype(np.float64),
+                            r.boxes.conf.cpu().numpy().astype(np.float64)))
+        return out
+
+
+class _ExportedDetector:
+    """Shared pre/post-processing for backends that run a raw YOLOv8 graph."""
+
+    def __init__(self, conf=0.35, classes=VEHICLES, imgsz=640):
+        self.conf, self.classes, self.imgsz = conf, list(classes), imgsz
+
+    def predict(self, images, imgsz=None):
+        if not len(images):
+            return []
+        with span("detector.letterbox"):
+            x, meta = letterbox(images, imgsz or self.imgsz)
+        with span("detector.model"):
+            out = self._run(x)
+        with span("detector.postprocess"):
+            return postprocess(out, meta, [im.shape for im in images], self.conf, self.classes)
+
+
+class OnnxDetector(_ExportedDetector):
+    def __init__(self, path, threads=None, **kw):
+        import onnxruntime as ort
+        super().__init__(**kw)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+
+    def _run(self, x):
+        return self.session.run(None, {self.input: x})[0]
+
+
+class OpenVinoDetector(_ExportedDetector):
+    def __init__(self, path, threads=None, **kw):
+        import openvino as ov
+        super().__init__(**kw)
+        if os.path.isdir(path):
+            path = next(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".xml"))
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = int(threads)
+        self.model = ov.Core().compile_model(path, "CPU", config)
+
+    def _run(self, x):
+        return self.model(x)[0]
+
+
+def weights_hash(weights, cache_dir):
+    """Short sha256 of a weights file, remembered in cache_dir per size and
+    mtime so an unchanged file is hashed once."""
+    st = os.stat(weights)
+    seen = os.path.join(cache_dir, "hashes.json")
+    try:
+        with open(seen, "r", encoding="utf-8") as f:
+            known = json.load(f)
+    except (OSError, ValueError):
+        known = {}
+    key = os.path.abspath(weights)
+    entry = known.get(key)
+    if entry and entry[:2] == [st.st_size, st.st_mtime_ns]:
+        return entry[2]
+    h = hashlib.sha256()
+    with open(weights, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    known[key] = [st.st_size, st.st_mtime_ns, h.hexdigest()[:16]]
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{seen}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(known, f)
+    os.replace(tmp, seen)
+    return known[key][2]
+
+
+def artifact(weights, suffix, cache_dir=CACHE_DIR):
+    """Where the model built from `weights` goes: <cache_dir>/<stem>-<hash><suffix>,
+    or <stem><suffix> next to the weights without a cache (or weights file,
+    which ultralytics then downloads)."""
+    stem = os.path.splitext(weights)[0]
+    if not cache_dir or not os.path.exists(weights):
+        return stem + suffix
+    return os.path.join(cache_dir, f"{os.path.basename(stem)}-{weights_hash(weights, cache_dir)}{suffix}")
+
+
+def fused(weights, cache_dir=CACHE_DIR):
+    """A .pt with Conv and BatchNorm already fused, which YOLO() loads as is
+    instead of fusing again on every start. Falls back to `weights`."""
+    if not cache_dir or not os.path.exists(weights):
+        return weights
+    path = artifact(weights, ".fused.pt", cache_dir)
+    if not os.path.exists(path):
+        try:
+            import torch
+            from ultralytics import YOLO
+            y = YOLO(weights)
+            y.model.fuse(verbose=False)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            torch.save({**y.ckpt, "model": y.model, "ema": None, "optimizer": None}, tmp)
+            os.replace(tmp, path)
+        except Exception as e:  # an older ultralytics; the plain weights still work
+            print(f"Could not cache fused weights ({e}); using {weights}")
+            return weights
+    return path
+
+
+def export(weights, backend, imgsz=640, int8=False, cache_dir=CACHE_DIR):
+    """Path of the exported model for a .pt file, exporting it on first use."""
+    if backend == "onnx":
+        path = artifact(weights, ".onnx", cache_dir)
+        if not os.path.exists(path):
+            from ultralytics import YOLO
+            out = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+            if os.path.normpath(out) != os.path.normpath(path):
+                os.replace(out, path)
+        if not int8:
+            return path
+        # dynamic quantization: INT8 weights, no calibration set needed
+        q = artifact(weights, ".int8.onnx", cache_dir)
+        if not os.path.exists(q):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(path, q, weight_type=QuantType.QUInt8)
+        return q
+    if backend == "openvino":
+        path = artifact(weights, "_int8_openvino_model" if int8 else "_openvino_model", cache_dir)
+        if not os.path.exists(path):
+            from ultralytics import YOLO
+            # export dir names differ between ultralytics versions; pin ours
+            out = YOLO(weights).export(format="openvino", imgsz=imgsz, dynamic=True, int8=int8)
+            if os.path.normpath(out) != os.path.normpath(path):
+                os.replace(out, path)
+        return path
+    raise ValueError(f"unknown backend {backend!r}")
+
+
+def load_detector(cfg):
+    """Detector for the `model:` section of config.yaml."""
+    m = cfg.get("model", {})
+    backend = m.get("backend", "torch")
+    weights = m.get("weights", "yolov8n.pt")
+    cache_dir = m.get("cache_dir", CACHE_DIR)
+    kw = {"conf": float(m.get("conf", 0.35)), "imgsz": int(m.get("imgsz", 640))}
+    if backend == "torch":
+        return TorchDetector(fused(weights, cache_dir) if weights.endswith(".pt") else weights, **kw)
+    if weights.endswith(".pt"):
+        weights = export(weights, backend, kw["imgsz"], bool(m.get("int8", False)), cache_dir)
+    if backend == "onnx":
+        return OnnxDetector(weights, threads=m.get("threads"), **kw)
+    if backend == "openvino":
+        return OpenVinoDetector(weights, threads=m.get("threads"), **kw)
+    raise ValueError(f"model.backend must be torch, onnx or openvino, not {backend!r}")
+
+
+def _match(a, b, iou=0.5):
+    """Greedy IoU matching of two box sets; returns [(i, j, iou), ...]."""
+    if not len(a) or not len(b):
+        return []
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), 2)
+    area = lambda x: (x[:, 2] - x[:, 0]) * (x[:, 3] - x[:, 1])
+    m = inter / (area(a)[:, None] + area(b)[None, :] - inter)
+    pairs = []
+    while m.size and m.max() > iou:
+        i, j = np.unravel_index(m.argmax(), m.shape)
+        pairs.append((i, j, m[i, j]))
+        m[i, :], m[:, j] = 0, 0
+    return pairs
+
+
+def parity(images, cfg, backend, runs=5):
+    """Compare a backend against PyTorch on the same images.
+
+    Prints per-frame latency for both and how well the boxes agree; returns
+    True if every PyTorch box has a match and no extra boxes appear.
+    """
+    ref = load_detector({"model": dict(cfg.get("model", {}), backend="torch")})
+    alt = load_detector({"model": dict(cfg.get("model", {}), backend=backend)})
+    ok = True
+    for name, det in (("torch", ref), (backend, alt)):
+        det.predict(images[:1])  # warm-up
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            for img in images:
+                det.predict([img])
+        print(f"{name:9s} {(time.perf_counter() - t0) / (runs * len(images)) * 1000:7.1f} ms/frame")
+    for k, (img, (rb, rc), (ab, ac)) in enumerate(zip(images, ref.predict(images), alt.predict(images))):
+        pairs = _match(rb, ab)
+        ious = [p[2] for p in pairs]
+        dconf = [abs(rc[i] - ac[j]) for i, j, _ in pairs]
+        print(f"image {k}: torch={len(rb)} {backend}={len(ab)} matched={len(pairs)}"
+              + (f" min_iou={min(ious):.3f} max_dconf={max(dconf):.3f}" if pairs else ""))
+        ok &= len(pairs) == len(rb) == len(ab)
+    return ok
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Check an exported backend against PyTorch.")
+    ap.add_argument("images", nargs="+", help="test frames (JPEG/PNG)")
+    ap.add_argument("--backend", default="onnx", choices=["onnx", "openvino"])
+    ap.add_argument("--int8", action="store_true")
+    ap.add_argument("--config", default=settings.CONFIG)
+    args = ap.parse_args()
+    cfg = settings.load(args.config)
+    if args.int8:
+        cfg.setdefault("model", {})["int8"] = True
+    images = [cv2.imread(p) for p in args.images]
+    sys.exit(0 if parity(images, cfg, args.backend) else 1)
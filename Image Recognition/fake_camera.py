@@ -0,0 +1,62 @@
+# fake_camera.py
+# Local stand-in for a wall of IP cameras, for trying capture.py without hardware.
+#   python fake_camera.py snap.jpg --cameras 24 --port 8090 --stall 3
+# serves http://127.0.0.1:8090/cam/<n>/snapshot.jpg with ETag/Last-Modified.
+# Every --change seconds the image "changes" (new ETag); the last --stall
+# cameras hang for 30 s to show that they don't delay the others.
+import sys, time, argparse
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+args = None
+jpeg = b""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like real cameras
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "cam" or not parts[1].isdigit():
+            self.send_error(404)
+            return
+        cam = int(parts[1])
+        if cam >= args.cameras - args.stall:
+            time.sleep(30)
+
+        epoch = int(time.time() // args.change)
+        etag = f'"{cam}-{epoch}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(jpeg)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(epoch * args.change, usegmt=True))
+        self.end_headers()
+        self.wfile.write(jpeg)
+
+    def log_message(self, *a):
+        pass
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("image")
+    p.add_argument("--cameras", type=int, default=24)
+    p.add_argument("--port", type=int, default=8090)
+    p.add_argument("--change", type=float, default=10.0, help="seconds between new frames")
+    p.add_argument("--stall", type=int, default=0, help="number of cameras that hang")
+    args = p.parse_args()
+    with open(args.image, "rb") as f:
+        jpeg = f.read()
+    print(f"{args.cameras} cameras on http://127.0.0.1:{args.port}/cam/<0..{args.cameras-1}>/snapshot.jpg")
+    try:
+        ThreadingHTTPServer(("127.0.0.1", args.port), Handler).serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,111 @@
+# frames.py
+# Frame handling for the capture path that avoids touching pixels twice:
+# store the camera's own JPEG when nothing needs changing, decode at reduced
+# size when the detector only needs a small image, and rotate into buffers
+# that are reused from frame to frame.
+import os, struct, threading
+import numpy as np
+import cv2
+
+ROTATIONS = {
+    "cw90": cv2.ROTATE_90_CLOCKWISE,
+    "ccw90": cv2.ROTATE_90_COUNTERCLOCKWISE,
+    "180": cv2.ROTATE_180,
+}
+
+# libjpeg scales by 1/2, 1/4, 1/8 during the IDCT, far cheaper than a full
+# decode followed by a resize
+REDUCED = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+           4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def is_jpeg(content):
+    return content[:2] == b"\xff\xd8"
+
+
+def jpeg_size(content):
+    """(width, height) from the JPEG's SOF header, or None; no decoding."""
+    i, n = 2, len(content)
+    while i + 9 < n:
+        if content[i] != 0xFF:
+            return None
+        marker = content[i + 1]
+        if marker == 0xFF:      # fill byte
+            i += 1
+            continue
+        length = struct.unpack(">H", content[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h, w = struct.unpack(">HH", content[i + 5:i + 9])
+            return w, h
+        i += 2 + length
+    return None
+
+
+def reduction(content, min_side):
+    """Largest IMREAD_REDUCED factor that keeps the long side >= min_side."""
+    size = jpeg_size(content) if is_jpeg(content) else None
+    if not size or not min_side:
+        return 1
+    for f in (8, 4, 2):
+        if max(size) / f >= min_side:
+            return f
+    return 1
+
+
+def decode(content, scale=1):
+    """Decode JPEG bytes, optionally at 1/scale size; None if it fails."""
+    return cv2.imdecode(np.frombuffer(content, np.uint8), REDUCED.get(scale, cv2.IMREAD_COLOR))
+
+
+def rotate(img, how, dst=None):
+    code = ROTATIONS.get(how)
+    if code is None:
+        return img
+    return cv2.rotate(img, code, dst=dst)
+
+
+class Rotator:
+    """Rotates into one preallocated buffer per thread and frame shape.
+
+    The result is overwritten by the same thread's next call, so use it for
+    frames consumed right away (re-encoding); frames handed on to another
+    stage need their own array from rotate().
+    """
+
+    def __init__(self, how):
+        self.how = how
+        self.local = threading.local()
+
+    def __call__(self, img):
+        if self.how not in ROTATIONS:
+            return img
+        h, w = img.shape[:2]
+        shape = (h, w) if self.how == "180" else (w, h)
+        shape += img.shape[2:]
+        buf = getattr(self.local, "buf", None)
+        if buf is None or buf.shape != shape or buf.dtype != img.dtype:
+            buf = self.local.buf = np.empty(shape, img.dtype)
+        return rotate(img, self.how, dst=buf)
+
+
+def write_file(path, data):
+    """Write bytes, or any buffer (e.g. cv2.imencode output), without tobytes()."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(memoryview(data))
+    os.replace(tmp, path)
+
+
+def link_latest(src, latest):
+    """Point `latest` at an already written file: a hard link, no second copy.
+    Falls back to copying where links are not supported."""
+    tmp = latest + ".tmp"
+    try:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.link(src, tmp)
+    except OSError:
+        with open(src, "rb") as f:
+            write_file(latest, f.read())
+        return
+    os.replace(tmp, latest)
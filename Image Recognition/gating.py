@@ -0,0 +1,115 @@
+# gating.py
+# Cheap pre-filter in front of YOLO: compare each spot's crop with the crop
+# seen at the last inference and skip the model when nothing moved.
+import os, json, time
+import numpy as np
+import cv2
+
+C1 = (0.01 * 255) ** 2
+C2 = (0.03 * 255) ** 2
+
+
+def _box_sum(a, k):
+    """Sum over every k x k window of each image in a (N, h, w) stack."""
+    s = np.zeros((a.shape[0], a.shape[1] + 1, a.shape[2] + 1), np.float64)
+    s[:, 1:, 1:] = a.cumsum(1).cumsum(2)
+    return s[:, k:, k:] - s[:, :-k, k:] - s[:, k:, :-k] + s[:, :-k, :-k]
+
+def ssim(a, b, win=7):
+    """Mean SSIM of each pair of crops in two (N, h, w) stacks, as (N,)."""
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    n = win * win
+    mu_a, mu_b = _box_sum(a, win) / n, _box_sum(b, win) / n
+    var_a = _box_sum(a * a, win) / n - mu_a ** 2
+    var_b = _box_sum(b * b, win) / n - mu_b ** 2
+    cov = _box_sum(a * b, win) / n - mu_a * mu_b
+    s = ((2 * mu_a * mu_b + C1) * (2 * cov + C2)) / \
+        ((mu_a ** 2 + mu_b ** 2 + C1) * (var_a + var_b + C2))
+    return s.reshape(len(s), -1).mean(1)
+
+
+class ChangeGate:
+    """Tracks, per spot, the crop that the current verdict was based on.
+
+    Crops are the spot's bounding box in grayscale, resized to size x size.
+    A spot counts as changed when its SSIM against that reference drops under
+    `threshold`, or when the reference is older than `max_age` seconds (slow
+    lighting drift should not pin a stale verdict forever).
+    """
+
+    def __init__(self, spots, threshold=0.88, size=32, max_age=600.0, empty_image=None):
+        self.bounds = np.round(spots.bounds).astype(int)
+        self.threshold = threshold
+        self.size = size
+        self.max_age = max_age
+        self.ref = None
+        self.stamp = np.full(len(spots), -np.inf)
+        self.empty = None
+        if empty_image is not None:
+            self.empty = self.crops(empty_image)
+
+    @classmethod
+    def from_config(cls, cfg, spots):
+        s = cfg.get("spot", {})
+        empty = None
+        path = s.get("empty_image")
+        if path and os.path.exists(path):
+            empty = cv2.imread(path)
+        return cls(spots, threshold=float(s.get("ssim_threshold", 0.88)),
+                   size=int(s.get("gate_size", 32)),
+                   max_age=float(s.get("max_skip_sec", 600)), empty_image=empty)
+
+    def crops(self, frame, scale=1):
+        """Each spot's crop, resized to size x size grayscale. `scale` is how
+        many full-frame pixels one pixel of `frame` stands for (reduced decode)."""
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        bounds = self.bounds if scale == 1 else (self.bounds // scale)
+        out = np.zeros((len(bounds), self.size, self.size), np.uint8)
+        for i, (x1, y1, x2, y2) in enumerate(bounds):
+            roi = gray[max(y1, 0):min(max(y2, y1 + 1), h), max(x1, 0):min(max(x2, x1 + 1), w)]
+            if roi.size:
+                out[i] = cv2.resize(roi, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        return out
+
+    def changed(self, crops, now=None):
+        """Mask of spots whose crop differs from the one last accepted."""
+        now = time.time() if now is None else now
+        if self.ref is None or self.ref.shape != crops.shape:
+            return np.ones(len(crops), bool)
+        return (ssim(crops, self.ref) < self.threshold) | (now - self.stamp > self.max_age)
+
+    def matches_empty(self, crops):
+        """Mask of spots that look like the configured empty-lot image."""
+        if self.empty is None or self.empty.shape != crops.shape:
+            return np.zeros(len(crops), bool)
+        return ssim(crops, self.empty) >= self.threshold
+
+    def accept(self, crops, now=None, mask=None):
+        """Record crops as the new reference for the spots in mask (default all)."""
+        now = time.time() if now is None else now
+        if self.ref is None or self.ref.shape != crops.shape:
+            self.ref = crops.copy()
+            self.stamp[:] = now
+            return
+        mask = slice(None) if mask is None else mask
+        self.ref[mask] = crops[mask]
+        self.stamp[mask] = now
+
+    # One-shot scripts keep the references between runs in a small .npz.
+    def save(self, path, results):
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(tmp, ref=self.ref, stamp=self.stamp,
+                            results=np.array(json.dumps(results)))
+        os.replace(tmp, path)
+
+    def load(self, path):
+        """Restore references from save(); returns the saved results or None."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as z:
+            if z["stamp"].shape != self.stamp.shape:
+                return None
+            self.ref, self.stamp = z["ref"], z["stamp"]
+            return json.loads(str(z["results"]))
@@ -0,0 +1,208 @@
+# homography.py
+# Camera calibration against the map: a homography fitted to a few pixel <->
+# lat/lon control points projects every map space of a lot into the image.
+# The projected stalls become the camera's SpotSet, so no ROI has to be
+# drawn per stall, and each run writes its verdicts straight into the lot
+# pack (lots.bin) that api.py and map.py serve.
+#
+#   calibration:
+#     lots_file: ../backend/lots.bin
+#     lot: Stadium Parking Lot      # default: every lot in the pack
+#     image_size: [1920, 1080]      # frame size the pixels refer to
+#     min_visible: 0.5              # share of a stall that must be in frame
+#     points:                       # 4 or more, not all on one line
+#       - {pixel: [412, 880], latlon: [38.030907, -78.511921]}
+#       - ...
+import os, threading, argparse
+import numpy as np
+import cv2
+
+from occupancy import SpotSet
+
+import settings  # puts backend/ on sys.path
+import lotpack
+
+# meters per degree, as in backend/spatial.py
+M_PER_DEG_LAT = 110540.0
+M_PER_DEG_LON = 111320.0
+
+# one writer at a time per pack, across the cameras of this process
+_pack_locks = {}
+
+
+class Calibration:
+    """Homography from ground-plane lat/lon to image pixels.
+
+    Lat/lon are first put on a local metric plane around the control points,
+    which keeps the fit well conditioned (raw degrees differ by ~1e-5).
+    """
+
+    def __init__(self, H, origin):
+        self.H = np.asarray(H, np.float64)
+        self.origin = np.asarray(origin, np.float64)  # (lat, lon) of the plane origin
+
+    @classmethod
+    def fit(cls, pixels, latlon):
+        pixels = np.asarray(pixels, np.float64).reshape(-1, 2)
+        latlon = np.asarray(latlon, np.float64).reshape(-1, 2)
+        if len(pixels) < 4 or len(pixels) != len(latlon):
+            raise ValueError("calibration needs 4 or more pixel <-> lat/lon pairs")
+        cal = cls(np.eye(3), latlon.mean(0))
+        H, _ = cv2.findHomography(cal.plane(latlon), pixels, 0)
+        if H is None:
+            raise ValueError("calibration points are degenerate (3 or more on one line?)")
+        cal.H = H
+        return cal
+
+    @classmethod
+    def from_config(cls, c):
+        pts = c.get("points") or []
+        return cls.fit([p["pixel"] for p in pts], [p["latlon"] for p in pts])
+
+    def plane(self, latlon):
+        """Lat/lon -> meters east/north of the origin."""
+        latlon = np.asarray(latlon, np.float64)
+        lat0, lon0 = self.origin
+        x = (latlon[..., 1] - lon0) * M_PER_DEG_LON * np.cos(np.radians(lat0))
+        y = (latlon[..., 0] - lat0) * M_PER_DEG_LAT
+        return np.stack([x, y], -1)
+
+    def project(self, latlon):
+        """(pixels, w) for any (..., 2) lat/lon; w <= 0 means behind the camera."""
+        p = self.plane(latlon)
+        q = p @ self.H[:, :2].T + self.H[:, 2]
+        w = q[..., 2]
+        return q[..., :2] / np.where(np.abs(w) < 1e-12, 1e-12, w)[..., None], w
+
+    def error(self, pixels, latlon):
+        """Reprojection error per control point, in pixels."""
+        return np.linalg.norm(self.project(latlon)[0] - np.asarray(pixels, np.float64), axis=-1)
+
+
+def visible_share(polys, size):
+    """Share of each (N, C, 2) pixel polygon's area inside a w x h frame."""
+    w, h = size
+    frame = np.array([[0, 0], [w, 0], [w, h], [0, h]], np.float32)
+    out = np.zeros(len(polys))
+    for i, p in enumerate(polys.astype(np.float32)):
+        area = abs(cv2.contourArea(p))
+        if area > 0:
+            inside, _ = cv2.intersectConvexConvex(p, frame)
+            out[i] = inside / area
+    return out
+
+
+class MappedSpaces:
+    """The map spaces one camera sees, as a SpotSet over their projected
+    stalls, plus where each sits in the lot pack.
+
+    Spot ids are the space ids of the pack; with more than one lot they are
+    "<lot name>/<space id>".
+    """
+
+    def __init__(self, calibration, lots_file, lot=None, image_size=None,
+                 min_visible=0.5, threshold=0.12):
+        self.calibration = calibration
+        self.lots_file = lots_file
+        self.lot = lot
+        self.image_size = image_size
+        self.min_visible = min_visible
+        self.threshold = threshold
+        self.pack = lotpack.LotPack(lots_file)
+        self.geometry_id = None
+        self.index = np.zeros(0, np.int64)  # pack index of each spot
+        self.spots = SpotSet([])
+        self.refresh()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """MappedSpaces for the `calibration:` section of cfg (a camera entry
+        or the whole config), or None if there is none."""
+        c = cfg.get("calibration")
+        if not c:
+            return None
+        thr = float(cfg.get("spot", {}).get("overlap_threshold", 0.12))
+        return cls(Calibration.from_config(c), c.get("lots_file", "../backend/lots.bin"),
+                   lot=c.get("lot"), image_size=c.get("image_size"),
+                   min_visible=float(c.get("min_visible", 0.5)), threshold=thr)
+
+    def refresh(self):
+        """Re-project if the pack's geometry changed. Returns True if it did."""
+        self.pack.refresh()
+        if self.pack.geometry_id == self.geometry_id:
+            return False
+        lots, ids = self.pack.index["lots"], self.pack.index["ids"]
+        starts = np.cumsum([0] + [l["count"] for l in lots])
+        chosen = [i for i, l in enumerate(lots) if self.lot is None or l["name"] == self.lot]
+        if not chosen:
+            raise ValueError(f"{self.lots_file} has no lot named {self.lot!r}")
+        index = np.concatenate([np.arange(starts[i], starts[i + 1]) for i in chosen])
+
+        # every stall in one transform; keep those fully in front of the camera
+        # and mostly inside the frame
+        pixels, w = self.calibration.project(np.asarray(self.pack.spaces[index]))
+        keep = (w > 0).all(1)
+        if self.image_size:
+            keep &= visible_share(pixels, self.image_size) >= self.min_visible
+        index = index[keep]
+
+        lot_of = np.searchsorted(starts, index, side="right") - 1
+        sids = [ids[i] if ids is not None else int(i - starts[l]) for i, l in zip(index, lot_of)]
+        if len(chosen) > 1:
+            sids = [f"{lots[l]['name']}/{s}" for s, l in zip(sids, lot_of)]
+        self.spots = SpotSet(list(pixels[keep]), ids=sids, thresholds=self.threshold)
+        self.index = index
+        self.geometry_id = self.pack.geometry_id
+        print(f"calibration: {len(index)} map spaces in view ({self.lots_file})")
+        return True
+
+    def write(self, occupied):
+        """Set the mapped spaces' occupancy in the pack, leaving every other
+        space as it is. Returns the version written, or None if nothing
+        changed or the geometry moved on since the last refresh()."""
+        path = os.path.abspath(self.lots_file)
+        with _pack_locks.setdefault(path, threading.Lock()):
+            self.pack.refresh()
+            if self.pack.geometry_id != self.geometry_id:
+                return None
+            occ = self.pack.occupied.copy()
+            occ[self.index] = np.asarray(occupied, bool)
+            if np.array_equal(occ, self.pack.occupied):
+                return None
+            return lotpack.write(self.lots_file, self.pack.spaces, occ, self.pack.index)
+
+
+if __name__ == "__main__":
+    # python homography.py snap.jpg: control point errors, and the projected
+    # stalls drawn over the image to check the fit by eye
+    ap = argparse.ArgumentParser(description="Check a camera calibration against an image.")
+    ap.add_argument("image")
+    ap.add_argument("--config", default=settings.CONFIG)
+    ap.add_argument("--camera", help="id of a cameras: entry (default: top-level calibration)")
+    ap.add_argument("--out", default="calibration_check.jpg")
+    args = ap.parse_args()
+
+    cfg = settings.load(args.config)
+    if args.camera is not None:
+        cfg = next(c for i, c in enumerate(cfg.get("cameras") or []) if str(c.get("id", i)) == args.camera)
+    img = cv2.imread(args.image)
+    if img is None:
+        raise SystemExit(f"Cannot read {args.image}")
+    c = dict(cfg["calibration"], image_size=[img.shape[1], img.shape[0]])
+    mapped = MappedSpaces.from_config({**cfg, "calibration": c})
+
+    pts = c["points"]
+    err = mapped.calibration.error([p["pixel"] for p in pts], [p["latlon"] for p in pts])
+    for p, e in zip(pts, err):
+        print(f"  {p['pixel']} <- {p['latlon']}: {e:.1f} px")
+    print(f"mean reprojection error {err.mean():.1f} px")
+
+    for poly, sid in zip(mapped.spots.polygons, mapped.spots.ids):
+        pts_i = poly.round().astype(np.int32)
+        cv2.polylines(img, [pts_i], True, (0, 200, 255), 1)
+        x, y = pts_i.mean(0)
+        cv2.putText(img, str(sid), (int(x), int(y)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 200, 255), 1, cv2.LINE_AA)
+    for p in pts:
+        cv2.circle(img, tuple(int(v) for v in p["pixel"]), 5, (0, 0, 255), -1)
+    cv2.imwrite(args.out, img)
+    print(f"Wrote {args.out}")
@@ -0,0 +1,159 @@
+# occupancy.py
+import numpy as np
+import cv2
+
+# Each spot mask is rasterized on a grid of at most GRID x GRID cells, so a
+# camera with 60 large stalls still only needs a few hundred KB of tables.
+GRID = 64
+
+
+def spots_from_config(cfg):
+    """Return (ids, polygons, thresholds) for every spot configured in cfg.
+
+    Spots come from the `spots:` list (each with `points` or `box`); a lone
+    legacy `spot.box` is treated as a one-spot list.
+    """
+    default_thr = float(cfg.get("spot", {}).get("overlap_threshold", 0.12))
+    ids, polys, thrs = [], [], []
+    for i, s in enumerate(cfg.get("spots") or []):
+        if "points" in s:
+            pts = s["points"]
+        elif "box" in s:
+            b = s["box"]
+            pts = [[b["x"], b["y"]], [b["x"] + b["w"], b["y"]],
+                   [b["x"] + b["w"], b["y"] + b["h"]], [b["x"], b["y"] + b["h"]]]
+        else:
+            raise ValueError(f"spots[{i}] needs either 'points' or 'box'")
+        ids.append(s.get("id", i))
+        polys.append(pts)
+        thrs.append(float(s.get("overlap_threshold", default_thr)))
+
+    if not polys and cfg.get("spot", {}).get("box"):
+        b = cfg["spot"]["box"]
+        ids.append(0)
+        polys.append([[b["x"], b["y"]], [b["x"] + b["w"], b["y"]],
+                      [b["x"] + b["w"], b["y"] + b["h"]], [b["x"], b["y"] + b["h"]]])
+        thrs.append(default_thr)
+    return ids, polys, thrs
+
+
+def nms(xyxy, scores, iou=0.5, contained=None):
+    """Greedy class-agnostic non-maximum suppression; returns kept indices.
+
+    With `contained`, a box is also dropped when that share of its own area
+    lies inside a stronger box (fragments of one car cut at a tile edge).
+    """
+    xyxy = np.asarray(xyxy, np.float64).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores, np.float64).reshape(-1), kind="stable")
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        w = np.clip(np.minimum(xyxy[i, 2], xyxy[rest, 2]) - np.maximum(xyxy[i, 0], xyxy[rest, 0]), 0, None)
+        h = np.clip(np.minimum(xyxy[i, 3], xyxy[rest, 3]) - np.maximum(xyxy[i, 1], xyxy[rest, 1]), 0, None)
+        inter = w * h
+        drop = inter / np.maximum(area[i] + area[rest] - inter, 1e-9) > iou
+        if contained is not None:
+            drop |= inter / np.maximum(area[rest], 1e-9) > contained
+        order = rest[~drop]
+    return np.array(keep, np.int64)
+
+
+class SpotSet:
+    """N spot polygons with precomputed masks, scored against M boxes at once.
+
+    Every polygon is rasterized once into a summed-area table over its own
+    bounding box. Counting how many mask cells fall inside a detection box is
+    then four table lookups, which NumPy does for all N x M pairs in one go.
+    """
+
+    def __init__(self, polygons, ids=None, thresholds=0.12, grid=GRID):
+        self.polygons = [np.asarray(p, np.float64).reshape(-1, 2) for p in polygons]
+        n = len(self.polygons)
+        self.ids = list(ids) if ids is not None else list(range(n))
+        self.thresholds = np.broadcast_to(np.asarray(thresholds, np.float64), (n,)).copy()
+
+        lo = np.array([p.min(0) for p in self.polygons]).reshape(n, 2)
+        hi = np.array([p.max(0) for p in self.polygons]).reshape(n, 2)
+        self.origin = np.floor(lo)
+        extent = np.maximum(np.ceil(hi) - self.origin, 1)
+        # pixels per grid cell, per spot (1 for small spots)
+        self.cell = np.maximum(np.ceil(extent.max(1) / grid), 1)
+        self.shape = np.ceil(extent / self.cell[:, None]).astype(np.int64)  # (w, h)
+
+        gw, gh = (self.shape.max(0) if n else (1, 1))
+        self.sat = np.zeros((n, gh + 1, gw + 1), np.int32)
+        for i, p in enumerate(self.polygons):
+            w, h = self.shape[i]
+            mask = np.zeros((h, w), np.uint8)
+            local = (p - self.origin[i]) / self.cell[i]
+            # fillPoly works in integer coords; shift keeps sub-cell precision
+            cv2.fillPoly(mask, [np.round(local * 16).astype(np.int32)], 1, shift=4)
+            self.sat[i, 1:h + 1, 1:w + 1] = mask.cumsum(0, dtype=np.int32).cumsum(1, dtype=np.int32)
+
+        self.cells = self.sat[np.arange(n), self.shape[:, 1], self.shape[:, 0]].astype(np.float64)
+        self.area = self.cells * self.cell ** 2
+        self.bounds = np.concatenate([lo, hi], 1)  # (N, 4) xyxy
+
+    @classmethod
+    def from_config(cls, cfg):
+        ids, polys, thrs = spots_from_config(cfg)
+        return cls(polys, ids=ids, thresholds=thrs)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def overlap(self, xyxy):
+        """Return (coverage, iou), both (N, M): share of each spot covered by each box."""
+        xyxy = np.asarray(xyxy, np.float64).reshape(-1, 4)
+        n, m = len(self), len(xyxy)
+        if n == 0 or m == 0:
+            return np.zeros((n, m)), np.zeros((n, m))
+
+        ox, oy = self.origin[:, 0:1], self.origin[:, 1:2]
+        c = self.cell[:, None]
+        w, h = self.shape[:, 0:1], self.shape[:, 1:2]
+        x1 = np.clip(np.round((xyxy[None, :, 0] - ox) / c), 0, w).astype(np.int64)
+        x2 = np.clip(np.round((xyxy[None, :, 2] - ox) / c), 0, w).astype(np.int64)
+        y1 = np.clip(np.round((xyxy[None, :, 1] - oy) / c), 0, h).astype(np.int64)
+        y2 = np.clip(np.round((xyxy[None, :, 3] - oy) / c), 0, h).astype(np.int64)
+
+        i = np.arange(n)[:, None]
+        s = self.sat
+        inside = (s[i, y2, x2] - s[i, y1, x2] - s[i, y2, x1] + s[i, y1, x1]).astype(np.float64)
+
+        coverage = inside / np.maximum(self.cells[:, None], 1)
+        inter = inside * self.cell[:, None] ** 2
+        det_area = ((xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1]))[None, :]
+        iou = inter / np.maximum(self.area[:, None] + det_area - inter, 1e-9)
+        return coverage, iou
+
+    def occupancy(self, xyxy, conf=None):
+        """Score every spot against every detection.
+
+        Returns (occupied, score, confidence), each of length N. `score` is the
+        best coverage of the spot by any box; `confidence` is the detector
+        confidence of the strongest box over the threshold for occupied spots,
+        and how clearly every box stays under the threshold for free ones.
+        """
+        xyxy = np.asarray(xyxy, np.float64).reshape(-1, 4)
+        conf = np.ones(len(xyxy)) if conf is None else np.asarray(conf, np.float64).reshape(-1)
+        cov, _ = self.overlap(xyxy)
+        n = len(self)
+        if cov.shape[1] == 0:
+            return np.zeros(n, bool), np.zeros(n), np.ones(n)
+
+        thr = self.thresholds[:, None]
+        score = cov.max(1)
+        occupied = score > self.thresholds
+        hit_conf = np.where(cov > thr, conf[None, :], 0.0).max(1)
+        support = (conf[None, :] * np.minimum(cov / np.maximum(thr, 1e-9), 1.0)).max(1)
+        confidence = np.where(occupied, hit_conf, 1.0 - support)
+        return occupied, score, confidence
+
+    def results(self, occupied, score, confidence):
+        """Per-spot dicts in config order, ready for JSON."""
+        return [{"id": sid, "occupied": bool(o), "score": round(float(s), 4),
+                 "confidence": round(float(c), 4)}
+                for sid, o, s, c in zip(self.ids, occupied, score, confidence)]
@@ -0,0 +1,136 @@
+# pipeline.py
+# Small staged pipeline for the capture scripts: each stage has its own
+# worker thread(s) and a bounded input queue that drops the oldest item when
+# full, so a slow stage sheds stale frames instead of stalling the others.
+import time, queue, threading, traceback
+
+from stats import StageStats
+
+import settings  # puts backend/ on sys.path
+from metrics import counter, gauge
+
+DROPPED = counter("frames_dropped_total", "Items dropped from a full queue", ["stage"])
+ERRORS = counter("stage_errors_total", "Items a stage failed on (fetch errors, decode failures, ...)", ["stage"])
+QUEUE_DEPTH = gauge("queue_depth", "Items waiting in a stage's queue", ["stage"])
+
+
+class Stage:
+    """One step of a pipeline: fn(item) -> item for the next stage, or None.
+
+    `workers` > 1 makes the stage a thread pool; that pays off for OpenCV
+    decode/encode, which release the GIL. Items may then finish out of order.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=4):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next = None
+        self.drops = 0
+        self.done = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        QUEUE_DEPTH.labels(name).set_function(self.queue.qsize)
+
+    def put(self, item):
+        """Enqueue, dropping the oldest waiting item if the queue is full."""
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    with self.lock:
+                        self.drops += 1
+                    DROPPED.labels(self.name).inc()
+                except queue.Empty:
+                    pass
+
+    def run(self, stats, stop):
+        while not stop.is_set():
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                with stats.timer(self.name):
+                    out = self.fn(item)
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                ERRORS.labels(self.name).inc()
+                print(f"{self.name} error: {e}", flush=True)
+                traceback.print_exc(limit=1)
+                continue
+            with self.lock:
+                self.done += 1
+            if self.next is None:
+                stats.count(1)
+            elif out is not None:
+                self.next.put(out)
+
+
+class Pipeline:
+    """Stages chained in order, fed by submit() or a fixed-rate schedule."""
+
+    def __init__(self, *stages, stats=None):
+        self.stages = list(stages)
+        for a, b in zip(self.stages, self.stages[1:]):
+            a.next = b
+        self.stats = stats or StageStats()
+        self.stop = threading.Event()
+        self.ticks = 0
+        self.missed = 0
+
+    def start(self):
+        for s in self.stages:
+            for i in range(s.workers):
+                threading.Thread(target=s.run, args=(self.stats, self.stop),
+                                 name=f"{s.name}-{i}", daemon=True).start()
+        return self
+
+    def submit(self, item):
+        self.stages[0].put(item)
+
+    def every(self, interval, make_item=time.time):
+        """Submit make_item() every `interval` seconds until stopped.
+
+        Ticks are on a fixed grid from the start time, so the period does not
+        drift by however long the stages take. If the scheduler itself falls
+        behind (machine suspended, clock jump) missed ticks are skipped, not
+        replayed in a burst.
+        """
+        start = time.monotonic()
+        k = 0
+        while not self.stop.is_set():
+            self.submit(make_item())
+            self.ticks += 1
+            k += 1
+            now = time.monotonic()
+            behind = int((now - start) / interval) - k
+            if behind > 0:
+                self.missed += behind
+                k += behind
+            self.stop.wait(max(start + k * interval - now, 0))
+
+    def log_every(self, seconds=60):
+        """Print report() from a daemon thread every `seconds`."""
+        def run():
+            while not self.stop.wait(seconds):
+                print(self.report(), flush=True)
+        threading.Thread(target=run, name="pipeline-report", daemon=True).start()
+
+    def close(self):
+        self.stop.set()
+
+    def report(self):
+        """Per-stage queue depth, drops and errors, then the latency stats."""
+        parts = []
+        for s in self.stages:
+            parts.append(f"{s.name} q={s.queue.qsize()}/{s.queue.maxsize} "
+                         f"done={s.done} drop={s.drops} err={s.errors}")
+        if self.missed:
+            parts.append(f"missed_ticks={self.missed}")
+        return " | ".join(parts) + " || " + self.stats.report()
@@ -1,11 +1,14 @@
 # save_snapshots.py
 import os
-import time
 import requests
-import numpy as np
 import cv2
 from datetime import datetime
 
+from archive import Archive
+from frames import Rotator, decode, is_jpeg, write_file
+from pipeline import Pipeline, Stage
+from metrics import counter, serve as serve_metrics  # backend/metrics.py (on sys.path via settings)
+
 # ====== CONFIG ======
 SNAP_URL = "http://atharva-2.local:8081"  # put your working URL (add USER:PASS if needed)
 OUT_DIR = "snaps"                  # base folder for images
@@ -14,60 +17,82 @@ MAKE_DAILY_SUBFOLDERS = True       # True -> snaps/2025-10-10/snap_*.jpg
 ROTATE = None                      # None | "cw90" | "ccw90" | "180"
 TIMEOUT_SEC = 6                    # HTTP timeout in seconds
 JPEG_QUALITY = 90                  # 0..100
+ARCHIVE_DIR = None                 # e.g. "archive": hourly SQLite segments instead of snap_*.jpg
+ARCHIVE_MAX_GB = 20                # oldest hours are dropped past this
+ARCHIVE_MAX_DAYS = 30
+METRICS_PORT = None                # e.g. 9101: /metrics and /trace over HTTP
 # =====================
 
 def ensure_dir(path: str) -> str:
     os.makedirs(path, exist_ok=True)
     return path
 
-def rotate_if_needed(img):
-    if ROTATE == "cw90":
-        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-    if ROTATE == "ccw90":
-        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-    if ROTATE == "180":
-        return cv2.rotate(img, cv2.ROTATE_180)
-    return img
+ROTATOR = Rotator(ROTATE)  # reuses one buffer per thread
+SAVED = counter("snapshots_saved_total", "Snapshots written to disk or the archive")
+SAVED_BYTES = counter("snapshots_saved_bytes_total", "Bytes of snapshots written")
 
-def save_snapshot_once():
-    # choose output folder
-    sub = datetime.now().strftime("%Y-%m-%d") if MAKE_DAILY_SUBFOLDERS else ""
-    folder = ensure_dir(os.path.join(OUT_DIR, sub) if sub else OUT_DIR)
+ARCHIVE = Archive(ARCHIVE_DIR, max_bytes=int(ARCHIVE_MAX_GB * 1e9),
+                  max_age=ARCHIVE_MAX_DAYS * 86400) if ARCHIVE_DIR else None
 
-    # fetch snapshot
+def fetch(_tick=None):
     r = requests.get(SNAP_URL, timeout=TIMEOUT_SEC)
     r.raise_for_status()
-    img = cv2.imdecode(np.frombuffer(r.content, np.uint8), cv2.IMREAD_COLOR)
+    return r.content
+
+def encode(content):
+    """JPEG bytes to store: the camera's own when nothing needs changing,
+    otherwise decoded, rotated and re-encoded."""
+    if ROTATE is None and is_jpeg(content):
+        return content
+    img = decode(content)
     if img is None:
         raise RuntimeError("Snapshot did not decode as an image")
+    ok, buf = cv2.imencode(".jpg", ROTATOR(img), [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+    if not ok:
+        raise RuntimeError("JPEG encode failed")
+    return buf
 
-    img = rotate_if_needed(img)
+def save(data):
+    if ARCHIVE:
+        ARCHIVE.add_frame("snap", data)
+        SAVED.inc()
+        SAVED_BYTES.inc(len(data))
+        print("Archived", len(data), "bytes")
+        return ARCHIVE_DIR
+
+    # choose output folder
+    sub = datetime.now().strftime("%Y-%m-%d") if MAKE_DAILY_SUBFOLDERS else ""
+    folder = ensure_dir(os.path.join(OUT_DIR, sub) if sub else OUT_DIR)
 
     # unique filename (millisecond precision)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
     path = os.path.join(folder, f"snap_{ts}.jpg")
-
-    # write (fixed: encode as JPG, then write bytes)
-    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-    if not ok:
-        raise RuntimeError("JPEG encode failed")
-    with open(path, "wb") as f:
-        f.write(buf.tobytes())
+    write_file(path, data)
+    SAVED.inc()
+    SAVED_BYTES.inc(len(data))
 
     print("Saved", path)
     return path
 
+def save_snapshot_once():
+    return save(encode(fetch()))
+
 def main():
+    # fetch -> decode/rotate/encode -> write, each stage on its own
+    # thread(s), so a slow camera or disk no longer pushes the next capture back
+    pipe = Pipeline(Stage("fetch", fetch, queue_size=2),
+                    Stage("encode", encode, workers=2, queue_size=2),
+                    Stage("save", save, workers=2, queue_size=2)).start()
     print(f"Saving every {INTERVAL_SEC}s to '{OUT_DIR}' (Ctrl+C to stop)")
-    while True:
-        try:
-            save_snapshot_once()
-        except KeyboardInterrupt:
-            print("\nStopped by user.")
-            break
-        except Exception as e:
-            print("Capture error:", e)
-        time.sleep(INTERVAL_SEC)
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    pipe.log_every(60)
+    try:
+        pipe.every(INTERVAL_SEC)
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        pipe.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,129 @@
+# settings.py
+# config.yaml, parsed and checked once. The result is cached as JSON in
+# __pycache__ next to the file, keyed by a hash of its bytes, so later runs
+# neither import nor run the YAML parser; editing the file invalidates it.
+#
+# Scripts call load(); the entry point (__main__.py --config) changes
+# CONFIG for every script at once.
+#
+# Importing it also puts ../backend on sys.path, for the modules the scripts
+# share with the map server (metrics.py, lotpack.py).
+import os, sys, json, hashlib
+
+CONFIG = "config.yaml"
+VERSION = 2  # bump when validate() changes what it accepts or fills in
+
+SECTIONS = {"camera": dict, "model": dict, "spot": dict, "smoothing": dict, "output": dict,
+            "daemon": dict, "supervisor": dict, "calibration": dict, "archive": dict,
+            "cameras": list, "spots": list}
+BACKENDS = ("torch", "onnx", "openvino")
+
+BACKEND_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+
+class ConfigError(SystemExit):
+    """A config.yaml the scripts cannot run with; exits with the message."""
+
+
+def _spots(spots, where, fail):
+    for i, s in enumerate(spots or []):
+        if not isinstance(s, dict) or not ("points" in s or "box" in s):
+            fail(f"{where}[{i}] needs either 'points' or 'box'")
+        b = s.get("box")
+        if b is not None and not (isinstance(b, dict) and all(k in b for k in "xywh")):
+            fail(f"{where}[{i}].box needs x, y, w and h")
+
+
+def _number(section, key, name, fail, lo=None, hi=None, integer=False):
+    v = section.get(key)
+    if v is None:
+        return
+    if isinstance(v, bool) or not isinstance(v, int if integer else (int, float)):
+        fail(f"{name}.{key} must be {'an integer' if integer else 'a number'}, not {v!r}")
+    if (lo is not None and v < lo) or (hi is not None and v > hi):
+        bounds = (f"between {lo} and {hi}" if lo is not None and hi is not None
+                  else f"at least {lo}" if lo is not None else f"at most {hi}")
+        fail(f"{name}.{key} must be {bounds}, not {v!r}")
+
+
+def validate(cfg, path=CONFIG):
+    """Check the sections every script relies on; returns cfg with empty
+    sections (a bare `smoothing:`) as {}. Raises ConfigError."""
+    def fail(msg):
+        raise ConfigError(f"{path}: {msg}")
+
+    if cfg is None:
+        cfg = {}
+    if not isinstance(cfg, dict):
+        fail("expected key: value pairs at the top level")
+    for key, kind in SECTIONS.items():
+        if key in cfg and cfg[key] is None:
+            cfg[key] = kind()
+        elif key in cfg and not isinstance(cfg[key], kind):
+            fail(f"{key} must be a {'list' if kind is list else 'mapping'}")
+
+    m = cfg.get("model", {})
+    if m.get("backend", "torch") not in BACKENDS:
+        fail(f"model.backend must be one of {', '.join(BACKENDS)}, not {m['backend']!r}")
+    _number(m, "imgsz", "model", fail, lo=32, integer=True)
+    _number(m, "threads", "model", fail, lo=1, integer=True)
+    _number(m, "conf", "model", fail, lo=0, hi=1)
+    s = cfg.get("spot", {})
+    _number(s, "overlap_threshold", "spot", fail, lo=0, hi=1)
+    _number(s, "ssim_threshold", "spot", fail, lo=-1, hi=1)
+    # gating.ssim() compares 7 x 7 windows; smaller crops have none
+    _number(s, "gate_size", "spot", fail, lo=7, integer=True)
+    _number(s, "max_skip_sec", "spot", fail, lo=0)
+    _spots(cfg.get("spots"), "spots", fail)
+    for i, c in enumerate(cfg.get("cameras", [])):
+        if not isinstance(c, dict):
+            fail(f"cameras[{i}] must be a mapping")
+        if not (c.get("snapshot_url") or c.get("snapshot_file")):
+            fail(f"cameras[{i}] needs a snapshot_url or snapshot_file")
+        _spots(c.get("spots"), f"cameras[{i}].spots", fail)
+    cal = cfg.get("calibration", {})
+    if cal and len(cal.get("points") or []) < 4:
+        fail("calibration needs 4 or more points")
+    return cfg
+
+
+def cache_path(path):
+    head, name = os.path.split(os.path.abspath(path))
+    return os.path.join(head, "__pycache__", name + ".json")
+
+
+def load(path=None):
+    """The validated config at `path` (default CONFIG), from the cache when
+    the file has not changed since it was last parsed."""
+    path = path or CONFIG
+    with open(path, "rb") as f:
+        raw = f.read()
+    key = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    cache = cache_path(path)
+    try:
+        with open(cache, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        if doc["key"] == key and doc["version"] == VERSION:
+            return doc["config"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    import yaml
+    cfg = validate(yaml.safe_load(raw), path)
+    try:
+        text = json.dumps({"key": key, "version": VERSION, "config": cfg})
+    except TypeError:
+        return cfg  # dates and the like: parse every time
+    # non-string keys would come back from JSON as strings; same
+    if json.loads(text)["config"] == cfg:
+        try:
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            tmp = f"{cache}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, cache)
+        except OSError:
+            pass  # read-only checkout: no cache, same result
+    return cfg
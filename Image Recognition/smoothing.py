@@ -0,0 +1,89 @@
+# smoothing.py
+# Per-spot hysteresis so one flickering detection or a passer-by does not
+# flip a stall's state.
+import os, json, time
+import numpy as np
+
+
+class SpotTracker:
+    """State machine over N spots, updated once per evaluated frame.
+
+    Each spot keeps an exponential moving average of its overlap score. A
+    free spot becomes occupied only when the average rises above `enter`,
+    an occupied one frees up only when it drops below `exit` (enter > exit),
+    and either way the average must have called for the new state on every
+    frame for at least `min_dwell` seconds. update() returns only confirmed
+    transitions.
+    """
+
+    def __init__(self, n, enter=0.2, exit=0.08, alpha=0.5, min_dwell=15.0):
+        self.enter = np.broadcast_to(np.asarray(enter, np.float64), (n,)).copy()
+        self.exit = np.broadcast_to(np.asarray(exit, np.float64), (n,)).copy()
+        if (self.exit > self.enter).any():
+            raise ValueError("smoothing.exit must not be above smoothing.enter")
+        self.alpha = alpha
+        self.min_dwell = min_dwell
+        self.ema = None
+        self.occupied = np.zeros(n, bool)
+        self.pending = np.full(n, np.inf)  # since when each spot has wanted to flip
+
+    @classmethod
+    def from_config(cls, cfg, spots):
+        s = cfg.get("smoothing", {})
+        # default to the spot's own threshold, with a band around it
+        thr = spots.thresholds
+        return cls(len(spots),
+                   enter=s.get("enter", thr * 1.5),
+                   exit=s.get("exit", thr * 0.5),
+                   alpha=float(s.get("alpha", 0.5)),
+                   min_dwell=float(s.get("min_dwell_sec", 15)))
+
+    def update(self, score, now=None):
+        """Feed one frame's per-spot scores; return indices that changed state."""
+        now = time.time() if now is None else now
+        score = np.asarray(score, np.float64)
+        if self.ema is None:
+            # first frame: take it as is, nothing to confirm against
+            self.ema = score.copy()
+            self.occupied = score > self.enter
+            self.pending[:] = np.inf
+            return np.flatnonzero(self.occupied)
+        self.ema += self.alpha * (score - self.ema)
+
+        want = np.where(self.occupied, self.ema >= self.exit, self.ema > self.enter)
+        differs = want != self.occupied
+        # a frame that agrees with the current state restarts the wait
+        self.pending[~differs] = np.inf
+        self.pending[differs & np.isinf(self.pending)] = now
+        flip = differs & (now - self.pending >= self.min_dwell)
+        self.occupied[flip] = want[flip]
+        self.pending[flip] = np.inf
+        return np.flatnonzero(flip)
+
+    def apply(self, results):
+        """Overwrite `occupied` in per-spot result dicts with the smoothed state."""
+        for r, occ, ema in zip(results, self.occupied, self.ema):
+            r["raw_occupied"] = r["occupied"]
+            r["occupied"] = bool(occ)
+            r["smoothed"] = round(float(ema), 4)
+        return results
+
+    # One-shot scripts keep the tracker between runs in a small JSON file.
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ema": self.ema.tolist(), "occupied": self.occupied.tolist(),
+                       "pending": self.pending.tolist()}, f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        if len(d["occupied"]) != len(self.occupied):
+            return False
+        self.ema = np.array(d["ema"], np.float64)
+        self.occupied = np.array(d["occupied"], bool)
+        self.pending = np.array(d.get("pending", [np.inf] * len(self.occupied)), np.float64)
+        return True
@@ -0,0 +1,70 @@
+# stats.py
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+import settings  # puts backend/ on sys.path
+from metrics import counter, histogram
+
+# every StageStats sample also lands in these, for /metrics
+STAGE_SECONDS = histogram("stage_seconds", "Time per stage: fetch/grab, decode, infer, score, ...", ["stage"])
+EVENTS = counter("stage_events_total", "Counted events: gated, steady, tiles, ...", ["event"])
+FRAMES = counter("frames_total", "Frames through the last stage")
+
+
+class StageStats:
+    """Rolling latency samples per pipeline stage, summarized as p50/p99."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}
+        self.counters = {}
+        self.frames = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        STAGE_SECONDS.labels(stage).observe(seconds)
+        with self.lock:
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+    def incr(self, name, n=1):
+        EVENTS.labels(name).inc(n)
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def count(self, frames):
+        FRAMES.inc(frames)
+        with self.lock:
+            self.frames += frames
+
+    def summary(self):
+        with self.lock:
+            out = {}
+            for stage, s in self.samples.items():
+                if s:
+                    p50, p99 = np.percentile(np.fromiter(s, float, len(s)), [50, 99])
+                    out[stage] = {"p50_ms": p50 * 1e3, "p99_ms": p99 * 1e3, "n": len(s)}
+            return out
+
+    def fps(self):
+        return self.frames / max(time.monotonic() - self.started, 1e-9)
+
+    def report(self):
+        parts = [f"{self.fps():.2f} fps"]
+        for stage, s in self.summary().items():
+            parts.append(f"{stage} p50={s['p50_ms']:.1f}ms p99={s['p99_ms']:.1f}ms")
+        for name, n in sorted(self.counters.items()):
+            parts.append(f"{name}={n}")
+        return " | ".join(parts)
@@ -0,0 +1,111 @@
+# tiling.py
+# Run the detector on spot regions only, at native resolution, instead of on
+# a downscaled full frame. Far stalls on a 4K camera keep their pixels and
+# everything outside the lot is never looked at.
+import numpy as np
+
+from occupancy import nms
+
+
+def union_regions(bounds, shape, margin=0.5):
+    """Merge spot bounding boxes into as few rectangles as overlap allows.
+
+    bounds: (N, 4) xyxy per spot; each is grown by `margin` times its size
+    first, since a parked car usually sticks out of its painted stall.
+    Returns (R, 4) int xyxy clipped to the frame.
+    """
+    h, w = shape[:2]
+    b = np.asarray(bounds, np.float64).reshape(-1, 4)
+    pad = np.tile((b[:, 2:] - b[:, :2]) * margin, 2) * [-1, -1, 1, 1]
+    boxes = np.clip(np.round(b + pad), 0, [w, h, w, h]).astype(np.int64)
+    boxes = [list(r) for r in boxes if r[2] > r[0] and r[3] > r[1]]
+
+    # greedy union until no two rectangles overlap; N is a few dozen at most
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, c = boxes[i], boxes[j]
+                if a[0] < c[2] and c[0] < a[2] and a[1] < c[3] and c[1] < a[3]:
+                    boxes[i] = [min(a[0], c[0]), min(a[1], c[1]), max(a[2], c[2]), max(a[3], c[3])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return np.array(boxes, np.int64).reshape(-1, 4)
+
+
+def _starts(lo, hi, tile, step):
+    if hi - lo <= tile:
+        return [lo]
+    # fewest tiles that keep at least the requested overlap, spread evenly
+    n = -(-(hi - lo - tile) // step) + 1
+    return np.linspace(lo, hi - tile, n).round().astype(np.int64).tolist()
+
+
+def tile_regions(regions, tile=640, overlap=0.2):
+    """Split each region into tile x tile windows overlapping by `overlap`.
+
+    Regions smaller than a tile become one window of their own size; the
+    model letterboxes (and upscales) them. Windows never leave their region.
+    """
+    step = max(int(tile * (1 - overlap)), 1)
+    out = []
+    for x0, y0, x1, y1 in regions:
+        for ty in _starts(y0, y1, tile, step):
+            for tx in _starts(x0, x1, tile, step):
+                out.append([tx, ty, min(tx + tile, x1), min(ty + tile, y1)])
+    return np.array(out, np.int64).reshape(-1, 4)
+
+
+class Tiler:
+    """Tiles over a SpotSet's regions, cached per frame size.
+
+    crops(frame) returns views into the frame (no copies) to pass to the
+    model as one batch; merge() takes the per-crop detections back to frame
+    coordinates and drops the duplicates where tiles overlap.
+    """
+
+    def __init__(self, spots, tile=640, overlap=0.2, margin=0.5, iou=0.5):
+        self.spots = spots
+        self.tile = int(tile)
+        self.overlap = float(overlap)
+        self.margin = float(margin)
+        self.iou = float(iou)
+        self._shape = None
+        self.windows = np.zeros((0, 4), np.int64)
+
+    @classmethod
+    def from_config(cls, cfg, spots):
+        """Tiler from `model.tiling` (true, or a dict of options), else None."""
+        t = cfg.get("model", {}).get("tiling")
+        if not t:
+            return None
+        t = t if isinstance(t, dict) else {}
+        return cls(spots, tile=t.get("tile", 640), overlap=t.get("overlap", 0.2),
+                   margin=t.get("margin", 0.5), iou=t.get("iou", 0.5))
+
+    def layout(self, shape):
+        if shape[:2] != self._shape:
+            regions = union_regions(self.spots.bounds, shape, self.margin)
+            self.windows = tile_regions(regions, self.tile, self.overlap)
+            self._shape = shape[:2]
+        return self.windows
+
+    def crops(self, frame):
+        return [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in self.layout(frame.shape)]
+
+    def merge(self, detections):
+        """detections: one (xyxy, conf) pair per crop, in crop coordinates."""
+        xyxy = [np.asarray(b, np.float64).reshape(-1, 4) + np.tile(w[:2], 2)
+                for (b, _), w in zip(detections, self.windows)]
+        conf = [np.asarray(c, np.float64).reshape(-1) for _, c in detections]
+        if not xyxy:
+            return np.zeros((0, 4)), np.zeros(0)
+        xyxy, conf = np.concatenate(xyxy), np.concatenate(conf)
+        # a car cut by a tile edge shows up whole in one tile and as a
+        # fragment in the next; the fragment lies mostly inside the whole box
+        keep = nms(xyxy, conf, self.iou, contained=0.8)
+        return xyxy[keep], conf[keep]
@@ -1,28 +1,254 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS # Import CORS
 import json
+from datetime import datetime
+import time
+import numpy as np
+
+import metrics
+import push
+from forecast import Forecaster
+from history import History
+from spatial import SpaceIndex
+from store import OccupancyStore
 
 app = Flask(__name__)
 # Enable CORS to allow requests from your React app
-CORS(app) 
+# Preflights are cached by the browser for a day (max_age)
+CORS(app, expose_headers=["ETag"], max_age=86400)
+
+# The binary pack written by write_lot_to_json.py, else the JSON file
+LOTS_FILES = ["lots.bin", "lots.json"]
+PUSH_PORT = 5001  # Server-Sent Events stream at http://127.0.0.1:5001/events
+
+# Lots are parsed and encoded once per change, not once per request
+store = OccupancyStore()
+
+# Every transition the store sees, with minute/hour/day rollups, and
+# weekday x time-of-day profiles fitted from them. Only the process that
+# calls record() writes these; others (serve.py workers) reload its saves.
+history = History("history")
+STEPS = {"minute": 60, "hour": 3600, "day": 86400}
+forecaster = Forecaster(history)
+forecaster.attach(store)
+_recording = False
+
+def record(refit_every=300):
+    """Record transitions into the history and refit forecasts in the
+    background. One process per history directory."""
+    global _recording
+    history.attach(store)
+    store.subscribe(count_transitions)  # here, so several workers count each once
+    forecaster.start(interval=refit_every)
+    _recording = True
+
+# Prometheus text format at /metrics; sampled span timings at /trace
+REQUEST_SECONDS = metrics.histogram("api_request_seconds", "Request handling time", ["route"])
+RESPONSES = metrics.counter("api_responses_total", "Responses by route and status", ["route", "status"])
+NOT_MODIFIED = metrics.counter("api_not_modified_total", "304 responses to If-None-Match", ["route"])
+READ_ERRORS = metrics.counter("lots_read_errors_total", "Failed reads of the lots file")
+TRANSITIONS = metrics.counter("occupancy_transitions_total", "Spaces that changed occupancy", ["lot"])
+
+def count_transitions(version, changes):
+    lots = store.lots
+    for lot_i, _, _ in changes or ():
+        TRANSITIONS.labels(lots[lot_i]["name"]).inc()
+
+# Spatial index for the current geometry, and free-space mask per version
+_index = {}
+_free = {}
+
+@app.before_request
+def start_timer():
+    request.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.labels(route).observe(time.perf_counter() - request.started)
+    RESPONSES.labels(route, response.status_code).inc()
+    return response
 
 @app.route("/")
 def home():
     # A simple message to confirm the API is running
     return "Parking Lot API is running."
 
+def refresh():
+    if store.watching:
+        return  # reloaded in the background, not per request
+    try:
+        store.load_file(LOTS_FILES)
+    except (IOError, ValueError) as e:
+        # Keep serving the last good version, if there is one
+        READ_ERRORS.inc()
+        print(f"Error reading lot data: {e}")
+
+def send(enc, cache_control="no-cache"):
+    """Respond with a pre-encoded body, or 304 if the client already has it."""
+    headers = {"ETag": f'"{enc.etag}"', "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if enc.etag in request.if_none_match:
+        NOT_MODIFIED.labels(request.url_rule.rule).inc()
+        return Response(status=304, headers=headers)
+
+    encoding, body = enc.negotiate(request.accept_encodings)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype="application/json", headers=headers)
+
 @app.route("/data")
 def get_data():
-    """This endpoint reads and returns the parking lot data."""
-    try:
-        with open('lots.json', 'r') as f:
-            data = json.load(f)
-        return jsonify(data)
-    except (IOError, json.JSONDecodeError) as e:
-        print(f"Error reading lots.json: {e}")
+    """This endpoint returns the parking lot data from the in-memory store.
+
+    With ?since=<version> it returns only the spaces whose occupancy changed
+    after that version, or the full occupancy state if the client is too far
+    behind. Geometry for that form comes from /geometry.
+    """
+    with metrics.span("data.refresh"):
+        refresh()
+    if store.encoded is None:
         # Return an empty list if the file is missing or invalid
         return jsonify([])
 
+    since = request.args.get("since", type=int)
+    with metrics.span("data.send"):
+        if since is not None:
+            return send(store.delta(since), "no-store")
+        return send(store.encoded)
+
+@app.route("/geometry")
+def get_geometry():
+    """Lot and space polygons only. Versioned URLs (?v=<id> from /data?since=)
+    never change, so browsers may cache them for good."""
+    refresh()
+    if store.geometry is None:
+        return jsonify([])
+    if request.args.get("v") == store.geometry.etag:
+        return send(store.geometry, "public, max-age=31536000, immutable")
+    return send(store.geometry)
+
+def indexed():
+    """(SpaceIndex, free mask) for the store's current contents."""
+    with store.lock:
+        key, version = store.geometry.etag, store.version
+        lots, occupancy = store.lots, store.occupancy
+    index = _index.get(key)
+    if index is None:
+        # Only rebuilt when geometry changes, not when occupancy does
+        index = SpaceIndex(lots)
+        _index.clear()
+        _index[key] = index
+    free = _free.get(version)
+    if free is None:
+        free = ~np.fromiter((o for occ in occupancy for o in occ), dtype=bool, count=len(index))
+        _free.clear()
+        _free[version] = free
+    return index, free
+
+def space_json(index, free, i, **extra):
+    return {"lot": index.lot_names[index.lot[i]], "id": index.ids[i],
+            "coords": index.coords[i], "occupied": not bool(free[i]), **extra}
+
+@app.route("/spaces")
+def get_spaces():
+    """Spaces overlapping ?bbox=west,south,east,north (Leaflet's toBBoxString order)."""
+    try:
+        west, south, east, north = (float(v) for v in request.args["bbox"].split(","))
+    except (KeyError, ValueError):
+        return jsonify({"error": "bbox=west,south,east,north is required"}), 400
+    refresh()
+    if store.geometry is None:
+        return jsonify([])
+    index, free = indexed()
+    return jsonify([space_json(index, free, i) for i in index.in_bbox(south, west, north, east)])
+
+@app.route("/nearest-free")
+def get_nearest_free():
+    """The k free spaces closest to ?lat=&lon= (default k=5), nearest first."""
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    k = min(request.args.get("k", 5, type=int), 100)
+    if lat is None or lon is None or k < 1:
+        return jsonify({"error": "lat and lon are required, k must be positive"}), 400
+    refresh()
+    if store.geometry is None:
+        return jsonify([])
+    index, free = indexed()
+    found, meters = index.nearest(lat, lon, k, mask=free)
+    return jsonify([space_json(index, free, i, distance_m=round(float(d), 1))
+                    for i, d in zip(found, meters)])
+
+def parse_time(value):
+    """Unix seconds or an ISO 8601 date/time; None if absent."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route("/history")
+def get_history():
+    """Occupancy %, turnover and mean dwell per ?step= (seconds, or minute,
+    hour, day) for ?lot= (all lots if absent) between ?from= and ?to=."""
+    step = request.args.get("step", "hour")
+    try:
+        step = STEPS[step] if step in STEPS else int(step)
+        start = parse_time(request.args.get("from"))
+        end = parse_time(request.args.get("to"))
+    except ValueError:
+        return jsonify({"error": "step must be seconds or minute/hour/day; from/to unix seconds or ISO 8601"}), 400
+    if not _recording:
+        history.reload()
+    lot = request.args.get("lot")
+    if lot is not None and lot not in history.lot_ids:
+        return jsonify({"error": f"unknown lot {lot!r}"}), 404
+    refresh()
+    try:
+        return jsonify(history.query(lot, start, end, step) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/forecast")
+def get_forecast():
+    """Expected percent open at ?at= (unix seconds or ISO 8601, default now)
+    for ?lot=, or for every lot if absent."""
+    try:
+        at = parse_time(request.args.get("at"))
+    except ValueError:
+        return jsonify({"error": "at must be unix seconds or ISO 8601"}), 400
+    refresh()
+    if not _recording:
+        forecaster.reload()
+    lot = request.args.get("lot")
+    if forecaster.error and not forecaster.table["rows"]:
+        return jsonify({"error": f"forecast refit failing: {forecaster.error}"}), 503
+    if lot is None:
+        return jsonify([forecaster.forecast(name, at) for name in forecaster.table["rows"]])
+    result = forecaster.forecast(lot, at)
+    if result is None:
+        return jsonify({"error": f"unknown lot {lot!r} or no history yet"}), 404
+    return jsonify(result)
+
+@app.route("/metrics")
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/trace")
+def get_trace():
+    """Spans by total time; ?rate=0.05 times 5% of span() calls from now on
+    (0 turns timing off)."""
+    try:
+        return jsonify(metrics.trace_request(request.args))
+    except ValueError:
+        return jsonify({"error": "rate must be a number from 0 to 1"}), 400
+
 if __name__ == "__main__":
+    # Development server; serve.py runs the same app with several workers
+    record()
+    # Push occupancy changes as soon as lots.json changes on disk
+    store.watch_file(LOTS_FILES)
+    push.start_in_thread(store, port=PUSH_PORT)
     # The API will run on the default port 5000
-    app.run(debug=True)
\ No newline at end of file
+    # (no reloader: it would start a second watcher and push server)
+    app.run(debug=True, use_reloader=False)
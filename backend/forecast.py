@@ -0,0 +1,231 @@
+"""Percent-open forecasts from weekday x time-of-day profiles.
+
+A background thread folds new minute buckets from `History` into per-lot
+accumulators of occupied and observed space-seconds, one cell per
+(weekday, slot of the day) in local time, with older weeks decaying away.
+Each refit swaps in a precomputed (lots, 7, slots) table of percent open,
+so a request is one table lookup plus the current deviation from that
+profile, which fades out over `tau` seconds:
+
+  forecast(at) = profile(at) + (open_now - profile(now)) * exp(-(at - now) / tau)
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import numpy as np
+
+import metrics
+from history import OBS, OCC
+
+SLOT_MIN = 15
+
+REFITS = metrics.counter("forecast_refits_total", "Background forecast refits by outcome", ["outcome"])
+
+
+def local_slots(ts, slot_min=SLOT_MIN):
+    """(weekday 0=Monday, slot of the day) in local time for unix seconds."""
+    ts = np.asarray(ts, np.float64)
+    days = np.floor(ts / 86400)
+    # UTC offset per distinct day (DST changes only a few times a year)
+    uniq, inv = np.unique(days, return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(d * 86400 + 43200).astimezone().utcoffset().total_seconds()
+                        for d in uniq])
+    local = ts + offsets[inv.reshape(ts.shape)]
+    weekday = ((np.floor(local / 86400) + 3) % 7).astype(np.int64)  # 1970-01-01 was a Thursday
+    slot = ((local % 86400) // (slot_min * 60)).astype(np.int64)
+    return weekday, slot
+
+
+class Forecaster:
+    """Seasonal profiles per lot, refit incrementally, served by lookup."""
+
+    def __init__(self, history, path=None, slot_min=SLOT_MIN, tau=3600.0, halflife_weeks=8.0):
+        self.history = history
+        self.path = path or os.path.join(history.root, "forecast.npz")
+        self.slot_min = slot_min
+        self.slots = 24 * 60 // slot_min
+        self.tau = tau
+        self.halflife = halflife_weeks * 7 * 86400
+        self.lock = threading.Lock()   # refits only; readers use self.table as is
+        self.num = {}       # lot name -> (7, slots) occupied space-seconds
+        self.den = {}       # lot name -> (7, slots) observed space-seconds
+        self.fitted = {}    # lot name -> first minute bucket not folded in yet
+        self.fitted_at = None
+        self.table = {"rows": {}, "open": np.zeros((0, 7, self.slots), np.float32)}
+        self.current = {}   # lot name -> (percent open, ts) from the live store
+        self.error = None   # why the last background refit failed, until one succeeds
+        self.error_path = self.path[:-4] + ".error"
+        self._loaded = None
+        self.load()
+        metrics.gauge("forecast_fitted_timestamp_seconds",
+                      "Unix time of the last refit of the forecast table").set_function(
+            lambda: self.fitted_at or 0.0)
+
+    def attach(self, store):
+        """Track each lot's current percent open from an OccupancyStore."""
+        def listener(version, changes):
+            with store.lock:
+                lots = [(lot["name"], occ) for lot, occ in zip(store.lots, store.occupancy)]
+            now = time.time()
+            self.current = {name: (100.0 * (len(occ) - sum(occ)) / len(occ) if occ else 0.0, now)
+                            for name, occ in lots}
+        store.subscribe(listener)
+
+    def refit(self, now=None):
+        """Fold in minute buckets completed since the last refit and rebuild the table."""
+        now = time.time() if now is None else now
+        h = self.history
+        with self.lock:
+            with h.lock:
+                if h.rollups is None:
+                    return False
+                minute = h.rollups[0]
+                end = minute.bucket(now)  # the current minute is still open
+                h._advance_all(now)       # lots with no recent transitions too
+                new = {}
+                for name, lot in h.lot_ids.items():
+                    if lot not in minute.rows:
+                        continue
+                    # minutes that left the ring before a refit are lost, not misplaced
+                    start = max(self.fitted.get(name, 0), minute.first(lot))
+                    new[name] = (start, minute.get(lot, start, end)[:, [OCC, OBS]])
+                origin, res = minute.origin, minute.res
+
+            decay = 1.0
+            if self.fitted_at is not None:
+                decay = 0.5 ** ((now - self.fitted_at) / self.halflife)
+            for name in self.num:
+                self.num[name] *= decay
+                self.den[name] *= decay
+
+            for name, (start, rows) in new.items():
+                num = self.num.setdefault(name, np.zeros((7, self.slots)))
+                den = self.den.setdefault(name, np.zeros((7, self.slots)))
+                if len(rows):
+                    ts = origin + (start + np.arange(len(rows))) * res
+                    wd, slot = local_slots(ts, self.slot_min)
+                    # newer minutes count more, on the same half-life as the decay
+                    w = 0.5 ** ((now - ts) / self.halflife)
+                    cell = wd * self.slots + slot
+                    num += np.bincount(cell, rows[:, 0] * w, 7 * self.slots).reshape(7, self.slots)
+                    den += np.bincount(cell, rows[:, 1] * w, 7 * self.slots).reshape(7, self.slots)
+                self.fitted[name] = start + len(rows)
+            self.fitted_at = now
+            self.table = self._build()
+            self._save()
+        return True
+
+    def _build(self):
+        names = sorted(self.num)
+        table = np.zeros((len(names), 7, self.slots), np.float32)
+        for i, name in enumerate(names):
+            num, den = self.num[name], self.den[name]
+            occ = np.divide(num, den, out=np.full(num.shape, np.nan), where=den > 0)
+            # slots never observed: same time on other weekdays, else the lot's mean
+            by_slot = np.divide(num.sum(0), den.sum(0), out=np.full(self.slots, np.nan), where=den.sum(0) > 0)
+            overall = num.sum() / den.sum() if den.sum() > 0 else 0.5
+            occ = np.where(np.isnan(occ), by_slot[None, :], occ)
+            occ = np.where(np.isnan(occ), overall, occ)
+            table[i] = 100.0 * (1.0 - occ)
+        return {"rows": {name: i for i, name in enumerate(names)}, "open": table}
+
+    def forecast(self, lot, at=None, now=None):
+        """Percent open for a lot at unix time `at` (default now), or None if unknown."""
+        now = time.time() if now is None else now
+        at = now if at is None else at
+        table = self.table  # one consistent snapshot, however long the refit takes
+        row = table["rows"].get(lot)
+        if row is None:
+            return None
+        (wd_at, wd_now), (slot_at, slot_now) = local_slots([at, now], self.slot_min)
+        profile = float(table["open"][row, wd_at, slot_at])
+        deviation = 0.0
+        if lot in self.current:
+            deviation = self.current[lot][0] - float(table["open"][row, wd_now, slot_now])
+        fade = np.exp(-max(at - now, 0.0) / self.tau)
+        return {"lot": lot, "at": at,
+                "percent_open": round(float(np.clip(profile + deviation * fade, 0, 100)), 1),
+                "profile": round(profile, 1), "deviation": round(deviation, 1)}
+
+    def start(self, interval=300.0):
+        """Refit every `interval` seconds from a daemon thread."""
+        def run():
+            while True:
+                self._background_refit()
+                time.sleep(interval)
+        threading.Thread(target=run, name="forecast-refit", daemon=True).start()
+
+    def _background_refit(self):
+        try:
+            self.refit()
+        except Exception as e:
+            # keep refitting, but make the failure visible: /forecast reports
+            # it and forecast_refits_total{outcome="failed"} counts it
+            REFITS.labels("failed").inc()
+            self._set_error(f"{type(e).__name__}: {e}")
+            traceback.print_exc()
+        else:
+            REFITS.labels("ok").inc()
+            self._set_error(None)
+
+    def _set_error(self, error):
+        """Record (or clear) a refit failure where serve.py workers see it too."""
+        if error == self.error:
+            return
+        self.error = error
+        try:
+            if error is None:
+                os.remove(self.error_path)
+            else:
+                with open(self.error_path, "w", encoding="utf-8") as f:
+                    f.write(error)
+        except OSError:
+            pass
+
+    def _save(self):
+        names = sorted(self.num)
+        meta = {"names": names, "fitted": [self.fitted.get(n, 0) for n in names],
+                "fitted_at": self.fitted_at, "slot_min": self.slot_min}
+        tmp = self.path[:-4] + ".tmp.npz"
+        np.savez(tmp, meta=np.frombuffer(json.dumps(meta).encode(), np.uint8),
+                 num=np.array([self.num[n] for n in names]).reshape(-1, 7, self.slots),
+                 den=np.array([self.den[n] for n in names]).reshape(-1, 7, self.slots),
+                 open=self.table["open"])
+        os.replace(tmp, self.path)
+
+    def reload(self):
+        """Pick up a table saved by the refitting process since the last load;
+        for read-only copies (serve.py workers)."""
+        try:
+            with open(self.error_path, "r", encoding="utf-8") as f:
+                self.error = f.read()
+        except FileNotFoundError:
+            self.error = None
+        try:
+            key = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if key == self._loaded:
+            return False
+        with self.lock:
+            return self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        self._loaded = os.stat(self.path).st_mtime_ns
+        with np.load(self.path) as z:
+            meta = json.loads(z["meta"].tobytes())
+            if meta["slot_min"] != self.slot_min:
+                return False
+            for i, name in enumerate(meta["names"]):
+                self.num[name] = z["num"][i].copy()
+                self.den[name] = z["den"][i].copy()
+                self.fitted[name] = meta["fitted"][i]
+            self.fitted_at = meta["fitted_at"]
+            self.table = {"rows": {n: i for i, n in enumerate(meta["names"])}, "open": z["open"].copy()}
+        return True
@@ -4,6 +4,65 @@ def interpolate(p1, p2, n):
     """Return n+1 evenly spaced points between p1 and p2 (inclusive)."""
     return [p1 + (p2 - p1) * i / n for i in range(n + 1)]
 
+def generate_lot_spaces(corners, n_rows, angle=0.0):
+    """
+    Generate every parking space of one or many lots as a single array.
+
+    corners: (4, 2) or (L, 4, 2) array of A, B, C, D corners (clockwise);
+             rows run along A->B, stacked from the A-B edge to the D-C edge
+    n_rows:  spaces per row; (K,) for one lot or (L, K) for many lots, with
+             trailing 0s padding lots with fewer rows (a lot's rows
+             are equally deep)
+    angle:   stall angle in degrees from perpendicular, scalar or (L,);
+             the far edge of each stall is shifted along the row by
+             depth * tan(angle)
+
+    Returns (spaces, offsets): spaces is an (n_spaces, 4, 2) float array of
+    corners in the same order as generate_diagonal_parking_spaces, lot i
+    owning spaces[offsets[i]:offsets[i + 1]].
+    """
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 2)
+    n_rows = np.asarray(n_rows, dtype=np.int64).reshape(len(corners), -1)
+    angle = np.broadcast_to(np.asarray(angle, dtype=np.float64), (len(corners),))
+    A, B, C, D = (corners[:, i, None, :] for i in range(4))
+
+    # Row boundaries: K+1 lines from the A-B edge to the D-C edge, per lot
+    k = (n_rows > 0).sum(1, keepdims=True)
+    f = np.arange(n_rows.shape[1] + 1)[None, :] / np.maximum(k, 1)
+    left = A + (D - A) * f[..., None]      # (L, K+1, 2)
+    right = B + (C - B) * f[..., None]
+
+    # Stall skew as a fraction of the row length
+    depth = np.linalg.norm((D - A)[:, 0], axis=1) / np.maximum(k[:, 0], 1)
+    length = np.linalg.norm((B - A)[:, 0], axis=1)
+    skew = np.tan(np.radians(angle)) * depth / length
+
+    # One entry per space: which lot, which row, position along the row
+    counts = n_rows.ravel()
+    lot_of = np.repeat(np.arange(len(corners)), n_rows.shape[1])
+    row_of = np.tile(np.arange(n_rows.shape[1]), len(corners))
+    space_lot = np.repeat(lot_of, counts)
+    space_row = np.repeat(row_of, counts)
+    starts = np.cumsum(counts) - counts
+    pos = np.arange(counts.sum()) - np.repeat(starts, counts)
+    n = np.repeat(counts, counts)
+
+    t0 = (pos / n)[:, None]
+    t1 = ((pos + 1) / n)[:, None]
+    s = skew[space_lot][:, None]
+    top_l, top_r = left[space_lot, space_row], right[space_lot, space_row]
+    bot_l, bot_r = left[space_lot, space_row + 1], right[space_lot, space_row + 1]
+
+    spaces = np.empty((len(pos), 4, 2))
+    spaces[:, 0] = top_l + (top_r - top_l) * t0
+    spaces[:, 1] = top_l + (top_r - top_l) * t1
+    spaces[:, 2] = bot_l + (bot_r - bot_l) * (t1 + s)
+    spaces[:, 3] = bot_l + (bot_r - bot_l) * (t0 + s)
+
+    offsets = np.zeros(len(corners) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(n_rows.sum(1))
+    return spaces, offsets
+
 def generate_diagonal_parking_spaces(A, B, C, D, n_row):
     """
     Generate parking space corner coordinates for a diagonal rectangular lot
@@ -12,41 +71,9 @@ def generate_diagonal_parking_spaces(A, B, C, D, n_row):
     A, B, C, D: np.array([x, y]) or [lat, lon] corners in order (clockwise)
     n_row: number of spaces in each row
     """
-    # Split the left and right edges into halves to separate the two rows
-    left_mid_top = A + (D - A) * 0.5
-    right_mid_top = B + (C - B) * 0.5
-
-    # Divide the top and midline for Row 1
-    top_edge_points = interpolate(A, B, n_row)
-    mid_top_points = interpolate(left_mid_top, right_mid_top, n_row)
-
-    # Divide the midline and bottom for Row 2
-    mid_bottom_points = interpolate(left_mid_top, right_mid_top, n_row)
-    bottom_edge_points = interpolate(D, C, n_row)
-
-    # Row 1: between top and midline
-    row1_spaces = []
-    for i in range(n_row):
-        space = [
-            top_edge_points[i],
-            top_edge_points[i+1],
-            mid_top_points[i+1],
-            mid_top_points[i]
-        ]
-        row1_spaces.append(space)
-
-    # Row 2: between midline and bottom
-    row2_spaces = []
-    for i in range(n_row):
-        space = [
-            mid_bottom_points[i],
-            mid_bottom_points[i+1],
-            bottom_edge_points[i+1],
-            bottom_edge_points[i]
-        ]
-        row2_spaces.append(space)
-
-    return row1_spaces, row2_spaces
+    spaces, _ = generate_lot_spaces([A, B, C, D], [n_row, n_row])
+    # Row 1: between top and midline; Row 2: between midline and bottom
+    return list(spaces[:n_row]), list(spaces[n_row:])
 
 if __name__ == '__main__':
     # Example usage (diagonal lot)
@@ -55,7 +82,7 @@ if __name__ == '__main__':
     C = np.array([38.031286, -78.511200])
     D = np.array([38.030842, -78.511844])
 
-    row1, row2 = generate_diagonal_parking_spaces(A, B, C, D, n_row1=5, n_row2=5)
+    row1, row2 = generate_diagonal_parking_spaces(A, B, C, D, n_row=5)
 
     for i, space in enumerate(row1 + row2, start=1):
         print(f"Space {i}: {np.round(space, 6)}")
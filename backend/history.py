@@ -0,0 +1,384 @@
+"""Occupancy history: every space transition, plus rollups kept up to date
+as transitions arrive.
+
+Transitions are appended to `events.bin` (fixed 15-byte records). For each
+lot and each resolution (minute, hour, day) a dense array holds one row per
+time bucket:
+
+  occupied_s   space-seconds occupied in the bucket
+  observed_s   space-seconds observed (occupied or free)
+  arrivals     free -> occupied transitions (turnover)
+  departures   occupied -> free transitions
+  dwell_s      total length of stays that ended in the bucket
+  stays        number of those stays
+
+so a query is an array slice and a reshape-sum, however long the range.
+Minute rows are kept for the last week only (KEEP); hours and days for good.
+Rollups are saved every `save_every` seconds; on start they are loaded and
+the events logged after the save are replayed.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+RESOLUTIONS = (60, 3600, 86400)
+KEEP = {60: 7 * 1440}  # minute buckets are held for a week, hours and days for good
+MAX_BUCKETS = 100_000  # per query, in the resolution read: 11 years of hours
+FIELDS = ("occupied_s", "observed_s", "arrivals", "departures", "dwell_s", "stays")
+OCC, OBS, ARR, DEP, DWELL, STAYS = range(len(FIELDS))
+
+EVENT = np.dtype([("ts", "<f8"), ("lot", "<u2"), ("space", "<u4"), ("occupied", "u1")])
+
+
+def _column(values):
+    return [None if v != v else v for v in values.tolist()]  # NaN -> null
+
+
+class Rollup:
+    """Per-lot bucket arrays for one resolution.
+
+    With `keep`, only the last `keep` buckets are held, in a ring (minute
+    buckets for a year of hundreds of lots would not fit in memory);
+    otherwise the array grows as time passes.
+    """
+
+    def __init__(self, res, origin, keep=None):
+        self.res = res
+        self.origin = origin
+        self.keep = keep
+        self.rows = {}  # lot id -> (buckets, len(FIELDS)) float32
+        self.hi = {}    # lot id -> newest bucket written
+
+    def bucket(self, ts):
+        return int((ts - self.origin) // self.res)
+
+    def first(self, lot):
+        """Oldest bucket still held for a lot."""
+        return max(self.hi.get(lot, -1) - self.keep + 1, 0) if self.keep else 0
+
+    def _rows(self, lot, b0, b1):
+        """(table, row indices, first bucket) for buckets b0..b1, making room
+        for b1; buckets already rotated out of the ring are skipped."""
+        t = self.rows.get(lot)
+        hi = self.hi.get(lot, -1)
+        if self.keep is None:
+            if t is None or b1 >= len(t):
+                grown = np.zeros((max(b1 + 1, 2 * len(t) if t is not None else 1024), len(FIELDS)), np.float32)
+                if t is not None:
+                    grown[:len(t)] = t
+                self.rows[lot] = t = grown
+        else:
+            if t is None:
+                self.rows[lot] = t = np.zeros((self.keep, len(FIELDS)), np.float32)
+            if b1 > hi:
+                # buckets entering the ring replace ones from `keep` buckets ago
+                t[np.arange(max(hi + 1, b1 - self.keep + 1), b1 + 1) % self.keep] = 0
+            b0 = max(b0, max(b1, hi) - self.keep + 1)
+        self.hi[lot] = max(hi, b1)
+        idx = np.arange(b0, b1 + 1)
+        return t, (idx % self.keep if self.keep else idx), b0
+
+    def integrate(self, lot, t0, t1, occupied, observed):
+        """Add `occupied` / `observed` space counts held from t0 to t1."""
+        if t1 <= t0:
+            return
+        t, idx, b0 = self._rows(lot, self.bucket(t0), self.bucket(t1))
+        if not len(idx):
+            return
+        starts = self.origin + (b0 + np.arange(len(idx))) * self.res
+        secs = np.minimum(starts + self.res, t1) - np.maximum(starts, t0)
+        t[idx, OCC] += occupied * secs
+        t[idx, OBS] += observed * secs
+
+    def count(self, lot, ts, field, n=1):
+        b = self.bucket(ts)
+        t, idx, _ = self._rows(lot, b, b)
+        t[idx, field] += n
+
+    def views(self, lot, b0, b1):
+        """[(offset from b0, rows), ...] for the held buckets among b0..b1-1:
+        slices of the table, not copies."""
+        t = self.rows.get(lot)
+        if t is None:
+            return []
+        lo, hi = max(b0, self.first(lot)), min(b1, self.hi[lot] + 1)
+        if not self.keep:
+            return [(lo - b0, t[lo:hi])] if hi > lo else []
+        out = []
+        while lo < hi:  # at most two pieces, either side of the ring's seam
+            i = lo % self.keep
+            n = min(hi - lo, self.keep - i)
+            out.append((lo - b0, t[i:i + n]))
+            lo += n
+        return out
+
+    def get(self, lot, b0, b1):
+        """(b1 - b0, len(FIELDS)) rows for buckets b0..b1-1, zeros where none are held."""
+        out = np.zeros((max(b1 - b0, 0), len(FIELDS)))
+        for offset, rows in self.views(lot, b0, b1):
+            out[offset:offset + len(rows)] = rows
+        return out
+
+
+class History:
+    """Transition log and rollups for every lot. Thread-safe."""
+
+    def __init__(self, root="history", save_every=60.0):
+        self.root = root
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        self.lot_ids = {}   # lot name -> small int used in the log and rollups
+        self.state = {}     # lot id -> {"slots": {space id: i}, "occupied", "since", "last"}
+        self.rollups = None
+        self.log_count = 0
+        self._saved = time.time()
+        os.makedirs(root, exist_ok=True)
+        self._log = None
+        self._loaded = self._saved_key()
+        self.load()
+
+    # -- ingest -----------------------------------------------------------
+
+    def _start(self, ts):
+        if self.rollups is None:
+            origin = float(ts // 86400 * 86400)  # UTC midnight, shared by all resolutions
+            self.rollups = [Rollup(res, origin, KEEP.get(res)) for res in RESOLUTIONS]
+
+    def _lot(self, name):
+        lot = self.lot_ids.get(name)
+        if lot is None:
+            lot = self.lot_ids[name] = len(self.lot_ids)
+        return lot
+
+    def _advance(self, lot, ts):
+        """Integrate a lot's current occupancy from its last update up to ts."""
+        st = self.state[lot]
+        if ts > st["last"]:
+            n_occ, n = int(st["occupied"].sum()), len(st["occupied"])
+            for r in self.rollups:
+                r.integrate(lot, st["last"], ts, n_occ, n)
+            st["last"] = ts
+
+    def _advance_all(self, ts):
+        for lot in self.state:
+            self._advance(lot, ts)
+
+    def _apply(self, lot, slots, occupied, ts, log=True):
+        """Set spaces `slots` of a lot to `occupied` at ts, counting transitions."""
+        st = self.state[lot]
+        self._advance(lot, ts)
+        slots = np.asarray(slots, np.int64)
+        occupied = np.asarray(occupied, bool)
+        flip = st["occupied"][slots] != occupied
+        slots, occupied = slots[flip], occupied[flip]
+        if not len(slots):
+            return
+        dwell = ts - st["since"][slots[~occupied]]
+        for r in self.rollups:
+            r.count(lot, ts, ARR, int(occupied.sum()))
+            r.count(lot, ts, DEP, int((~occupied).sum()))
+            r.count(lot, ts, DWELL, float(dwell.sum()))
+            r.count(lot, ts, STAYS, len(dwell))
+        st["occupied"][slots] = occupied
+        st["since"][slots] = ts
+        if log:
+            rec = np.empty(len(slots), EVENT)
+            rec["ts"], rec["lot"], rec["space"], rec["occupied"] = ts, lot, slots, occupied
+            self._append(rec)
+
+    def sync(self, lots, ts=None):
+        """Record the full state [(lot name, space ids, occupied flags), ...].
+
+        Spaces that differ from what we had are transitions. A lot or space
+        seen for the first time only starts being observed.
+        """
+        ts = time.time() if ts is None else ts
+        with self.lock:
+            self._start(ts)
+            for name, ids, occupied in lots:
+                lot = self._lot(name)
+                occupied = np.asarray(occupied, bool)
+                st = self.state.get(lot)
+                if st is None or list(st["slots"]) != list(ids):
+                    # new lot or redrawn spaces: keep the history of spaces that stayed
+                    old = st or {"slots": {}, "occupied": np.zeros(0, bool), "since": np.zeros(0)}
+                    if st is not None:
+                        self._advance(lot, ts)
+                    keep = [old["slots"].get(i) for i in ids]
+                    prev = np.array([old["occupied"][k] if k is not None else o
+                                     for k, o in zip(keep, occupied)], bool)
+                    since = np.array([old["since"][k] if k is not None else ts for k in keep])
+                    self.state[lot] = {"slots": {i: j for j, i in enumerate(ids)},
+                                       "occupied": prev, "since": since.reshape(-1),
+                                       "last": ts}
+                self._apply(lot, np.arange(len(occupied)), occupied, ts)
+            self._maybe_save(ts)
+
+    def changes(self, changes, lot_names, ts=None):
+        """Record [(lot index, space id, occupied), ...] from OccupancyStore."""
+        ts = time.time() if ts is None else ts
+        by_lot = {}
+        for lot_i, space_id, occ in changes:
+            by_lot.setdefault(lot_names[lot_i], []).append((space_id, occ))
+        with self.lock:
+            self._start(ts)
+            for name, items in by_lot.items():
+                lot = self.lot_ids.get(name)
+                if lot is None or lot not in self.state:
+                    continue  # not synced yet; the next full state covers it
+                slots = self.state[lot]["slots"]
+                pairs = [(slots[s], o) for s, o in items if s in slots]
+                if pairs:
+                    self._apply(lot, [p[0] for p in pairs], [p[1] for p in pairs], ts)
+            self._maybe_save(ts)
+
+    def attach(self, store):
+        """Follow an OccupancyStore: deltas when it has them, full state otherwise."""
+        def listener(version, changes):
+            with store.lock:
+                names = [lot["name"] for lot in store.lots]
+                if changes is None:
+                    full = list(zip(names, store.space_ids, store.occupancy))
+            if changes is None:
+                self.sync(full)
+            else:
+                self.changes(changes, names)
+        store.subscribe(listener)
+
+    # -- queries ----------------------------------------------------------
+
+    def query(self, lot=None, start=None, end=None, step=3600):
+        """Buckets of `step` seconds from start to end for one lot (by name) or all.
+
+        Uses the coarsest stored resolution that divides `step`. Returns
+        columns: {start, step, occupancy_pct (time-weighted), turnover,
+        departures, mean_dwell_s}, one entry per bucket, None where there is
+        no data. Raises ValueError for ranges over MAX_BUCKETS buckets.
+        """
+        now = time.time()
+        with self.lock:
+            if self.rollups is None:
+                return None
+            self._advance_all(now)  # count the time since the last transition
+            step = max(int(step) // RESOLUTIONS[0] * RESOLUTIONS[0], RESOLUTIONS[0])
+            r = [r for r in self.rollups if step % r.res == 0][-1]
+            start = r.origin if start is None else max(float(start), r.origin)
+            if r.keep:
+                start = max(start, now - r.keep * r.res)  # nothing older is held
+            end = now if end is None else min(float(end), now)
+            b0, b1 = r.bucket(start), r.bucket(end - 1e-9) + 1
+            if b1 <= b0:
+                return None
+            if b1 - b0 > MAX_BUCKETS:
+                raise ValueError(f"at most {MAX_BUCKETS} buckets of {r.res}s per query; "
+                                 "narrow from/to or use a larger step")
+            lots = list(r.rows) if lot is None else [self.lot_ids[lot]] if lot in self.lot_ids else []
+            views = [v for l in lots for v in r.views(l, b0, b1)]
+
+        # Sum outside the lock so a long range does not hold up recording.
+        # A bucket written meanwhile may be read half-updated; the next
+        # query sees it whole.
+        data = np.zeros((b1 - b0, len(FIELDS)))
+        for offset, rows in views:
+            data[offset:offset + len(rows)] += rows
+
+        g = step // r.res
+        pad = -len(data) % g
+        data = np.concatenate([data, np.zeros((pad, len(FIELDS)))]).reshape(-1, g, len(FIELDS)).sum(1)
+        occ = np.divide(data[:, OCC] * 100, data[:, OBS], out=np.full(len(data), np.nan), where=data[:, OBS] > 0)
+        dwell = np.divide(data[:, DWELL], data[:, STAYS], out=np.full(len(data), np.nan), where=data[:, STAYS] > 0)
+        return {"start": r.origin + b0 * r.res, "step": step,
+                "occupancy_pct": _column(occ.round(2)),
+                "turnover": data[:, ARR].astype(np.int64).tolist(),
+                "departures": data[:, DEP].astype(np.int64).tolist(),
+                "mean_dwell_s": _column(dwell.round(1))}
+
+    # -- persistence ------------------------------------------------------
+
+    def _append(self, rec):
+        if self._log is None:
+            self._log = open(os.path.join(self.root, "events.bin"), "ab")
+        self._log.write(rec.tobytes())
+        self.log_count += len(rec)
+
+    def _maybe_save(self, now):
+        if now - self._saved >= self.save_every:
+            self._save()
+            self._saved = now
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        if self.rollups is None:
+            return
+        if self._log is not None:
+            self._log.flush()
+        arrays = {f"{r.res}/{lot}": t for r in self.rollups for lot, t in r.rows.items()}
+        for lot, st in self.state.items():
+            arrays[f"occupied/{lot}"] = st["occupied"]
+            arrays[f"since/{lot}"] = st["since"]
+        meta = {"origin": self.rollups[0].origin, "log_count": self.log_count,
+                "lots": self.lot_ids, "hi": [r.hi for r in self.rollups],
+                "state": {lot: {"ids": list(st["slots"]), "last": st["last"]}
+                          for lot, st in self.state.items()}}
+        tmp = os.path.join(self.root, "rollups.tmp.npz")
+        np.savez(tmp, meta=np.frombuffer(json.dumps(meta).encode(), np.uint8), **arrays)
+        os.replace(tmp, os.path.join(self.root, "rollups.npz"))
+
+    def _saved_key(self):
+        try:
+            return os.stat(os.path.join(self.root, "rollups.npz")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Start over from what the recording process last saved, if it saved
+        since. For read-only copies (serve.py workers), which are then at
+        most `save_every` seconds behind. Returns True if it reloaded."""
+        key = self._saved_key()
+        with self.lock:
+            if key is None or key == self._loaded:
+                return False
+            self.lot_ids, self.state, self.rollups, self.log_count = {}, {}, None, 0
+            self.load()
+            self._loaded = key
+        return True
+
+    def load(self):
+        path = os.path.join(self.root, "rollups.npz")
+        log = os.path.join(self.root, "events.bin")
+        if os.path.exists(path):
+            with np.load(path) as z:
+                meta = json.loads(z["meta"].tobytes())
+                self.rollups = [Rollup(res, meta["origin"], KEEP.get(res)) for res in RESOLUTIONS]
+                for r, hi in zip(self.rollups, meta["hi"]):
+                    r.hi = {int(lot): b for lot, b in hi.items()}
+                    for key in z.files:
+                        if key.startswith(f"{r.res}/"):
+                            r.rows[int(key.split("/")[1])] = z[key].astype(np.float32)
+                self.lot_ids = meta["lots"]
+                for lot, st in meta["state"].items():
+                    lot = int(lot)
+                    self.state[lot] = {"slots": {i: j for j, i in enumerate(st["ids"])},
+                                       "occupied": z[f"occupied/{lot}"].astype(bool),
+                                       "since": z[f"since/{lot}"].copy(), "last": st["last"]}
+                self.log_count = meta["log_count"]
+        # replay transitions logged after the last save; only those are read,
+        # and only whole records (the recorder may be mid-append)
+        start = self.log_count * EVENT.itemsize
+        n = (os.path.getsize(log) - start) // EVENT.itemsize if os.path.exists(log) else 0
+        if self.rollups is not None and n > 0:
+            events = np.fromfile(log, EVENT, count=n, offset=start)
+            for ts in np.unique(events["ts"]):
+                batch = events[events["ts"] == ts]
+                for lot in np.unique(batch["lot"]):
+                    b = batch[batch["lot"] == lot]
+                    if int(lot) in self.state:
+                        b = b[b["space"] < len(self.state[int(lot)]["occupied"])]
+                        self._apply(int(lot), b["space"], b["occupied"].astype(bool), float(ts), log=False)
+            self.log_count += len(events)
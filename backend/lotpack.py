@@ -0,0 +1,162 @@
+"""Compact on-disk format for lot state.
+
+Two files per pack, both replaced atomically:
+
+  lots.bin                  header + lot index + occupancy bitset (tiny,
+                            rewritten on every update)
+  lots.geom-<id>.npy        (n_spaces, n_corners, 2) float64 corners,
+                            written once per geometry and memory-mapped
+                            by readers
+
+lots.bin layout (little-endian):
+
+  8s  magic b"LOTPACK1"
+  Q   version          bumped by the writer on every update
+  8s  geometry id      names the .npy file; changes only with geometry
+  I   n_spaces
+  I   index length     bytes of UTF-8 JSON that follow the header
+  ... lot index JSON   {"lots": [{"name", "coords", "count"}], "ids": [...] or null}
+  ... occupancy        ceil(n_spaces / 8) bytes, one bit per space, LSB first
+
+Geometry files are content-addressed, so a reader never pairs a new
+bitset with old corners: it opens exactly the file the header names.
+"""
+import glob
+import hashlib
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"LOTPACK1"
+HEADER = struct.Struct("<8sQ8sII")
+
+
+def geometry_path(path, geometry_id):
+    return f"{os.path.splitext(path)[0]}.geom-{geometry_id}.npy"
+
+
+def _replace(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def pack_lots(lots):
+    """Split JSON-style lots into (spaces (N, C, 2), occupied (N,), index)."""
+    coords = [space["coords"] for lot in lots for space in lot["spaces"]]
+    spaces = np.asarray(coords, dtype=np.float64).reshape(len(coords), -1, 2)
+    occupied = np.array([bool(space["occupied"]) for lot in lots for space in lot["spaces"]], dtype=bool)
+    ids = [space["id"] for lot in lots for space in lot["spaces"]]
+    default_ids = [j for lot in lots for j in range(len(lot["spaces"]))]
+    index = {
+        "lots": [{"name": lot["name"], "coords": lot["coords"], "count": len(lot["spaces"])}
+                 for lot in lots],
+        "ids": None if ids == default_ids else ids,
+    }
+    return spaces, occupied, index
+
+
+def write(path, spaces, occupied, index, version=None):
+    """Write a pack. The geometry file is only written if it is new.
+
+    Returns the version written (milliseconds since the epoch by default,
+    always greater than the version already on disk).
+    """
+    spaces = np.ascontiguousarray(spaces, dtype=np.float64)
+    geometry_id = hashlib.blake2b(
+        spaces.tobytes() + json.dumps(index, sort_keys=True).encode(), digest_size=4).hexdigest()
+    geom = geometry_path(path, geometry_id)
+    if not os.path.exists(geom):
+        tmp = geom + ".tmp.npy"
+        np.save(tmp, spaces)
+        os.replace(tmp, geom)
+
+    if version is None:
+        version = int(time.time() * 1000)
+        try:
+            with open(path, "rb") as f:
+                version = max(version, HEADER.unpack(f.read(HEADER.size))[1] + 1)
+        except (OSError, struct.error):
+            pass
+
+    index_raw = json.dumps(index, separators=(",", ":")).encode()
+    bits = np.packbits(np.asarray(occupied, dtype=bool), bitorder="little")
+    _replace(path, HEADER.pack(MAGIC, version, geometry_id.encode(), len(spaces), len(index_raw))
+             + index_raw + bits.tobytes())
+
+    # Readers that opened an older geometry keep their mapping; the file
+    # just loses its name. Keep one previous file for readers mid-switch.
+    old = sorted(glob.glob(geometry_path(path, "*")), key=os.path.getmtime)
+    for stale in [p for p in old if p != geom][:-1]:
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+    return version
+
+
+def write_lots(path, lots, version=None):
+    return write(path, *pack_lots(lots), version=version)
+
+
+class LotPack:
+    """Read side of a pack: the small state file is re-read when it changes,
+    the geometry is memory-mapped and shared with every other reader."""
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.geometry_id = None
+        self.spaces = None      # (N, C, 2) read-only memmap
+        self.occupied = None    # (N,) bool
+        self.index = None
+        self._key = None
+        self._coords = None     # spaces.tolist(), cached per geometry
+
+    def refresh(self):
+        """Re-read the pack if it changed on disk. Returns True if it did."""
+        st = os.stat(self.path)
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if key == self._key:
+            return False
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        magic, version, geometry_id, n, index_len = HEADER.unpack_from(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a lot pack")
+        geometry_id = geometry_id.decode()
+        index = json.loads(raw[HEADER.size:HEADER.size + index_len])
+        bits = np.frombuffer(raw, dtype=np.uint8, offset=HEADER.size + index_len)
+
+        if geometry_id != self.geometry_id:
+            spaces = np.load(geometry_path(self.path, geometry_id), mmap_mode="r")
+            if len(spaces) != n:
+                raise ValueError(f"{self.path}: geometry has {len(spaces)} spaces, header says {n}")
+            self.spaces, self.geometry_id, self._coords = spaces, geometry_id, None
+
+        self.occupied = np.unpackbits(bits, count=n, bitorder="little").astype(bool)
+        self.version, self.index, self._key = version, index, key
+        return True
+
+    def lots(self):
+        """JSON-style view, same shape as lots.json."""
+        if self._coords is None:
+            self._coords = self.spaces.tolist()
+        ids = self.index["ids"]
+        occupied = self.occupied.tolist()
+        out, start = [], 0
+        for lot in self.index["lots"]:
+            end = start + lot["count"]
+            out.append({
+                "name": lot["name"],
+                "spaces": [{"id": ids[i] if ids is not None else i - start,
+                            "coords": self._coords[i], "occupied": occupied[i]}
+                           for i in range(start, end)],
+                "coords": lot["coords"],
+            })
+            start = end
+        return out
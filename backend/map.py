@@ -1,65 +1,111 @@
-from flask import Flask, render_template_string
+from flask import Flask, Response, request
 import folium
+import html
 import json
-import random
 import numpy as np
 
 from generate_coordinates import *
+from store import OccupancyStore
 
 app = Flask(__name__)
 
 # Define a zoom threshold. Levels above this show details.
 ZOOM_THRESHOLD = 18
 
+# The binary pack written by write_lot_to_json.py, else the JSON file
+LOTS_FILES = ["lots.bin", "lots.json"]
+
+# Replaced per request by the current occupancy, so the cached page
+# shows the right colors before its first /state poll.
+STATE_PLACEHOLDER = "__INITIAL_STATE__"
+
+store = OccupancyStore()
+
+# Rendered page for the current geometry: {geometry etag: html}
+_pages = {}
+
+def refresh():
+    # serve.py workers reload from a watch_file() thread instead
+    if store.watching:
+        return
+    try:
+        store.load_file(LOTS_FILES)
+    except (IOError, ValueError) as e:
+        # Keep serving the last good version, if there is one
+        print(f"Error reading lot data: {e}")
+
 @app.route("/")
 def index():
+    refresh()
+    if store.geometry is None:
+        # No lots file yet (write_lot_to_json.py has not run)
+        return Response("No lot data yet; try again shortly.", status=503,
+                        mimetype="text/plain", headers={"Retry-After": "5"})
+    key = store.geometry.etag
+    page = _pages.get(key)
+    if page is None:
+        # Geometry changed (or first hit): this is the only slow path
+        page = render_static(store.lots, key)
+        _pages.clear()
+        _pages[key] = page
+    # The map sits in an iframe srcdoc, so the JSON must be attribute-escaped
+    state = store.state.bodies["identity"].decode()
+    return page.replace(STATE_PLACEHOLDER, html.escape(state, quote=True))
+
+@app.route("/state")
+def state():
+    """Current occupancy per lot; the page polls this to recolor itself."""
+    refresh()
+    enc = store.state
+    if enc is None:
+        return Response(status=503, headers={"Retry-After": "5"})
+    headers = {"ETag": f'"{enc.etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if enc.etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    encoding, body = enc.negotiate(request.accept_encodings)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype="application/json", headers=headers)
+
+def render_static(lots, geometry_id):
+    """Build the Folium page for the lots' geometry only.
+
+    Everything that depends on occupancy (colors, counts, popups, labels) is
+    applied by the page script from a /state JSON, so this only has to run
+    again when a lot or space is redrawn.
+    """
     # Create the map
     m = folium.Map(location=[38.0336, -78.5080], zoom_start=17, max_zoom=22)
 
-    with open('lots.json', 'r') as f:
-        lots = json.load(f)
-
     # Create FeatureGroups for different zoom levels
     detailed_group = folium.FeatureGroup(name="Detailed Spaces", show=False)
     summary_group = folium.FeatureGroup(name="Lot Summary", show=True)
 
 
+    # Layer variable names per lot, so the page script can restyle them
+    lot_layers, lot_labels, label_templates, space_layers = [], [], [], []
+
     for lot in lots:
-        # --- Part 1: Calculate Lot Summary ---
-        total_spaces = len(lot["spaces"])
-        occupied_spaces = sum(1 for s in lot["spaces"] if s["occupied"])
-        available_spaces = total_spaces - occupied_spaces
-        occupancy_rate = occupied_spaces / total_spaces if total_spaces > 0 else 0
-        
-        # NEW: Calculate percentage open
-        percentage_open = (available_spaces / total_spaces) * 100 if total_spaces > 0 else 0
-
-        # Determine summary color based on occupancy
-        if occupancy_rate > 0.8:
-            summary_color = "red"
-        elif occupancy_rate > 0.5:
-            summary_color = "orange"
-        else:
-            summary_color = "green"
-
-        # --- Part 2: Create the Summary Polygon ---
-        folium.Polygon(
+        # --- Part 1: Create the Summary Polygon ---
+        # Colors, counts and popups are filled in by applyState() below
+        summary = folium.Polygon(
             locations=lot["coords"],
-            color=summary_color,
+            color="gray",
             fill=True,
-            fill_color=summary_color,
+            fill_color="gray",
             fill_opacity=0.6,
-            popup=f"<b>{lot['name']}</b><br>"
-                  f"{available_spaces} / {total_spaces} Available"
+            popup=f"<b>{lot['name']}</b>"
         ).add_to(summary_group)
+        lot_layers.append(summary.get_name())
         
-        # --- NEW: Part 3: Create a permanent text label for the summary view ---
+        # --- Part 2: Create a permanent text label for the summary view ---
         
         # 1. Calculate the center of the lot for the label's position
         lot_coords_np = np.array(lot["coords"])
         center_point = lot_coords_np.mean(axis=0).tolist()
 
         # 2. Create custom HTML for the label using DivIcon
+        # (__PCT__ is replaced with the current percentage open by the page)
         label_html = f"""
         <div style="
             background-color: rgba(255, 255, 255, 0.8);
@@ -73,40 +119,50 @@ def index():
             white-space: nowrap;
             ">
             {lot['name']}<br>
-            {percentage_open:.0f}% Open
+            __PCT__% Open
         </div>
         """
+        label_templates.append(label_html)
         
         # 3. Create the marker with the custom HTML icon
-        folium.Marker(
+        marker = folium.Marker(
             location=center_point,
             icon=folium.DivIcon(
-                html=label_html,
+                html=label_html.replace("__PCT__", "&ndash;"),
                 icon_size=(150, 36), # Adjust size as needed
                 icon_anchor=(75, 18)   # Center the anchor
             )
         ).add_to(summary_group)
+        lot_labels.append(marker.get_name())
 
 
-        # --- Part 4: Create the Detailed Polygons ---
+        # --- Part 3: Create the Detailed Polygons ---
+        names = []
         for space in lot["spaces"]:
-            folium.Polygon(
+            polygon = folium.Polygon(
                 locations=space["coords"],
-                color="red" if space["occupied"] else "green",
+                color="gray",
                 fill=True,
                 fill_opacity=0.6,
-                popup=f"{lot['name']} – Space {space['id']} "
-                      f"({'Occupied' if space['occupied'] else 'Available'})",
+                popup=f"{lot['name']} – Space {space['id']}",
             ).add_to(detailed_group)
+            names.append(polygon.get_name())
+        space_layers.append(names)
 
     # Add the feature groups to the map
     detailed_group.add_to(m)
     summary_group.add_to(m)
 
     # The original JavaScript for toggling layers doesn't need any changes!
+    # applyState() recolors the layers from /state without re-rendering.
     map_name = m.get_name()
     detailed_layer_name = detailed_group.get_name()
     summary_layer_name = summary_group.get_name()
+    lot_names = json.dumps([lot["name"] for lot in lots])
+    lot_layer_list = "[" + ",".join(lot_layers) + "]"
+    lot_label_list = "[" + ",".join(lot_labels) + "]"
+    space_layer_list = "[" + ",".join("[" + ",".join(names) + "]" for names in space_layers) + "]"
+    space_ids = json.dumps([[space["id"] for space in lot["spaces"]] for lot in lots])
 
     js = f"""
     <script>
@@ -128,6 +184,56 @@ def index():
             }}
             toggleLayers();
             map.on('zoomend', toggleLayers);
+
+            const lotNames = {lot_names};
+            const lotLayers = {lot_layer_list};
+            const lotLabels = {lot_label_list};
+            const labelTemplates = {json.dumps(label_templates)};
+            const spaceLayers = {space_layer_list};
+            const spaceIds = {space_ids};
+            let shown = lotNames.map(() => []);
+
+            function applyState(state) {{
+                state.lots.forEach((lot, i) => {{
+                    const occupied = lot.occupied;
+                    const total = occupied.length;
+                    const occupiedSpaces = occupied.reduce((a, b) => a + b, 0);
+                    const available = total - occupiedSpaces;
+                    const rate = total > 0 ? occupiedSpaces / total : 0;
+                    const open = total > 0 ? (available / total) * 100 : 0;
+                    const color = rate > 0.8 ? "red" : (rate > 0.5 ? "orange" : "green");
+
+                    lotLayers[i].setStyle({{color: color, fillColor: color}});
+                    lotLayers[i].setPopupContent(
+                        `<b>${{lotNames[i]}}</b><br>${{available}} / ${{total}} Available`);
+                    lotLabels[i].setIcon(L.divIcon({{
+                        html: labelTemplates[i].replace("__PCT__", open.toFixed(0)),
+                        iconSize: [150, 36], iconAnchor: [75, 18], className: "",
+                    }}));
+
+                    // Only touch the spaces that flipped since the last state
+                    occupied.forEach((occ, j) => {{
+                        if (shown[i][j] === occ) return;
+                        const layer = spaceLayers[i][j];
+                        layer.setStyle({{color: occ ? "red" : "green", fillColor: occ ? "red" : "green"}});
+                        layer.setPopupContent(`${{lotNames[i]}} – Space ${{spaceIds[i][j]}} ` +
+                                              `(${{occ ? 'Occupied' : 'Available'}})`);
+                    }});
+                    shown[i] = occupied;
+                }});
+            }}
+
+            applyState({STATE_PLACEHOLDER});
+            setInterval(() => {{
+                fetch("/state")
+                    .then(r => r.json())
+                    .then(state => {{
+                        // New geometry needs a freshly rendered page
+                        if (state.geometry !== "{geometry_id}") {{ window.top.location.reload(); }}
+                        else {{ applyState(state); }}
+                    }})
+                    .catch(e => console.error("Error fetching parking state:", e));
+            }}, 5000);
         }});
     </script>
     """
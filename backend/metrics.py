@@ -0,0 +1,469 @@
+"""Prometheus-style metrics and a sampling span timer, with no dependencies.
+
+Counters, gauges and histograms are registered once in the process-wide
+REGISTRY and rendered in the Prometheus text format by render(): api.py
+serves it at /metrics, capture processes with serve(port). Registering a
+name twice returns the metric already there, so modules can declare what
+they use at import time.
+
+span(name) times a block for a sampled fraction of calls. Sampling starts
+off and is changed at runtime (set_sampling(), or /trace?rate=0.05), so an
+instrumented block costs one comparison until someone goes looking for
+the hot stage; /trace then lists spans by total time.
+
+Processes that serve one endpoint between them (serve.py's workers) call
+share(directory): each then writes its values there every second, and
+render() and trace_summary() add up those of every process. A sampling
+rate set in one of them is picked up by the others.
+"""
+import bisect
+import glob
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# seconds; from a fast cache hit to a slow camera
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values, **kw):
+        """The series for these label values, created on first use."""
+        if kw:
+            values = tuple(kw[n] for n in self.label_names)
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self.children.items()):
+            lines.extend(child.render(self.name, self.label_names, key))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "fn", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.fn = None
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+    def set(self, v):
+        self.value = float(v)
+
+    def set_function(self, fn):
+        """Read the value from fn() at scrape time (queue depth, staleness)."""
+        self.fn = fn
+
+    def get(self):
+        if self.fn is not None:
+            try:
+                return float(self.fn())
+            except Exception:
+                return float("nan")
+        return self.value
+
+    def render(self, name, names, key):
+        return [f"{name}{_labels(names, key)} {_num(self.get())}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _child = _Value
+
+    def inc(self, n=1):
+        self.labels().inc(n)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _child = _Value
+
+    def set(self, v):
+        self.labels().set(v)
+
+    def set_function(self, fn):
+        self.labels().set_function(fn)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, v):
+        i = bisect.bisect_left(self.bounds, v)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += v
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, names, key):
+        lines, total = [], 0
+        for bound, n in zip(self.bounds + (float("inf"),), self.counts):
+            total += n
+            le = 'le="%s"' % _num(bound)
+            lines.append(f"{name}_bucket{_labels(names, key, le)} {total}")
+        lines.append(f"{name}_sum{_labels(names, key)} {_num(self.sum)}")
+        lines.append(f"{name}_count{_labels(names, key)} {total}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("target", "t0")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.t0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, v):
+        self.labels().observe(v)
+
+    def time(self):
+        return self.labels().time()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kw):
+        with self.lock:
+            m = self.metrics.get(name)
+            if m is None:
+                m = self.metrics[name] = cls(name, help, labels, **kw)
+            elif not isinstance(m, cls) or m.label_names != tuple(labels):
+                raise ValueError(f"metric {name} already registered as a different {m.kind}")
+            return m
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def render():
+    """Every metric in the Prometheus text format; with share(), summed
+    over the processes sharing the directory."""
+    if _shared is None:
+        return REGISTRY.render()
+    _write_snapshot()
+    merged = Registry()
+    kinds = {"counter": merged.counter, "gauge": merged.gauge, "histogram": merged.histogram}
+    for snap, fresh in _snapshots():
+        for name, m in snap["metrics"].items():
+            if m["kind"] == "gauge" and not fresh:
+                continue  # a gauge from a process that stopped means nothing now
+            extra = {"buckets": m["buckets"]} if m["kind"] == "histogram" else {}
+            target = kinds[m["kind"]](name, m["help"], m["labels"], **extra)
+            for key, *value in m["series"]:
+                child = target.labels(*key)
+                if m["kind"] == "histogram":
+                    child.counts = [a + b for a, b in zip(child.counts, value[0])]
+                    child.sum += value[1]
+                else:
+                    child.value += value[0]
+    return merged.render()
+
+
+# -- sampled spans ------------------------------------------------------------
+
+SPAN_SECONDS = histogram("span_seconds", "Duration of sampled spans", ["span"])
+_rate = 0.0
+_epoch = 0.0  # when the rate was last set; spans sampled before it are dropped
+_spans = {}  # name -> [sampled count, total seconds]
+_spans_lock = threading.Lock()
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        SPAN_SECONDS.labels(self.name).observe(dt)
+        with _spans_lock:
+            s = _spans.setdefault(self.name, [0, 0.0])
+            s[0] += 1
+            s[1] += dt
+        return False
+
+
+def span(name):
+    """`with span("decode"):` times the block for a sampled share of calls."""
+    if _rate <= 0.0 or (_rate < 1.0 and random.random() >= _rate):
+        return _NO_SPAN
+    return _Span(name)
+
+
+def _set_rate(rate, epoch):
+    global _rate, _epoch
+    with _spans_lock:
+        _rate, _epoch = rate, epoch
+        _spans.clear()
+
+
+def set_sampling(rate):
+    """Share of span() calls to time, 0 (off) to 1; resets the /trace totals.
+    With share(), for every process sharing the directory. Raises
+    ValueError for anything but a finite number."""
+    rate = float(rate)
+    if not math.isfinite(rate):
+        raise ValueError(f"sampling rate must be a finite number, not {rate}")
+    rate = min(max(rate, 0.0), 1.0)
+    epoch = time.time()
+    if _shared is not None:
+        _write_json(os.path.join(_shared, "trace.json"), {"rate": rate, "epoch": epoch})
+    _set_rate(rate, epoch)
+
+
+def trace_summary():
+    """Spans by estimated total time (sampled time / rate), hottest first."""
+    if _shared is None:
+        with _spans_lock:
+            totals = {name: tuple(s) for name, s in _spans.items()}
+    else:
+        _write_snapshot()
+        totals = {}
+        for snap, _ in _snapshots():
+            if snap["epoch"] != _epoch:
+                continue  # sampled at a rate since replaced
+            for name, (n, total) in snap["spans"].items():
+                old = totals.get(name, (0, 0.0))
+                totals[name] = (old[0] + n, old[1] + total)
+    items = [(name, n, total) for name, (n, total) in totals.items()]
+    scale = 1.0 / _rate if _rate > 0 else 1.0
+    items.sort(key=lambda x: -x[2])
+    return {"rate": _rate,
+            "spans": [{"span": name, "sampled": n, "mean_ms": round(total / n * 1000, 3),
+                       "est_total_s": round(total * scale, 3)} for name, n, total in items]}
+
+
+def trace_request(query):
+    """Handle /trace?rate=: change the sampling if asked, then summarize."""
+    rate = query.get("rate")
+    if rate is not None:
+        set_sampling(rate)
+    return trace_summary()
+
+
+# -- several processes, one set of metrics ----------------------------------------
+
+_shared = None  # directory given to share()
+_interval = 1.0
+
+
+def _write_json(path, doc):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f)
+    os.replace(tmp, path)
+
+
+def _write_snapshot():
+    """This process's values, to <directory>/<pid>.json."""
+    with REGISTRY.lock:
+        ms = list(REGISTRY.metrics.values())
+    out = {}
+    for m in ms:
+        series = []
+        for key, child in list(m.children.items()):
+            if isinstance(child, _Buckets):
+                with child.lock:
+                    series.append([list(key), list(child.counts), child.sum])
+            else:
+                series.append([list(key), child.get()])
+        out[m.name] = {"kind": m.kind, "help": m.help, "labels": list(m.label_names),
+                       "buckets": list(getattr(m, "buckets", ())), "series": series}
+    with _spans_lock:
+        spans, epoch = {name: list(s) for name, s in _spans.items()}, _epoch
+    _write_json(os.path.join(_shared, f"{os.getpid()}.json"),
+                {"metrics": out, "spans": spans, "epoch": epoch})
+
+
+def _snapshots():
+    """(snapshot, fresh) for every process that wrote one; fresh if it was
+    written in the last few intervals, i.e. by a process still running."""
+    now = time.time()
+    for path in glob.glob(os.path.join(_shared, "[0-9]*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            fresh = now - os.path.getmtime(path) < 3 * _interval + 1
+        except (OSError, ValueError):
+            continue  # replaced or removed while we looked
+        yield snap, fresh
+
+
+def _sync():
+    try:
+        with open(os.path.join(_shared, "trace.json"), "r", encoding="utf-8") as f:
+            t = json.load(f)
+        if t["epoch"] != _epoch:
+            _set_rate(float(t["rate"]), t["epoch"])
+    except (OSError, ValueError, KeyError):
+        pass  # nobody set a rate yet
+    _write_snapshot()
+
+
+def share(directory, interval=1.0):
+    """Serve one set of metrics from several processes: write this one's
+    values to `directory` every `interval` seconds, and follow sampling
+    rates set by the others. Call it in each process, after fork()."""
+    global _shared, _interval
+    os.makedirs(directory, exist_ok=True)
+    _shared, _interval = directory, interval
+    _sync()
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                _sync()
+            except OSError:
+                pass  # directory removed on shutdown
+
+    threading.Thread(target=loop, name="metrics-share", daemon=True).start()
+
+
+# -- standalone endpoint --------------------------------------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            body, ctype = render().encode(), CONTENT_TYPE
+        elif url.path == "/trace":
+            try:
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                body, ctype = json.dumps(trace_request(query)).encode(), "application/json"
+            except ValueError:
+                self.send_error(400, "rate must be a number from 0 to 1")
+                return
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # scraped every few seconds; keep the console for real output
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve /metrics and /trace from a daemon thread, for processes
+    without a web server of their own."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,156 @@
+"""Server-Sent Events channel for occupancy changes.
+
+One asyncio loop serves every subscriber, so thousands of open streams cost
+a socket and a small dict each, not a thread. Each subscriber has a bounded
+set of pending changes keyed by space: a slow reader gets the latest state
+of each space once, and one that falls too far behind is sent a full state
+instead.
+"""
+import asyncio
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+HEARTBEAT_SEC = 15      # keeps proxies from closing idle streams
+MAX_PENDING = 1024      # changed spaces buffered per client before resync
+WRITE_TIMEOUT_SEC = 30  # a client that can't take a write this long is dropped
+
+
+class Subscriber:
+    __slots__ = ("version", "pending", "resync", "wake")
+
+    def __init__(self):
+        self.version = None
+        self.pending = {}
+        self.resync = False
+        self.wake = asyncio.Event()
+
+    def push(self, version, changes):
+        self.version = version
+        if changes is None:
+            self.resync = True
+        elif not self.resync:
+            for lot_i, space_id, occ in changes:
+                self.pending[lot_i, space_id] = occ
+            if len(self.pending) > MAX_PENDING:
+                self.resync = True
+        if self.resync:
+            self.pending.clear()
+        self.wake.set()
+
+
+class PushServer:
+    def __init__(self, store, host="127.0.0.1", port=5001):
+        self.store = store
+        self.host, self.port = host, port
+        self.loop = None
+        self.subscribers = set()
+
+    def publish(self, version, changes):
+        """Store listener; may be called from any thread."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._fanout, version, changes)
+
+    def _fanout(self, version, changes):
+        for sub in self.subscribers:
+            sub.push(version, changes)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.store.subscribe(self.publish)
+        server = await asyncio.start_server(self._handle, self.host, self.port,
+                                            backlog=4096)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode("latin-1").split("\r\n")
+        method, target = (lines[0].split(" ") + ["", ""])[:2]
+        headers = {k.strip().lower(): v.strip() for k, _, v in
+                   (line.partition(":") for line in lines[1:] if line)}
+        url = urlsplit(target)
+
+        if method == "OPTIONS":
+            writer.write(b"HTTP/1.1 204 No Content\r\n"
+                         b"Access-Control-Allow-Origin: *\r\n"
+                         b"Access-Control-Allow-Headers: Last-Event-ID\r\n"
+                         b"Access-Control-Max-Age: 86400\r\n"
+                         b"Content-Length: 0\r\n\r\n")
+            await self._close(writer)
+            return
+        if method != "GET" or url.path != "/events":
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            await self._close(writer)
+            return
+
+        # EventSource resends the last id it saw when it reconnects
+        since = headers.get("last-event-id") or parse_qs(url.query).get("since", ["-1"])[0]
+        try:
+            since = int(since)
+        except ValueError:
+            since = -1
+
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-store\r\n"
+                     b"Access-Control-Allow-Origin: *\r\n"
+                     b"Connection: keep-alive\r\n\r\n")
+        sub = Subscriber()
+        self.subscribers.add(sub)
+        try:
+            version = self.store.version
+            enc = self.store.delta(since)
+            if enc is not None:  # nothing loaded yet: wait for the first update
+                await self._send(writer, version, enc.bodies["identity"])
+            while True:
+                try:
+                    await asyncio.wait_for(sub.wake.wait(), HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                    await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT_SEC)
+                    continue
+                sub.wake.clear()
+                version = sub.version
+                if sub.resync:
+                    sub.resync = False
+                    version = self.store.version
+                    body = self.store.state.bodies["identity"]
+                else:
+                    changes = [[lot_i, space_id, int(occ)]
+                               for (lot_i, space_id), occ in sub.pending.items()]
+                    sub.pending = {}
+                    body = json.dumps({"version": version, "full": False, "changes": changes},
+                                      separators=(",", ":")).encode()
+                # Updates that arrive while this write drains coalesce in sub.pending
+                await self._send(writer, version, body)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self.subscribers.discard(sub)
+            writer.close()
+
+    @staticmethod
+    async def _send(writer, version, body):
+        writer.write(b"id: %d\ndata: %s\n\n" % (version, body))
+        await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT_SEC)
+
+    @staticmethod
+    async def _close(writer):
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+def start_in_thread(store, host="127.0.0.1", port=5001):
+    """Run the push server on its own event loop in a daemon thread."""
+    server = PushServer(store, host, port)
+    threading.Thread(target=lambda: asyncio.run(server.serve()),
+                     name="push", daemon=True).start()
+    return server
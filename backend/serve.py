@@ -0,0 +1,146 @@
+"""Production server for api.py (or map.py): gunicorn with threaded workers.
+
+    python serve.py                          # api.py on :5000, push on :5001
+    python serve.py --workers 8 --bind 0.0.0.0:5000
+    python serve.py --app map --bind 0.0.0.0:8000
+
+The dev servers (`python api.py`) handle one request at a time in one
+process. Here every worker is a process with a pool of threads, and idle
+keep-alive connections wait in the worker's poller, not in a thread, so
+a thousand pollers cost sockets rather than threads.
+
+Workers share the lot state through lots.bin: the geometry is
+memory-mapped (one copy in the page cache for all of them) and each
+worker re-reads the small header and bitset from a watch thread when it
+changes, never per request. The app is imported once before forking, so
+the parsed history and forecast tables are shared copy-on-write too.
+
+Things that must happen once per deployment run in a separate recorder
+process (`python serve.py --recorder`): recording the history, refitting
+forecasts and the push stream at /events. Workers reload the history and
+forecasts when the recorder saves them, so /history and /forecast are at
+most a minute behind.
+
+Every worker and the recorder write their metrics to a shared directory
+(metrics.share()), so /metrics on any worker adds up all of them, and a
+/trace?rate= sent to one worker reaches every process.
+
+gunicorn runs on Linux and macOS.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    raise SystemExit("serve.py needs gunicorn: pip install gunicorn")
+
+import metrics
+
+class Server(BaseApplication):
+    """gunicorn, configured from a dict instead of the command line."""
+
+    def __init__(self, module, options):
+        self.module = module
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return importlib.import_module(self.module).app
+
+
+def options(args):
+    def post_fork(server, worker):
+        # threads do not survive fork(): start the watcher in each worker
+        importlib.import_module(args.app).store.watch_file(args.lots, args.poll)
+        metrics.share(args.metrics_dir)
+
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "worker_connections": args.connections,  # open connections per worker
+        "keepalive": args.keepalive,
+        "backlog": 2048,
+        "timeout": 30,
+        "preload_app": True,
+        "post_fork": post_fork,
+        "accesslog": None,  # a line per poll is most of the CPU at this rate
+        "errorlog": "-",
+    }
+
+
+def recorder(args):
+    """History, forecast refits and the push stream, for all workers."""
+    import api
+    import push
+    api.record()
+    api.store.watch_file(args.lots, args.poll)
+    if args.metrics_dir:
+        metrics.share(args.metrics_dir)
+    host = args.bind.rpartition(":")[0] or "127.0.0.1"
+    print(f"Recorder: history in {os.path.abspath(api.history.root)}, push on {host}:{args.push_port}")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(push.PushServer(api.store, host, args.push_port).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.history.save()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve api.py or map.py with several workers.")
+    ap.add_argument("--app", choices=["api", "map"], default="api")
+    ap.add_argument("--bind", default="127.0.0.1:5000")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--threads", type=int, default=8, help="request threads per worker")
+    ap.add_argument("--connections", type=int, default=1000, help="open connections per worker")
+    ap.add_argument("--keepalive", type=int, default=75,
+                    help="seconds an idle connection stays open (above a 60s proxy idle timeout)")
+    ap.add_argument("--poll", type=float, default=0.25, help="seconds between lots file checks")
+    ap.add_argument("--push-port", type=int, default=5001)
+    ap.add_argument("--no-recorder", action="store_true", help="another process records (api only)")
+    ap.add_argument("--recorder", action="store_true", help="run only the recorder")
+    ap.add_argument("--metrics-dir", help="where processes share metrics (default: a new temporary directory)")
+    args = ap.parse_args()
+
+    mod = importlib.import_module(args.app)
+    args.lots = mod.LOTS_FILES
+
+    if args.recorder:
+        recorder(args)
+        return
+
+    own_dir = args.metrics_dir is None
+    if own_dir:
+        args.metrics_dir = tempfile.mkdtemp(prefix="parking-metrics-")
+    child = None
+    if args.app == "api" and not args.no_recorder:
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--recorder",
+                                  "--bind", args.bind, "--push-port", str(args.push_port),
+                                  "--poll", str(args.poll), "--metrics-dir", args.metrics_dir])
+    try:
+        Server(args.app, options(args)).run()
+    finally:
+        if child is not None and child.poll() is None:
+            child.terminate()  # saves the history on the way out
+            child.wait(30)
+        if own_dir:
+            shutil.rmtree(args.metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
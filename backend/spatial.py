@@ -0,0 +1,123 @@
+import numpy as np
+
+# Meters per degree, close enough for campus-sized areas
+M_PER_DEG_LAT = 110540.0
+M_PER_DEG_LON = 111320.0
+
+# Keep the grid table small even when spaces are spread over a large area
+MAX_CELLS = 1 << 20
+
+
+class SpaceIndex:
+    """Uniform grid over every space of every lot, for viewport and
+    nearest-space queries.
+
+    Spaces are bucketed by centroid into square cells (CSR layout: one sorted
+    index array plus a start offset per cell), so a query only looks at the
+    cells it overlaps. Build it once per geometry; occupancy is passed in at
+    query time.
+    """
+
+    def __init__(self, lots, cell_m=25.0):
+        self.lot = np.array([i for i, lot in enumerate(lots) for _ in lot["spaces"]], dtype=np.int64)
+        self.ids = [space["id"] for lot in lots for space in lot["spaces"]]
+        self.coords = [space["coords"] for lot in lots for space in lot["spaces"]]
+        self.lot_names = [lot["name"] for lot in lots]
+        n = len(self.coords)
+
+        try:
+            # the usual case: every space has the same number of corners
+            polys = np.asarray(self.coords, dtype=np.float64).reshape(n, -1, 2)
+            self.bbox = np.concatenate([polys.min(1), polys.max(1)], 1)
+            self.center = polys.mean(1)  # lat, lon
+        except ValueError:
+            polys = [np.asarray(c, dtype=np.float64) for c in self.coords]
+            self.bbox = np.array([np.r_[p.min(0), p.max(0)] for p in polys]).reshape(n, 4)
+            self.center = np.array([p.mean(0) for p in polys]).reshape(n, 2)
+
+        lat0 = self.center[:, 0].mean() if n else 0.0
+        self.scale = np.array([M_PER_DEG_LAT, M_PER_DEG_LON * np.cos(np.radians(lat0))])
+        xy = self.center * self.scale
+        self.origin = xy.min(0) if n else np.zeros(2)
+        span = (xy.max(0) - self.origin) if n else np.zeros(2)
+        self.cell = max(cell_m, np.sqrt((span[0] + 1) * (span[1] + 1) / MAX_CELLS))
+        self.shape = (np.floor(span / self.cell).astype(np.int64) + 1)  # rows, cols
+
+        cells = self._cells(xy)
+        self.order = np.argsort(cells, kind="stable")
+        self.start = np.searchsorted(cells[self.order], np.arange(self.shape.prod() + 1))
+        self.xy = xy
+        # A space's bbox can reach this far past its centroid's cell
+        half = (self.bbox[:, 2:] - self.bbox[:, :2]) / 2 if n else np.zeros((0, 2))
+        self.pad = half.max(0) if n else np.zeros(2)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rc(self, xy):
+        rc = np.floor((xy - self.origin) / self.cell).astype(np.int64)
+        return np.clip(rc, 0, self.shape - 1)
+
+    def _cells(self, xy):
+        rc = self._rc(xy)
+        return rc[..., 0] * self.shape[1] + rc[..., 1]
+
+    def _block(self, r0, r1, c0, c1):
+        """Indices of spaces in cell rows r0..r1, cols c0..c1 (inclusive)."""
+        rows = np.arange(r0, r1 + 1)
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.int64)
+        lo = self.start[rows * self.shape[1] + c0]
+        hi = self.start[rows * self.shape[1] + c1 + 1]
+        return self.order[np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])]
+
+    def in_bbox(self, south, west, north, east):
+        """Indices of spaces whose bounding box overlaps the query box."""
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        lo = self._rc((np.array([south, west]) - self.pad) * self.scale)
+        hi = self._rc((np.array([north, east]) + self.pad) * self.scale)
+        cand = self._block(lo[0], hi[0], lo[1], hi[1])
+        b = self.bbox[cand]
+        keep = (b[:, 0] <= north) & (b[:, 2] >= south) & (b[:, 1] <= east) & (b[:, 3] >= west)
+        return cand[keep]
+
+    def nearest(self, lat, lon, k=5, mask=None):
+        """(indices, meters) of the k spaces nearest to a point, optionally
+        only among spaces where mask is True; searched ring by ring."""
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        q = np.array([lat, lon]) * self.scale
+        r, c = self._rc(q)
+        best_i, best_d = np.zeros(0, dtype=np.int64), np.zeros(0)
+        for ring in range(int(self.shape.max()) + 1):
+            r0, r1, c0, c1 = r - ring, r + ring, c - ring, c + ring
+            parts = []
+            # only the outline of the (2*ring+1)^2 block is new
+            if ring == 0:
+                parts.append(self._block(r, r, c, c))
+            else:
+                if r0 >= 0:
+                    parts.append(self._block(r0, r0, max(c0, 0), min(c1, self.shape[1] - 1)))
+                if r1 < self.shape[0]:
+                    parts.append(self._block(r1, r1, max(c0, 0), min(c1, self.shape[1] - 1)))
+                rows = (max(r0 + 1, 0), min(r1 - 1, self.shape[0] - 1))
+                if c0 >= 0:
+                    parts.append(self._block(rows[0], rows[1], c0, c0))
+                if c1 < self.shape[1]:
+                    parts.append(self._block(rows[0], rows[1], c1, c1))
+            if not parts:
+                break  # the ring is past every edge of the grid
+            cand = np.concatenate(parts)
+            if mask is not None:
+                cand = cand[mask[cand]]
+            if len(cand):
+                d = np.hypot(*(self.xy[cand] - q).T)
+                best_i = np.concatenate([best_i, cand])
+                best_d = np.concatenate([best_d, d])
+                keep = np.argsort(best_d, kind="stable")[:k]
+                best_i, best_d = best_i[keep], best_d[keep]
+            # anything not seen yet is at least `ring` cells away
+            if len(best_i) == k and best_d[-1] <= ring * self.cell:
+                break
+        return best_i, best_d
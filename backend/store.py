@@ -0,0 +1,197 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from lotpack import LotPack
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+# Versions of per-space changes kept for /data?since=; clients further
+# behind than this get a full state instead.
+HISTORY = 256
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+class Encoded:
+    """One response body, serialized and compressed once."""
+
+    __slots__ = ("etag", "bodies")
+
+    def __init__(self, raw, etag=None, compress=True):
+        self.etag = etag or hashlib.blake2b(raw, digest_size=8).hexdigest()
+        self.bodies = {"identity": raw}
+        if compress:
+            self.bodies["gzip"] = gzip.compress(raw, 6)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(raw, quality=5)
+
+    def negotiate(self, accept_encodings):
+        """Return (encoding, body) for a werkzeug Accept-Encoding header."""
+        best = accept_encodings.best_match(list(self.bodies), default="identity")
+        return best, self.bodies[best]
+
+
+class OccupancyStore:
+    """In-process copy of every lot and space, bumped to a new version on
+    each change.
+
+    Readers get `Encoded` bodies, so a request never serializes or compresses
+    anything; the work happens once per update. Besides the full lots
+    (`encoded`), the store keeps geometry and occupancy apart: `geometry`
+    only changes when a lot is redrawn, `state` is the occupancy alone, and
+    `delta(since)` lists the spaces that flipped after a given version.
+    """
+
+    def __init__(self, history=HISTORY):
+        self.lock = threading.Lock()
+        # Start from the clock so versions from before a restart are always
+        # older than ours and those clients fall back to a full state.
+        self.version = int(time.time() * 1000)
+        self.lots = []
+        self.occupancy = []   # per lot, occupied flags in space order
+        self.space_ids = []   # per lot, space ids in the same order
+        self.history = deque(maxlen=history)  # (previous version, version, [[lot, space id, occupied], ...])
+        self.encoded = None
+        self.geometry = None
+        self.state = None
+        self._deltas = {}
+        self._file_key = None
+        self._packs = {}
+        self._listeners = []
+        self.watching = False  # a watch_file() thread keeps us current
+
+    def subscribe(self, listener):
+        """Call listener(version, changes) after every update; changes is
+        [[lot, space id, occupied], ...], or None when geometry changed."""
+        self._listeners.append(listener)
+
+    def replace(self, lots, version=None, geometry_id=None):
+        """Swap in a full list of lots. Returns True if anything changed.
+
+        A writer-assigned `version` (from a lot pack) is used as is, so every
+        process serving the same pack agrees on version numbers. A known
+        `geometry_id` saves re-encoding the geometry to find out it is the same.
+        """
+        raw = _dumps(lots)
+        with self.lock:
+            if self.encoded is not None and raw == self.encoded.bodies["identity"]:
+                return False
+            previous = self.version
+            self.version = version if version is not None else self.version + 1
+            occupancy = [[bool(s["occupied"]) for s in lot["spaces"]] for lot in lots]
+            space_ids = [[s["id"] for s in lot["spaces"]] for lot in lots]
+
+            if geometry_id is not None and self.geometry is not None and geometry_id == self.geometry.etag:
+                geometry = self.geometry
+            else:
+                geometry = Encoded(_dumps([
+                    {"name": lot["name"], "coords": lot["coords"],
+                     "spaces": [{"id": s["id"], "coords": s["coords"]} for s in lot["spaces"]]}
+                    for lot in lots]), etag=geometry_id)
+            if self.geometry is None or geometry.etag != self.geometry.etag:
+                # Space indices mean something else now; old deltas are void
+                self.geometry = geometry
+                self.history.clear()
+                changes = None
+            else:
+                changes = [
+                    [i, space_ids[i][j], occ]
+                    for i, (new, old) in enumerate(zip(occupancy, self.occupancy))
+                    for j, occ in enumerate(new) if occ != old[j]
+                ]
+                self.history.append((previous, self.version, changes))
+
+            self.lots, self.occupancy, self.space_ids = lots, occupancy, space_ids
+            self.encoded = Encoded(raw, etag=f"v{self.version}-{geometry.etag}")
+            self.state = Encoded(_dumps({
+                "version": self.version, "full": True, "geometry": self.geometry.etag,
+                "lots": [{"name": lot["name"], "occupied": [int(o) for o in occ]}
+                         for lot, occ in zip(lots, occupancy)],
+            }), etag=f"s{self.version}")
+            self._deltas = {}
+            version = self.version
+        for listener in self._listeners:
+            listener(version, changes)
+        return True
+
+    def set_occupied(self, changes):
+        """Apply [(lot index, space id, occupied), ...]. Returns True if anything changed."""
+        with self.lock:
+            lots = [dict(lot, spaces=list(lot["spaces"])) for lot in self.lots]
+        changed = False
+        for lot_i, space_id, occupied in changes:
+            spaces = lots[lot_i]["spaces"]
+            for j, space in enumerate(spaces):
+                if space["id"] == space_id and space["occupied"] != occupied:
+                    spaces[j] = dict(space, occupied=bool(occupied))
+                    changed = True
+        return self.replace(lots) if changed else False
+
+    def delta(self, since):
+        """Encoded spaces that changed after version `since`, or the full
+        state if `since` is unknown or older than the history we keep."""
+        with self.lock:
+            cached = self._deltas.get(since)
+            if cached is not None:
+                return cached
+            # Versions from a pack are timestamps, not a count: the history
+            # covers everything since the version just before its oldest entry
+            base = self.history[0][0] if self.history else self.version
+            if not base <= since <= self.version:
+                return self.state
+            merged = {}
+            for _, version, changes in self.history:
+                if version > since:
+                    for lot_i, space_id, occ in changes:
+                        merged[lot_i, space_id] = occ
+            enc = Encoded(_dumps({
+                "version": self.version, "full": False,
+                "changes": [[lot_i, space_id, int(occ)] for (lot_i, space_id), occ in merged.items()],
+            }), etag=f"d{since}-{self.version}", compress=len(merged) > 64)
+            # every client at `since` asks the same question until the next update
+            self._deltas[since] = enc
+            return enc
+
+    def load_file(self, path):
+        """Reload from a lots.json or lots.bin pack if it changed on disk
+        since the last call. `path` may also be a list of candidates, of
+        which the first that exists is used."""
+        if not isinstance(path, str):
+            path = next((p for p in path if os.path.exists(p)), path[-1])
+        if path.endswith(".bin"):
+            pack = self._packs.setdefault(path, LotPack(path))
+            if not pack.refresh():
+                return False
+            return self.replace(pack.lots(), version=pack.version, geometry_id=pack.geometry_id)
+
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._file_key:
+            return False
+        with open(path, "r") as f:
+            lots = json.load(f)
+        self._file_key = key
+        return self.replace(lots)
+
+    def watch_file(self, path, interval=0.25):
+        """Poll path's mtime from a daemon thread so listeners hear about a
+        new lots file within `interval`, not on the next request."""
+        def run():
+            while True:
+                try:
+                    self.load_file(path)
+                except (IOError, ValueError) as e:
+                    print(f"Error reading {path}: {e}")
+                time.sleep(interval)
+        threading.Thread(target=run, name="watch-lots", daemon=True).start()
+        self.watching = True
@@ -1,9 +1,11 @@
+import argparse
 import json
+import os
 import numpy as np
 import time
-import random
 
 from generate_coordinates import *
+import lotpack
 
 A = np.array([38.030907, -78.511921])
 B = np.array([38.031354, -78.511280])
@@ -11,17 +13,28 @@ C = np.array([38.031283, -78.511202])
 D = np.array([38.030836, -78.511848])
 CARS_PER_ROW = 29
 
-while True:
+# lots.bin (see lotpack.py) is what api.py and map.py read first; lots.json
+# is still written alongside it for anything that reads the old format
+WRITE_JSON = True
+
+# Geometry never changes between cycles: generate it once
+spaces_coordinates, _ = generate_lot_spaces([A, B, C, D], [CARS_PER_ROW, CARS_PER_ROW])
+lot_index = {
+    "lots": [{
+        "name": "Stadium Parking Lot",
+        "coords": [A.tolist(), B.tolist(), C.tolist(), D.tolist()],
+        "count": len(spaces_coordinates),
+    }],
+    "ids": None,  # space ids are 0..count-1
+}
 
-    spaces_coordinates = generate_diagonal_parking_spaces(A, B, C, D, n_row=CARS_PER_ROW)
-    all_spaces_coordinates = spaces_coordinates[0] + spaces_coordinates[1]
+def write_json(occupied):
     spaces = []
-    for i, coords in enumerate(all_spaces_coordinates):
-        coords = [c.tolist() for c in coords]
+    for i, coords in enumerate(spaces_coordinates.tolist()):
         spaces.append({
             "id": i,
             "coords": coords,
-            "occupied": random.choice([True, False])
+            "occupied": bool(occupied[i])
         })
 
     lots = [
@@ -32,9 +45,41 @@ while True:
         }
     ]
 
-    with open("lots.json", "w", encoding="utf-8") as json_file:
-        # 3. Use json.dump() to write the dictionary to the file
-        # 'indent=4' makes the JSON output human-readable with 4-space indentation.
-        json.dump(lots, json_file, indent=4)
-    
-    time.sleep(5)
\ No newline at end of file
+    # Write to a temp file and rename it over lots.json, so readers only ever
+    # see a complete file. Compact separators keep it small to re-parse.
+    with open("lots.json.tmp", "w", encoding="utf-8") as json_file:
+        json.dump(lots, json_file, separators=(",", ":"))
+    os.replace("lots.json.tmp", "lots.json")
+
+ap = argparse.ArgumentParser(description="Rewrite the lot files with random occupancy every 5 s.")
+ap.add_argument("--once", action="store_true",
+                help="write the geometry once and keep the occupancy already there "
+                     "(when calibrated cameras fill it in)")
+args = ap.parse_args()
+
+if args.once:
+    # Occupancy comes from calibrated cameras (Image Recognition/homography.py);
+    # keep whatever they last wrote if the pack already has these spaces
+    occupied = np.zeros(len(spaces_coordinates), dtype=bool)
+    if os.path.exists("lots.bin"):
+        pack = lotpack.LotPack("lots.bin")
+        pack.refresh()
+        if len(pack.occupied) == len(occupied):
+            occupied = pack.occupied
+    lotpack.write("lots.bin", spaces_coordinates, occupied, lot_index)
+    if WRITE_JSON:
+        write_json(occupied)
+    print(f"Wrote lots.bin: {len(occupied)} spaces, {int(occupied.sum())} occupied")
+    raise SystemExit
+
+while True:
+
+    occupied = np.random.random(len(spaces_coordinates)) < 0.5
+
+    # Only the tiny state file is rewritten; the geometry .npy is reused
+    lotpack.write("lots.bin", spaces_coordinates, occupied, lot_index)
+
+    if WRITE_JSON:
+        write_json(occupied)
+
+    time.sleep(5)
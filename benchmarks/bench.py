@@ -0,0 +1,242 @@
+# bench.py
+# Benchmarks for detection post-processing, geometry, lots serialization,
+# map rendering, /data serving and script start-up, on synthetic data
+# (synthetic.py).
+#
+#   python benchmarks/bench.py                       # full run, results/<time>-<commit>.json
+#   python benchmarks/bench.py --quick --only api    # small sizes, one group
+#   python benchmarks/bench.py --compare benchmarks/results/baseline.json
+#
+# Every benchmark reports the median, min and p90 of its runs in ms. With
+# --compare, medians more than --threshold slower than the given results
+# are listed as regressions and the exit status is 1. Start-up times are
+# whole fresh interpreters (disk cache warm), as when cron runs a script.
+import os, sys, json, time, argparse, platform, importlib, subprocess, tempfile
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "backend"), os.path.join(ROOT, "Image Recognition")]
+
+import numpy as np
+
+from synthetic import StubDetector, lot_corners, make_frame, make_lots
+
+SIZES = (100, 1000, 10000, 100000)       # spaces per run
+QUICK_SIZES = (100, 1000)
+MAP_MAX = 10000                          # folium needs seconds per 10k polygons
+CARS = (10, 100)
+SPOTS = (10, 100, 500)
+GROUPS = ("detection", "geometry", "serialization", "map", "api", "startup")
+
+
+def measure(fn, min_runs=5, min_time=0.5, max_runs=2000, warmup=True):
+    """Time fn() until it ran min_runs times and for at least min_time seconds."""
+    if warmup:
+        fn()
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_runs or (time.perf_counter() - start < min_time and len(times) < max_runs):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    ms = np.array(times) * 1000
+    return {"runs": len(ms), "median_ms": round(float(np.median(ms)), 4),
+            "min_ms": round(float(ms.min()), 4), "p90_ms": round(float(np.percentile(ms, 90)), 4)}
+
+
+def load_check_spot(cfg, stub):
+    """Import Check_Spot against cfg (written to ./config.yaml) with `stub`
+    as its model, which it loads only on first use."""
+    import yaml
+    with open("config.yaml", "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f)
+    sys.modules.pop("Check_Spot", None)
+    cs = importlib.import_module("Check_Spot")
+    cs.detector = stub
+    return cs
+
+
+# -- groups ---------------------------------------------------------------
+
+def bench_detection(sizes):
+    for n_spots in SPOTS:
+        frame, cfg, _ = make_frame(0, n_spots)
+        cs = load_check_spot(cfg, StubDetector(np.zeros((0, 4))))
+        for n_cars in CARS:
+            frame, _, boxes = make_frame(n_cars, n_spots)
+            cs.detector = StubDetector(boxes)
+            if n_spots == SPOTS[0]:
+                yield f"check_spot.evaluate[cars={n_cars}]", measure(lambda: cs.evaluate(frame))
+            yield (f"check_spot.evaluate_spots[cars={n_cars},spots={n_spots}]",
+                   measure(lambda: cs.evaluate_spots(frame)))
+
+
+def bench_geometry(sizes):
+    from generate_coordinates import generate_diagonal_parking_spaces, generate_lot_spaces
+    for n in sizes:
+        corners = lot_corners(-(-n // 100))
+        yield f"geometry.diagonal[spaces={n}]", measure(
+            lambda: [generate_diagonal_parking_spaces(a, b, c, d, 50) for a, b, c, d in corners])
+        yield f"geometry.lot_spaces[spaces={n}]", measure(
+            lambda: generate_lot_spaces(corners, np.full((len(corners), 2), 50)))
+
+
+def bench_serialization(sizes):
+    import lotpack
+    for n in sizes:
+        lots = make_lots(n)
+        raw = json.dumps(lots, separators=(",", ":"))
+        r = measure(lambda: json.dumps(lots, separators=(",", ":")))
+        yield f"lots_json.dump[spaces={n}]", dict(r, bytes=len(raw))
+        yield f"lots_json.parse[spaces={n}]", measure(lambda: json.loads(raw))
+        # steady state: the geometry file exists after the warm-up, only lots.bin is rewritten
+        yield f"lotpack.write[spaces={n}]", measure(lambda: lotpack.write_lots("bench.bin", lots))
+        yield f"lotpack.read[spaces={n}]", measure(lambda: lotpack.LotPack("bench.bin").refresh())
+        pack = lotpack.LotPack("bench.bin")
+        pack.refresh()
+        yield f"lotpack.lots[spaces={n}]", measure(lambda: (setattr(pack, "_coords", None), pack.lots()))
+
+
+def bench_map(sizes):
+    import lotpack
+    import map as map_app
+    for n in [n for n in sizes if n <= MAP_MAX]:
+        lotpack.write_lots("lots.bin", make_lots(n))
+        map_app.store.load_file(map_app.LOTS_FILES)
+
+        def cold():
+            map_app._pages.clear()
+            return map_app.index()
+
+        page = cold()
+        yield f"map.index.cold[spaces={n}]", dict(measure(cold, min_runs=3, min_time=0, warmup=False),
+                                                  bytes=len(page))
+        yield f"map.index.cached[spaces={n}]", measure(map_app.index)
+
+
+def bench_api(sizes):
+    import lotpack
+    import api
+    client = api.app.test_client()
+    for n in sizes:
+        lots = make_lots(n)
+        lotpack.write_lots("lots.bin", lots)
+        first = client.get("/data")
+        etag = first.headers["ETag"]
+
+        def get(url, **headers):
+            return lambda: client.get(url, headers=headers).data
+
+        for name, fn in [("full", get("/data")),
+                         ("gzip", get("/data", **{"Accept-Encoding": "gzip"})),
+                         ("not_modified", get("/data", **{"If-None-Match": etag}))]:
+            r = measure(fn)
+            yield f"api.data.{name}[spaces={n}]", dict(r, req_per_s=round(1000 / r["median_ms"], 1))
+
+        # a client one update behind: ten spaces flipped since its version
+        since = api.store.version
+        for space in lots[0]["spaces"][:10]:
+            space["occupied"] = not space["occupied"]
+        lotpack.write_lots("lots.bin", lots)
+        body = client.get(f"/data?since={since}").data
+        assert json.loads(body)["full"] is False, "/data?since= fell back to the full state"
+        r = measure(get(f"/data?since={since}"))
+        yield f"api.data.since[spaces={n}]", dict(r, req_per_s=round(1000 / r["median_ms"], 1))
+
+
+def bench_startup(sizes):
+    import yaml, settings
+    _, cfg, _ = make_frame(0, 100)
+    with open("config.yaml", "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path[:2]))
+
+    def python(code, fresh_config=False):
+        def run():
+            if fresh_config and os.path.exists(settings.cache_path("config.yaml")):
+                os.remove(settings.cache_path("config.yaml"))
+            subprocess.run([sys.executable, "-c", code], env=env, check=True)
+        return run
+
+    yield "startup.python", measure(python("pass"), min_time=0)
+    yield "startup.settings[config=parsed]", measure(python("import settings; settings.load()", True), min_time=0)
+    yield "startup.settings[config=cached]", measure(python("import settings; settings.load()"), min_time=0)
+    yield "startup.check_spot[config=parsed]", measure(python("import Check_Spot", True), min_time=0)
+    yield "startup.check_spot[config=cached]", measure(python("import Check_Spot"), min_time=0)
+    yield "startup.spot_daemon", measure(python("import Spot_Daemon"), min_time=0)
+
+
+# -- results --------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """Print old vs new medians; return the names that got slower than threshold allows."""
+    slower = []
+    print(f"\n{'benchmark':58} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, r in new["results"].items():
+        o = old["results"].get(name)
+        if o is None:
+            continue
+        ratio = r["median_ms"] / o["median_ms"] if o["median_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            slower.append(name)
+        print(f"{name:58} {o['median_ms']:10.3f} {r['median_ms']:10.3f} {ratio:7.2f}{flag}")
+    return slower
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the benchmarks on synthetic data.")
+    ap.add_argument("--quick", action="store_true", help=f"only {QUICK_SIZES} spaces")
+    ap.add_argument("--only", nargs="+", choices=GROUPS, help="groups to run (default all)")
+    ap.add_argument("--out", help="results file (default benchmarks/results/<time>-<commit>.json)")
+    ap.add_argument("--compare", help="earlier results file to compare against")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    args = ap.parse_args()
+
+    sizes = QUICK_SIZES if args.quick else SIZES
+    commit = git_commit()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"{stamp}-{commit or 'nogit'}.json")
+    doc = {"meta": {"time": stamp, "commit": commit, "python": platform.python_version(),
+                    "numpy": np.__version__, "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "sizes": list(sizes)},
+           "results": {}}
+
+    # api.py, map.py and Check_Spot.py read and write relative to the cwd
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="parking-bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            for group in args.only or GROUPS:
+                for name, r in globals()[f"bench_{group}"](sizes):
+                    doc["results"][name] = r
+                    extra = f"  {r['req_per_s']:.0f} req/s" if "req_per_s" in r else ""
+                    print(f"{name:58} {r['median_ms']:10.3f} ms (p90 {r['p90_ms']:.3f}, n={r['runs']}){extra}",
+                          flush=True)
+        finally:
+            os.chdir(cwd)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    print(f"\nSaved {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            slower = compare(json.load(f), doc, args.threshold)
+        if slower:
+            print(f"\n{len(slower)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
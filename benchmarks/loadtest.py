@@ -0,0 +1,143 @@
+# loadtest.py
+# Many concurrent pollers against a running api.py (serve.py or the dev
+# server): each client holds one keep-alive connection and requests a URL
+# in a loop, optionally sending the ETag it last saw, as the map page does.
+#
+#   python benchmarks/loadtest.py --clients 1000 --duration 30
+#   python benchmarks/loadtest.py --url http://127.0.0.1:5000/data --etag
+#
+# Prints requests/sec, latency percentiles and status counts. Clients are
+# split over --processes event loops so the client is not the bottleneck.
+import os, sys, json, time, asyncio, argparse
+import multiprocessing as mp
+from collections import Counter
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+async def read_response(reader):
+    """(status, headers, body) of one HTTP/1.1 response."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {k.strip().lower(): v.strip() for k, _, v in
+               (line.partition(":") for line in lines[1:] if line)}
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+async def client(url, etag, deadline, latencies, statuses, think):
+    parts = urlsplit(url)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    host, port = parts.hostname, parts.port or 80
+    reader = writer = None
+    seen = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            extra = f"If-None-Match: {seen}\r\n" if etag and seen else ""
+            t = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                         f"Accept-Encoding: gzip\r\n{extra}\r\n".encode())
+            status, headers, _ = await read_response(reader)
+            latencies.append(time.perf_counter() - t)
+            statuses[status] += 1
+            seen = headers.get("etag", seen)
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            statuses[type(e).__name__] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.1)
+        if think:
+            await asyncio.sleep(think)
+    if writer is not None:
+        writer.close()
+
+
+async def run_clients(url, n, duration, etag, think):
+    latencies, statuses = [], Counter()
+    deadline = time.monotonic() + duration
+    tasks = []
+    for i in range(n):
+        tasks.append(asyncio.create_task(client(url, etag, deadline, latencies, statuses, think)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.01)  # don't overflow the listen backlog at once
+    await asyncio.gather(*tasks)
+    return latencies, dict(statuses)
+
+
+def worker(job):
+    url, n, duration, etag, think = job
+    return asyncio.run(run_clients(url, n, duration, etag, think))
+
+
+def raise_fd_limit(n):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = min(hard, max(soft, n + 256))
+    if want > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load-test a running api.py with keep-alive pollers.")
+    ap.add_argument("--url", default="http://127.0.0.1:5000/data")
+    ap.add_argument("--clients", type=int, default=1000)
+    ap.add_argument("--duration", type=float, default=20, help="seconds")
+    ap.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1))
+    ap.add_argument("--etag", action="store_true", help="send If-None-Match like a polling browser")
+    ap.add_argument("--think", type=float, default=0, help="seconds each client waits between requests")
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    procs = max(1, min(args.processes, args.clients))
+    raise_fd_limit(args.clients // procs + 1)
+    jobs = [(args.url, args.clients // procs + (i < args.clients % procs), args.duration, args.etag, args.think)
+            for i in range(procs)]
+    print(f"{args.clients} clients over {procs} process(es) for {args.duration:.0f}s -> {args.url}", flush=True)
+    started = time.monotonic()
+    with mp.Pool(procs) as pool:
+        parts = pool.map(worker, jobs)
+    elapsed = time.monotonic() - started
+
+    ms = np.array([t for lat, _ in parts for t in lat]) * 1000
+    statuses = Counter()
+    for _, s in parts:
+        statuses.update(s)
+    if not len(ms):
+        sys.exit(f"no responses: {dict(statuses)}")
+    result = {"clients": args.clients, "duration_s": round(elapsed, 1), "requests": len(ms),
+              "req_per_s": round(len(ms) / elapsed, 1),
+              "p50_ms": round(float(np.percentile(ms, 50)), 2),
+              "p90_ms": round(float(np.percentile(ms, 90)), 2),
+              "p99_ms": round(float(np.percentile(ms, 99)), 2),
+              "max_ms": round(float(ms.max()), 2),
+              "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)}}
+    print(f"{result['req_per_s']:.0f} req/s  p50 {result['p50_ms']:.1f} ms  p90 {result['p90_ms']:.1f} ms  "
+          f"p99 {result['p99_ms']:.1f} ms  max {result['max_ms']:.1f} ms")
+    print("statuses:", result["statuses"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
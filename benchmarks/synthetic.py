@@ -0,0 +1,106 @@
+# synthetic.py
+# Generated inputs for the benchmarks: camera frames with N cars over M
+# spots, and lots of any size built from generate_diagonal_parking_spaces.
+# Everything is seeded, so two runs time exactly the same work.
+import numpy as np
+import cv2
+
+from generate_coordinates import generate_diagonal_parking_spaces
+
+# Stadium lot corners from write_lot_to_json.py; copies are shifted east
+A = np.array([38.030907, -78.511921])
+B = np.array([38.031354, -78.511280])
+C = np.array([38.031283, -78.511202])
+D = np.array([38.030836, -78.511848])
+LOT_STEP = np.array([0.0, 0.0008])
+
+
+class StubDetector:
+    """Detector interface (see detector.py) that returns fixed boxes, so
+    timings cover everything around the model but not the model."""
+
+    def __init__(self, xyxy, conf=None, imgsz=640):
+        self.xyxy = np.asarray(xyxy, np.float32).reshape(-1, 4)
+        self.conf = np.full(len(self.xyxy), 0.8, np.float32) if conf is None else np.asarray(conf, np.float32)
+        self.imgsz = imgsz
+
+    def predict(self, images, imgsz=None):
+        return [(self.xyxy.copy(), self.conf.copy()) for _ in images]
+
+
+def spot_grid(n_spots, size=(1080, 1920), margin=40):
+    """n_spots stall boxes [x, y, w, h] in rows across the frame."""
+    h, w = size
+    cols = int(np.ceil(np.sqrt(n_spots * w / h)))
+    rows = int(np.ceil(n_spots / cols))
+    sw, sh = (w - 2 * margin) / cols, (h - 2 * margin) / rows
+    out = []
+    for i in range(n_spots):
+        r, c = divmod(i, cols)
+        out.append([margin + c * sw + 2, margin + r * sh + 2, sw - 4, sh - 4])
+    return np.array(out)
+
+
+def make_frame(n_cars, n_spots, size=(1080, 1920), seed=0):
+    """(frame, config, boxes): a BGR frame with n_cars drawn on it, a
+    config.yaml dict with n_spots spots, and the cars as (n_cars, 4) xyxy.
+
+    About half of the cars are parked in a spot, the rest anywhere.
+    """
+    rng = np.random.default_rng(seed)
+    h, w = size
+    spots = spot_grid(n_spots, size)
+    boxes = []
+    for i in range(n_cars):
+        if i % 2 == 0 and n_spots:
+            x, y, sw, sh = spots[rng.integers(n_spots)]
+            jitter = rng.uniform(-0.1, 0.1, 2) * (sw, sh)
+            boxes.append([x + jitter[0], y + jitter[1], x + sw + jitter[0], y + sh + jitter[1]])
+        else:
+            cw, ch = rng.uniform(60, 200), rng.uniform(40, 120)
+            x, y = rng.uniform(0, w - cw), rng.uniform(0, h - ch)
+            boxes.append([x, y, x + cw, y + ch])
+    boxes = np.clip(np.array(boxes).reshape(-1, 4), 0, [w - 1, h - 1, w - 1, h - 1])
+
+    frame = np.full((h, w, 3), 90, np.uint8)
+    frame += rng.integers(0, 20, frame.shape, dtype=np.uint8)
+    for x1, y1, x2, y2 in boxes.astype(int):
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, -1)
+
+    x, y, sw, sh = spots[0] if n_spots else (0, 0, 100, 100)
+    cfg = {
+        "camera": {"snapshot_file": None},
+        "model": {"imgsz": 640},  # never loaded: StubDetector stands in
+        "spot": {"box": {"x": float(x), "y": float(y), "w": float(sw), "h": float(sh)},
+                 "overlap_threshold": 0.12},
+        "spots": [{"id": i, "box": {"x": float(x), "y": float(y), "w": float(sw), "h": float(sh)}}
+                  for i, (x, y, sw, sh) in enumerate(spots)],
+        "output": {"dir": "spot_out", "draw_overlay": False},
+    }
+    return frame, cfg, boxes
+
+
+def lot_corners(n_lots):
+    """(n_lots, 4, 2) corners: the stadium lot repeated to the east."""
+    shift = np.arange(n_lots)[:, None, None] * LOT_STEP
+    return np.stack([A, B, C, D])[None] + shift
+
+
+def make_lots(n_spaces, per_lot=100, seed=0):
+    """JSON-style lots (as in lots.json) with n_spaces in total, every lot
+    two rows of per_lot / 2 stalls, about half occupied."""
+    rng = np.random.default_rng(seed)
+    n_row = per_lot // 2
+    lots = []
+    for i, (a, b, c, d) in enumerate(lot_corners(-(-n_spaces // per_lot))):
+        row1, row2 = generate_diagonal_parking_spaces(a, b, c, d, n_row)
+        coords = [s.tolist() for s in row1 + row2][:n_spaces - i * per_lot]
+        occupied = rng.random(len(coords)) < 0.5
+        lots.append({
+            "name": f"Lot {i}",
+            "spaces": [{"id": j, "coords": xy, "occupied": bool(o)}
+                       for j, (xy, o) in enumerate(zip(coords, occupied))],
+            "coords": [a.tolist(), b.tolist(), c.tolist(), d.tolist()],
+        })
+    return lots
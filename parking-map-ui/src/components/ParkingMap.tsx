@@ -6,6 +6,7 @@ import L from 'leaflet';
 
 // --- Configuration ---
 const FLASK_API_URL = "http://127.0.0.1:5000";
+const PUSH_URL = "http://127.0.0.1:5001"; // Server-Sent Events from backend/push.py
 const MAP_CENTER: L.LatLngExpression = [38.0336, -78.5080];
 const INITIAL_ZOOM = 17;
 const ZOOM_THRESHOLD = 18;
@@ -83,22 +84,76 @@ const DetailedView = ({ lots }: { lots: any[] }) => {
 
 // --- The Main Map Component ---
 export default function ParkingMap() {
-  const [lots, setLots] = useState([]);
+  const [lots, setLots] = useState<any[]>([]);
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await fetch(`${FLASK_API_URL}/data`);
-        const data = await response.json();
-        setLots(data);
-      } catch (error) {
-        console.error("Error fetching parking data:", error);
+    // Geometry is fetched once (and again only if the server says it changed);
+    // each update then only carries the spaces that flipped since `version`.
+    let version = -1;
+    let geometryId: string | null = null;
+    let geometry: any[] = [];
+    let occupied: number[][] = [];
+    let indexById: Map<number, number>[] = [];
+
+    const render = () => setLots(geometry.map((lot, i) => ({
+      ...lot,
+      spaces: lot.spaces.map((space: any, j: number) => ({ ...space, occupied: !!occupied[i][j] })),
+    })));
+
+    const apply = async (state: any) => {
+      if (state.full) {
+        if (state.geometry !== geometryId) {
+          const g = await fetch(`${FLASK_API_URL}/geometry?v=${state.geometry}`);
+          geometry = await g.json();
+          geometryId = state.geometry;
+          indexById = geometry.map(lot => new Map(lot.spaces.map((s: any, j: number) => [s.id, j])));
+        }
+        occupied = state.lots.map((lot: any) => lot.occupied);
+        render();
+      } else if (state.changes.length > 0) {
+        for (const [lot, id, occ] of state.changes) {
+          occupied[lot][indexById[lot].get(id)!] = occ;
+        }
+        render();
+      }
+      version = state.version;
+    };
+
+    // Updates are applied strictly in order, since a full state may first
+    // have to fetch geometry.
+    let pending = Promise.resolve();
+    const enqueue = (next: () => Promise<any>) => {
+      pending = pending.then(async () => apply(await next())).catch(
+        (error) => console.error("Error applying parking update:", error));
+    };
+
+    const fetchData = () => enqueue(
+      () => fetch(`${FLASK_API_URL}/data?since=${version}`).then((r) => r.json()));
+
+    // Poll while the push stream is down (the browser keeps retrying it
+    // in the background); the first message it delivers stops the polling.
+    let interval: ReturnType<typeof setInterval> | undefined;
+    const stopPolling = () => {
+      if (interval !== undefined) clearInterval(interval);
+      interval = undefined;
+    };
+
+    fetchData(); // show the lots now, whether or not the stream connects
+    const events = new EventSource(`${PUSH_URL}/events?since=${version}`);
+    events.onmessage = (e) => {
+      stopPolling();
+      enqueue(async () => JSON.parse(e.data));
+    };
+    events.onerror = () => {
+      if (interval === undefined) {
+        interval = setInterval(fetchData, 5000); // Poll every 5 seconds
       }
     };
 
-    fetchData(); // Initial fetch
-    const interval = setInterval(fetchData, 5000); // Poll every 5 seconds
-    return () => clearInterval(interval); // Cleanup on unmount
+    return () => { // Cleanup on unmount
+      events.close();
+      stopPolling();
+    };
   }, []);
 
   return (
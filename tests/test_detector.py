@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from detector import VEHICLES, letterbox, parity, postprocess
+from occupancy import nms
+
+NC = 80  # COCO classes in a YOLOv8 head
+CAR, TRUCK, PERSON = 2, 7, 0
+
+
+def test_letterbox_pads_and_scales():
+    img = np.zeros((100, 200, 3), np.uint8)
+    img[..., 0] = 255  # blue in BGR
+    x, meta = letterbox([img], 64)
+    assert x.shape == (1, 3, 64, 64) and x.dtype == np.float32
+    r, left, top = meta[0]
+    assert r == pytest.approx(0.32) and (left, top) == (0, 16)
+    # content in the middle band, as RGB: blue lands in the last channel
+    assert x[0, 2, 16:48].min() == 1.0 and x[0, 0, 16:48].max() == 0.0
+    # grey padding above and below
+    assert np.allclose(x[0, :, :16], 114 / 255) and np.allclose(x[0, :, 48:], 114 / 255)
+
+
+def raw_output(anchors, meta):
+    """(1, 4 + NC, anchors) YOLOv8 output for [(x1, y1, x2, y2, class, score)]
+    given in original image pixels."""
+    r, left, top = meta
+    out = np.zeros((4 + NC, len(anchors)), np.float32)
+    for k, (x1, y1, x2, y2, cls, score) in enumerate(anchors):
+        x1, x2 = x1 * r + left, x2 * r + left
+        y1, y2 = y1 * r + top, y2 * r + top
+        out[:4, k] = [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+        out[4 + cls, k] = score
+    return out[None]
+
+
+def test_postprocess_maps_known_boxes_back():
+    img = np.zeros((100, 200, 3), np.uint8)
+    _, meta = letterbox([img], 64)
+    out = raw_output([
+        (20, 10, 120, 60, CAR, 0.9),
+        (22, 12, 118, 58, CAR, 0.6),     # same car, weaker: suppressed
+        (20, 10, 120, 60, TRUCK, 0.5),   # other class: NMS is per class
+        (150, 20, 190, 90, PERSON, 0.95),  # not a vehicle
+        (150, 20, 190, 90, CAR, 0.2),    # below conf
+        (-30, 50, 40, 140, CAR, 0.8),    # clipped to the image
+    ], meta[0])
+    (xyxy, conf), = postprocess(out, meta, [img.shape], conf=0.35, classes=VEHICLES)
+    order = np.argsort(-conf)
+    xyxy, conf = xyxy[order], conf[order]
+    assert conf == pytest.approx([0.9, 0.8, 0.5])
+    assert xyxy[0] == pytest.approx([20, 10, 120, 60], abs=1e-3)
+    assert xyxy[1] == pytest.approx([0, 50, 40, 100], abs=1e-3)
+    assert xyxy[2] == pytest.approx([20, 10, 120, 60], abs=1e-3)
+
+
+def test_postprocess_nothing_found():
+    img = np.zeros((64, 64, 3), np.uint8)
+    _, meta = letterbox([img], 64)
+    (xyxy, conf), = postprocess(np.zeros((1, 4 + NC, 10), np.float32), meta, [img.shape], 0.35, VEHICLES)
+    assert xyxy.shape == (0, 4) and conf.shape == (0,)
+
+
+def test_nms():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30], [2, 2, 5, 5]], float)
+    scores = np.array([0.9, 0.8, 0.7, 0.6])
+    assert list(nms(boxes, scores, iou=0.5)) == [0, 2, 3]
+    # the small box lies wholly inside the first one
+    assert list(nms(boxes, scores, iou=0.5, contained=0.8)) == [0, 2]
+    assert list(nms(np.zeros((0, 4)), np.zeros(0))) == []
+
+
+@pytest.mark.parametrize("backend,runtime", [("onnx", "onnxruntime"), ("openvino", "openvino")])
+def test_backend_matches_torch(backend, runtime, tmp_path, monkeypatch):
+    pytest.importorskip("ultralytics")
+    pytest.importorskip(runtime)
+    import cv2
+    from ultralytics.utils import ASSETS
+    monkeypatch.chdir(tmp_path)  # weights download and exports land here
+    images = [cv2.imread(str(ASSETS / name)) for name in ("bus.jpg", "zidane.jpg")]
+    cfg = {"model": {"weights": "yolov8n.pt", "cache_dir": str(tmp_path / "cache")}}
+    assert parity(images, cfg, backend, runs=1)
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+
+from forecast import REFITS, Forecaster
+from history import History
+
+
+def populated(root, days=3):
+    """A History with `days` of one lot flipping a space every ten minutes."""
+    now = time.time()
+    h = History(str(root), save_every=1e9)
+    t = now - days * 86400
+    h.sync([("A", list(range(10)), [False] * 10)], ts=t)
+    rng = np.random.default_rng(0)
+    while t < now - 600:
+        t += 600
+        h.changes([(0, int(rng.integers(10)), bool(rng.integers(2)))], ["A"], ts=t)
+    return h, now
+
+
+def test_refit_builds_a_table(tmp_path):
+    h, now = populated(tmp_path)
+    f = Forecaster(h)
+    assert f.refit(now)
+    assert list(f.table["rows"]) == ["A"]
+    assert f.fitted["A"] > 0
+    result = f.forecast("A", at=now + 3600, now=now)
+    assert 0 <= result["percent_open"] <= 100
+
+
+def test_refit_is_incremental(tmp_path):
+    h, now = populated(tmp_path)
+    f = Forecaster(h)
+    f.refit(now - 86400)
+    first = f.fitted["A"]
+    f.refit(now)
+    assert f.fitted["A"] > first
+
+
+def test_refit_without_history(tmp_path):
+    assert not Forecaster(History(str(tmp_path))).refit()
+
+
+def test_failed_refit_is_reported(tmp_path, monkeypatch):
+    h, now = populated(tmp_path)
+    f = Forecaster(h)
+    failed = REFITS.labels("failed").get()
+
+    def broken(now=None):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(f, "refit", broken)
+    f._background_refit()
+    assert REFITS.labels("failed").get() == failed + 1
+    assert f.error == "RuntimeError: boom"
+    # a read-only copy (serve.py worker) sees it too
+    reader = Forecaster(h)
+    reader.reload()
+    assert reader.error == "RuntimeError: boom"
+
+    monkeypatch.undo()
+    f._background_refit()
+    assert f.error is None
+    reader.reload()
+    assert reader.error is None
@@ -0,0 +1,24 @@
+import pytest
+
+import metrics
+
+
+@pytest.mark.parametrize("rate", ["nan", "inf", "-inf", "x"])
+def test_set_sampling_rejects_non_finite(rate):
+    metrics.set_sampling(0.25)
+    with pytest.raises(ValueError):
+        metrics.set_sampling(rate)
+    assert metrics.trace_summary()["rate"] == 0.25
+    metrics.set_sampling(0)
+
+
+@pytest.mark.parametrize("rate,expected", [("-1", 0.0), ("0.5", 0.5), ("3", 1.0)])
+def test_set_sampling_clamps(rate, expected):
+    metrics.set_sampling(rate)
+    assert metrics.trace_summary()["rate"] == expected
+    metrics.set_sampling(0)
+
+
+def test_trace_request_reports_bad_rate():
+    with pytest.raises(ValueError):
+        metrics.trace_request({"rate": "nan"})